@@ -62,7 +62,9 @@ version_string = "imgcache-parse-mod.py v2016-08-03"
 
 # Find all indices of a substring in a given string (Python recipe) 
 # From http://code.activestate.com/recipes/499314-find-all-indices-of-a-substring-in-a-given-string/
-def all_indices(bigstring, substring, listindex=[], offset=0):
+def all_indices(bigstring, substring, listindex=None, offset=0):
+    if (listindex == None):
+        listindex = [] # a new list for each call (a default list would be shared between calls)
     i = bigstring.find(substring, offset)
     while i >= 0:
         listindex.append(i)
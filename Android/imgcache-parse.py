@@ -51,6 +51,7 @@ python imgcache-parse.py -f imgcache.0 -o output.html -v
 Versions:
 2016-07-22 = Initial version
 2016-08-02 = Added video thumbnail parsing functionality and parsing flags -p and -v
+2026-10-17 = Input file can be the first segment of a split raw image (eg imgcache.001) which reads all segments as one file (see "splitimage.py")
 
 """
 
@@ -60,12 +61,17 @@ import struct
 import datetime
 import hashlib
 from optparse import OptionParser
+# Split raw image helpers are shared with the other scripts (see utilities/splitimage.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "utilities"))
+from splitimage import open_image, image_stat
 
-version_string = "imgcache-parse.py v2016-08-02"
+version_string = "imgcache-parse.py v2026-10-17"
 
 # Find all indices of a substring in a given string (Python recipe) 
 # From http://code.activestate.com/recipes/499314-find-all-indices-of-a-substring-in-a-given-string/
-def all_indices(bigstring, substring, listindex=[], offset=0):
+def all_indices(bigstring, substring, listindex=None, offset=0):
+    if (listindex == None):
+        listindex = [] # a new list for each call (a default list would be shared between calls)
     i = bigstring.find(substring, offset)
     while i >= 0:
         listindex.append(i)
@@ -81,7 +87,7 @@ usage = " %prog -f inputfile -o outputfile"
 parser = OptionParser(usage=usage)
 parser.add_option("-f", dest="filename", 
                   action="store", type="string",
-                  help="imgcache file to be searched")
+                  help="imgcache file to be searched (or first segment of a split raw image eg imgcache.001)")
 parser.add_option("-o", dest="htmlfile",
                   action="store", type="string",
                   help="HTML table File")
@@ -112,12 +118,12 @@ if (options.parsepicsonly) and (options.parsevidsonly):
     
 # Open imgcache file for binary read
 try:
-	fb = open(options.filename, "rb")
+	fb = open_image(options.filename)
 except:
     print("Error - Input file failed to open!")
     exit(-1)
 
-filesize = os.stat(options.filename).st_size # get imgcache filesize  
+filesize = image_stat(fb).st_size # get imgcache filesize (incl. all segments of a split raw image)
 
 # Read file into one BINARY string (shouldn't be too large)
 filestring = fb.read()
@@ -46,6 +46,18 @@
 #            (makes it quicker when running against whole .bin files). Thanks to Boss Rob :)
 # v2015-08-19 Fixed bug in chunking code where it was not processing the last chunk properly
 # v2015-08-26 Adjusted STOP FILETIME offset for Lumia 530 WinPhone 8.10 + prints Flag value regardless of valid START FILETIME + sorted output by STOP FILETIME
+# v2026-10-17 Added -m option to search a memory mapped view of the input file (no chunk copies/DELTA overlaps)
+#             Added -p option to search the input file with a pool of worker processes
+#             Hits are now streamed from generator versions of the search functions (see "isliceNsearchRE")
+#             Added -c option to store/re-use search hits in a hit index file (with -i to re-create it and -v to verify it)
+#             find_timestamp now reads its search window once and only checks likely FILETIME offsets (see "FILETIME_MSB_RE")
+#             rev_extract_unistring/rev_extract_ascii_string now read blocks backwards instead of one character at a time
+#             Input file can be the first segment of a split raw image (eg image.001) which reads all segments as one file (see "splitimage.py")
+#             Timestamps are formatted through a least recently used cache of ISO date strings (see "utc_isoformat" in "wp8common.py")
+#             Added -u option to drop duplicate call records (same flag, times, ID, phone numbers and names) as they are parsed.
+#             The offsets of the duplicates are listed in a Duplicate_Offsets column of the first copy (see "RecordDeduper")
+#             and -e sets how many distinct records are remembered exactly (beyond that a Bloom filter is used)
+#             until it fills up, after which records are passed through and counted in the summary and Duplicate_Offsets header
 #
 
 import codecs
@@ -57,10 +69,22 @@ from optparse import OptionParser
 import re
 import os
 import math
-
-version_string = "wp8-1-callhistory.py v2015-08-26"
+import mmap
+import multiprocessing
+# Split raw image helpers are shared with the other scripts (see utilities/splitimage.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "utilities"))
+from splitimage import open_image, image_stat
+# Helpers shared by the WP8 scripts in this directory (see wp8common.py)
+from wp8common import utc_isoformat, image_identity, hitindex_path, load_hitindex, save_hitindex, recordhits, RecordDeduper
+
+version_string = "wp8-1-callhistory.py v2026-10-17"
 CHUNK_SIZE = 2000000000 # max value of CHUNK_SIZE + DELTA is 2147483647 (C long limit with Python 2)
 DELTA = 1000 # read this extra bit to catch any hits crossing chunk boundaries. Should be AT LEAST max size of record being searched for.
+PARALLEL_RANGE_SIZE = 67108864 # max size of each range searched by a "parallelsearchRE" worker process (64 MB)
+# The 2 most significant bytes of a FILETIME in the "read_filetime" sanity range (0x01CD000000000000 to 0x01D9000000000000)
+FILETIME_MSB_RE = re.compile("[\xcd-\xd9]\x01")
+REV_STRING_WINDOW = 256 # initial number of bytes read backwards when looking for the start of a string (see "rev_extract_unistring")
+DEDUPE_BUDGET = 1000000 # default number of distinct records remembered exactly by "RecordDeduper" (-e)
 
 # Read in 8 byte MS FILETIME (number of 100 ns since 1 Jan 1601) and 
 # Returns equivalent unix epoch offset or 0 on error
@@ -90,22 +114,58 @@ def read_filetime(f):
 
 # Find all indices of the "pattern" regular expression in a given string (using regex)
 # Where pattern is a compiled Python re pattern object (ie the output of "re.compile")
-def regsearch(bigstring, pattern, listindex=[]):
+def regsearch(bigstring, pattern, listindex=None):
+    if (listindex == None):
+        listindex = [] # a new list for each call (a default list would be shared between calls)
     hitsit = pattern.finditer(bigstring)
     for it in hitsit:
         # iterators only last for one shot so we capture the offsets to a list
         listindex.append(it.start())
     return listindex
 
+# Generator version of "regsearch". Yields the offset of each "pattern" hit in a given string as it is found
+def iregsearch(bigstring, pattern):
+    for it in pattern.finditer(bigstring):
+        yield it.start()
+
 # Extract a Unicode null terminated string given file. 
 # Starts at the beginning of last (null) Unicode char and 
 # reads Unicode string in reverse. Returns read string or "Error!"
+# Reads blocks ending at the last char (starting with REV_STRING_WINDOW bytes and doubling) and finds the terminating
+# null/unprintable char from the end of the block instead of reading one char at a time.
+# Near the start/end of the file or at a UTF-16 surrogate, the string is read one char at a time (as before).
 def rev_extract_unistring(f):
     readchar = 0xABCD
     readcharlist = []
     flag = True
     charcount = 0
     begin = f.tell()
+    fd = f.stream # binary file underneath the codecs reader
+    fd.seek(begin)
+    lastchar = fd.read(2)
+    if (len(lastchar) == 2):
+        end = begin + 2
+        if (lastchar == "\x00\x00"):
+            end = begin # skip null at end of string
+        size = REV_STRING_WINDOW
+        while True:
+            start = max(end - size, end % 2)
+            fd.seek(start)
+            block = fd.read(end - start)
+            # index of the last Unicode char that isn't printable ASCII (ie the null/unprintable char before the string)
+            lastidx = max(len(block[0::2].rstrip(string.printable)), len(block[1::2].rstrip("\x00"))) - 1
+            if (lastidx >= 0):
+                if (block[2*lastidx + 1] < "\xd8") or (block[2*lastidx + 1] > "\xdf"): # not part of a surrogate pair
+                    f.seek(start + 2*lastidx + 2)
+                    readstring = block[2*lastidx + 2:]
+                    if (readstring == ""):
+                        return ""
+                    return readstring.decode("utf-16-le")
+                break
+            if (start < 2):
+                break # string goes back to the start of the file
+            size *= 2
+    f.seek(begin)
     while (flag):
         try:
             readchar = f.read(1)
@@ -134,12 +194,34 @@ def rev_extract_unistring(f):
 
 # Reads ASCII encoded string given file.
 # Returns read string or "Error!" (reads backwards from last char (null))
+# Reads blocks ending at the last char (starting with REV_STRING_WINDOW bytes and doubling) and finds the terminating
+# null/unprintable char from the end of the block instead of reading one char at a time.
+# Near the start/end of the file, the string is read one char at a time (as before).
 def rev_extract_ascii_string(f):
     readchar = 0xAB
     readcharlist = []
     flag = True
     charcount = 0
     begin = f.tell()
+    lastchar = f.read(1)
+    if (lastchar != ""):
+        end = begin + 1
+        if (lastchar == "\x00"):
+            end = begin # skip null at end of string
+        size = REV_STRING_WINDOW
+        while True:
+            start = max(end - size, 0)
+            f.seek(start)
+            block = f.read(end - start)
+            # index of the last char that isn't printable ASCII (ie the null/unprintable char before the string)
+            lastidx = len(block.rstrip(string.printable)) - 1
+            if (lastidx >= 0):
+                f.seek(start + lastidx + 1)
+                return block[lastidx + 1:]
+            if (start == 0):
+                break # string goes back to the start of the file
+            size *= 2
+    f.seek(begin)
     while (flag):
         try:
             readchar = f.read(1)
@@ -168,29 +250,44 @@ def rev_extract_ascii_string(f):
 
 # Searches backwards for a valid timestamp from a given file ptr and range
 # Returns 0 if error or not found otherwise returns unix timestamp value
+# Reads the whole window of candidate offsets once then only checks offsets whose 2 most significant bytes are in the
+# "read_filetime" sanity range (found with FILETIME_MSB_RE) instead of seeking/reading 8 bytes at every offset.
+# Offsets are checked in the same order as before (minoffset first) and the file ptr is left after the returned FILETIME.
 def find_timestamp(f, maxoffset, minoffset):
     begin = f.tell()
-    # maxoffset is inclusive => need range from minoffset : maxoffset+1
-    for i in range(minoffset, maxoffset+1, 1):
-        if ((begin - i) < 0):
-            return 0 # FILETIME can't be before start of file
-        else:
-            f.seek(begin-i)
-            value = read_filetime(f)
-            if (value != 0):
-                return value
-            #otherwise keep searching until maxoffset
+    if (maxoffset < minoffset):
+        return 0
+    highest = begin - minoffset # first offset checked
+    if (highest < 0):
+        return 0 # FILETIME can't be before start of file
+    lowest = max(0, begin - maxoffset) # last offset checked
+    f.seek(lowest)
+    window = f.read(highest + 8 - lowest)
+    fullend = lowest + len(window) - 8 # highest offset with 8 bytes before EOF
+    # Offsets too close to EOF for a FILETIME. Let "read_filetime" report them as before.
+    for offset in range(highest, max(fullend, lowest - 1), -1):
+        f.seek(offset)
+        read_filetime(f)
+    # Check the remaining candidates (highest offset first)
+    candidates = [m.start() - 6 for m in FILETIME_MSB_RE.finditer(window, 6)]
+    for idx in reversed(candidates):
+        if (idx + lowest > min(highest, fullend)):
+            continue
+        mstime = struct.unpack('<Q', window[idx:idx + 8])[0]
+        if (mstime >= 0x01CD000000000000) and (mstime <= 0x01D9000000000000):
+            f.seek(lowest + idx + 8)
+            return (mstime - 116444736000000000) // 10000000
     # if we get here, we haven't found a valid timestamp, so return 0
+    f.seek(lowest + min(8, len(window)))
     return 0
 
-# Searches chunks of a file (using RE) and returns file offsets of any hits.
-# Intended for searching of large files where we cant read the whole thing into memory
-# This function calls the "regsearch" search method
-def sliceNsearchRE(fd, chunksize, delta, term):
-    final_hitlist = [] # list of file offsets which contain the search term
+# Generator version of "sliceNsearchRE". Searches chunks of a file (using RE) and yields the file offset of each hit
+# (in offset order) as soon as its chunk has been searched. This lets the caller start parsing records straight away
+# and avoids building a list of every hit offset.
+# Note: Only seeks/reads "fd" before searching each chunk so the caller can use "fd" between hits.
+def isliceNsearchRE(fd, chunksize, delta, term):
     pattern = re.compile(term, re.DOTALL) # should only really call this once at start, if same substring.
-    stats = os.fstat(fd.fileno())
-    #print("sliceNsearchRE Input file " + filename + " is " + str(stats.st_size) + " bytes\n")
+    stats = image_stat(fd)
     begin_chunk = 0
 
     # Handle if filesize is less than CHUNK_SIZE (eg Phone file instead of image.bin)
@@ -198,38 +295,112 @@ def sliceNsearchRE(fd, chunksize, delta, term):
     if (chunksize >= stats.st_size):
         fd.seek(begin_chunk)
         raw = fd.read()
-        final_hitlist = regsearch(raw, pattern, [])
-        #print(str(len(final_hitlist)) + " hits found in 1 chunk for " + str(term))
+        for hit in iregsearch(raw, pattern):
+            yield hit
     else:
         # Filesize is greater than 1 chunk, need to loop thru
         numchunks = int(math.ceil(float(stats.st_size) / chunksize))
-        #print("numchunks required = " + str(numchunks))
         chunk_size_to_read = chunksize + delta
         for chunknum in range(numchunks):
             if ((chunk_size_to_read + begin_chunk) > stats.st_size):
                 chunk_size_to_read = stats.st_size - begin_chunk
-            #print("seeking " + str(begin_chunk) + " with size = " + str(chunk_size_to_read))
             fd.seek(begin_chunk)
             rawchunk = fd.read(chunk_size_to_read)
-            subhits = regsearch(rawchunk, pattern, [])
-            #print(str(len(subhits)) + " hits found at " + str(subhits))
-            # Items in subhits will be offsets relative to the start of the rawchunk (not relative to the file)
-            # Need to adjust offsets ...
-            for hit in subhits :
+            # Hits from "iregsearch" will be offsets relative to the start of the rawchunk (not relative to the file)
+            for hit in iregsearch(rawchunk, pattern):
                 if (hit < chunksize) :
-                    final_hitlist.append(begin_chunk + hit)
-                    #print("adding " + str(begin_chunk + hit) + " to list")
-                elif (hit >= chunksize) :
-                    #print("ignoring " + str(begin_chunk + hit) + " to list")
+                    yield begin_chunk + hit
+                else :
                     break # don't care if we get here because hit should be processed in next chunk
-                    # subhits can start at index 0 so possible hit offsets are 0 to chunksize-1 inclusive
             begin_chunk += chunksize
-    #print("final_hitlist = " + str(final_hitlist))
-    return(final_hitlist)
+
+# Searches chunks of a file (using RE) and returns file offsets of any hits.
+# Intended for searching of large files where we cant read the whole thing into memory
+# This function returns the "isliceNsearchRE" hits as a list
+def sliceNsearchRE(fd, chunksize, delta, term):
+    return(list(isliceNsearchRE(fd, chunksize, delta, term)))
+
+# Generator version of "mmapsearchRE". Searches a read-only memory map of the whole file (using RE) and yields 
+# the file offset of each hit as it is found. The regex runs directly over the mapped pages so there are no chunk copies
+# and no DELTA overlaps to manage. Falls back to "isliceNsearchRE" if the file cannot be mapped
+# (eg 32 bit Python with a large image).
+def immapsearchRE(fd, term):
+    stats = image_stat(fd)
+    if (stats.st_size == 0):
+        return # cannot mmap an empty file
+    try:
+        mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    except:
+        print("mmap of input file failed ... using chunked search instead")
+        exctype, value = sys.exc_info()[:2]
+        print("Exception type = ",exctype,", value = ",value)
+        for hit in isliceNsearchRE(fd, CHUNK_SIZE, DELTA, term):
+            yield hit
+        return
+    pattern = re.compile(term, re.DOTALL)
+    try:
+        for hit in iregsearch(mm, pattern):
+            yield hit
+    finally:
+        mm.close()
+
+# Searches a read-only memory map of the whole file (using RE) and returns file offsets of any hits.
+# Hit offsets are the same as "sliceNsearchRE". See "immapsearchRE".
+def mmapsearchRE(fd, term):
+    return(list(immapsearchRE(fd, term)))
+
+# Worker function for "parallelsearchRE". Searches one range of the file (plus delta bytes) and
+# returns the file offsets of hits which start inside the range. Each worker opens its own file handle.
+def searchrangeRE(args):
+    filename, begin_range, rangesize, delta, term = args
+    range_hitlist = []
+    pattern = re.compile(term, re.DOTALL)
+    fd = open_image(filename)
+    fd.seek(begin_range)
+    rawrange = fd.read(rangesize + delta) # read returns less at EOF
+    fd.close()
+    for hit in regsearch(rawrange, pattern, []):
+        if (hit < rangesize):
+            range_hitlist.append(begin_range + hit)
+        else:
+            break # hit will be processed with the next range
+    return(range_hitlist)
+
+# Generator version of "parallelsearchRE". Searches a file with a pool of worker processes (using RE) and yields
+# the file offsets of hits in offset order. Each range's hits are yielded as soon as that range (and all the ranges
+# before it) have been searched.
+# The file is split into ranges (aligned to 4096 bytes and at most PARALLEL_RANGE_SIZE) which are searched
+# concurrently. Like "sliceNsearchRE", each range reads an extra delta bytes to catch hits crossing range boundaries.
+# Hits match "sliceNsearchRE". Needs os.fork (ie not Windows) otherwise falls back to "isliceNsearchRE".
+def iparallelsearchRE(fd, numworkers, delta, term):
+    if (not hasattr(os, "fork")):
+        print("Parallel search is not supported on this platform ... using chunked search instead")
+        for hit in isliceNsearchRE(fd, CHUNK_SIZE, delta, term):
+            yield hit
+        return
+    stats = image_stat(fd)
+    if (stats.st_size == 0):
+        return
+    rangesize = int(math.ceil(float(stats.st_size) / numworkers))
+    rangesize = min(PARALLEL_RANGE_SIZE, ((rangesize + 4095) // 4096) * 4096)
+    tasks = [(fd.name, begin_range, rangesize, delta, term) for begin_range in range(0, stats.st_size, rangesize)]
+    pool = multiprocessing.Pool(numworkers)
+    try:
+        for range_hitlist in pool.imap(searchrangeRE, tasks, 1): # results are in range order
+            for hit in range_hitlist:
+                yield hit
+    finally:
+        pool.close()
+        pool.join()
+
+# Searches a file with a pool of worker processes (using RE) and returns file offsets of any hits.
+# Hits are returned in offset order and match "sliceNsearchRE". See "iparallelsearchRE".
+def parallelsearchRE(fd, numworkers, delta, term):
+    return(list(iparallelsearchRE(fd, numworkers, delta, term)))
 
 # Main
 print "Running " + version_string + "\n"
-usage = " %prog -f inputfile -o outputfile"
+usage = " %prog -f inputfile -o outputfile [-m] [-p workers] [-c indexdir [-i] [-v]] [-u [-e budget]]"
 
 # Handle command line args
 parser = OptionParser(usage=usage)
@@ -239,6 +410,27 @@ parser.add_option("-f", dest="filename",
 parser.add_option("-o", dest="tsvfile",
                   action="store", type="string",
                   help="Tab Separated Output Filename")
+parser.add_option("-m", dest="usemmap",
+                  action="store_true", default=False,
+                  help="(Optional) Search a memory mapped view of the input file instead of reading it in chunks")
+parser.add_option("-p", dest="workers",
+                  action="store", type="int", default=0,
+                  help="(Optional) Search the input file with this many worker processes (eg 8)")
+parser.add_option("-c", dest="cachedir",
+                  action="store", type="string",
+                  help="(Optional) Directory for storing/re-using a hit index file so repeat runs on the same input file skip the search")
+parser.add_option("-i", dest="rebuildindex",
+                  action="store_true", default=False,
+                  help="(Optional) Ignore any existing hit index file and re-create it (requires -c)")
+parser.add_option("-v", dest="verifyindex",
+                  action="store_true", default=False,
+                  help="(Optional) Search the input file anyway and check the results against the hit index file (requires -c)")
+parser.add_option("-u", dest="dedupe",
+                  action="store_true", default=False,
+                  help="(Optional) Drop duplicate call records and list their offsets in a Duplicate_Offsets column instead")
+parser.add_option("-e", dest="budget",
+                  action="store", type="int", default=DEDUPE_BUDGET,
+                  help="(Optional) Number of distinct records remembered exactly when dropping duplicates (requires -u). Default is 1000000.")
 (options, args) = parser.parse_args()
 
 # Check if no arguments given by user, exit
@@ -253,17 +445,29 @@ if (options.tsvfile == None) :
     parser.print_help()
     print "\nOutput filename incorrectly specified!"
     exit(-1)
+if (((options.rebuildindex) or (options.verifyindex)) and (options.cachedir == None)) :
+    parser.print_help()
+    print "\nThe -i and -v options require a hit index directory (-c)!"
+    exit(-1)
+if ((options.cachedir != None) and (not os.path.isdir(options.cachedir))) :
+    parser.print_help()
+    print "\nHit index directory incorrectly specified!"
+    exit(-1)
+if (options.budget < 1) :
+    parser.print_help()
+    print "\nDuplicate record budget must be at least 1!"
+    exit(-1)
 
 # Open "Phone" file for unicode encoded text reads
 try:
-	funi = codecs.open(options.filename, encoding="utf-16-le", mode="r")
+	funi = codecs.getreader("utf-16-le")(open_image(options.filename))
 except:
     print ("Input File Not Found (unicode attempt)")
     exit(-1)
 
 # Open "Phone" file for binary byte ops (eg timestamps)
 try:
-	fb = open(options.filename, "rb")
+	fb = open_image(options.filename)
 except:
     print ("Input File Not Found (binary attempt)")
     exit(-1)
@@ -272,13 +476,42 @@ except:
 # GUID is "{B1776703-738E-437D-B891-44555CEB6669}" in hex
 GUID = "\x7b\x00\x42\x00\x31\x00\x37\x00\x37\x00\x36\x00\x37\x00\x30\x00\x33\x00\x2d\x00\x37\x00\x33\x00\x38\x00\x45\x00\x2d\x00\x34\x00\x33\x00\x37\x00\x44\x00\x2d\x00\x42\x00\x38\x00\x39\x00\x31\x00\x2d\x00\x34\x00\x34\x00\x35\x00\x35\x00\x35\x00\x43\x00\x45\x00\x42\x00\x36\x00\x36\x00\x36\x00\x39\x00\x7d\x00"
 #print GUID
-hits = sliceNsearchRE(fb, CHUNK_SIZE, DELTA, GUID)
-#print "CallHistory hits = " + str(len(hits))
+# Re-use the hits from a previous run if there is a matching hit index file (-c)
+hitindex = None # list of (pattern_id, file offset) hits read from the hit index file
+scannedhits = None # list of hits found by searching the input file (when saving/verifying a hit index file)
+if (options.cachedir != None):
+    identity = image_identity(fb)
+    hitindexfile = hitindex_path(options.cachedir, options.filename, [GUID])
+    if (options.rebuildindex):
+        print "Re-creating hit index file " + hitindexfile
+    else:
+        hitindex = load_hitindex(hitindexfile, identity, [GUID])
+        if (hitindex == None):
+            print "No valid hit index file found ... searching input file"
+if ((hitindex != None) and (not options.verifyindex)):
+    print "Using " + str(len(hitindex)) + " hits from hit index file " + hitindexfile
+    hits = [offset for (pid, offset) in hitindex]
+else:
+    # Hits are streamed from the search (instead of collected into a list) so records are parsed as soon as they are found
+    if (options.workers > 1):
+        hits = iparallelsearchRE(fb, options.workers, DELTA, GUID)
+    elif (options.usemmap):
+        hits = immapsearchRE(fb, GUID)
+    else:
+        hits = isliceNsearchRE(fb, CHUNK_SIZE, DELTA, GUID)
+    if (options.cachedir != None):
+        scannedhits = []
+        hits = recordhits(hits, scannedhits)
+numhits = 0
 
 # Dict for storing results (keyed by offset)
 call_entries = {}
+deduper = None # duplicate record filter (-u)
+if (options.dedupe):
+    deduper = RecordDeduper(options.budget)
 
 for hit in hits:
+    numhits += 1
     #print "Hit at " + hex(hit).rstrip("L")
     # Should be Phone2
     funi.seek(hit - 0x3)
@@ -322,7 +555,7 @@ for hit in hits:
 
     if (stoptimeval!=0):
         try:
-            stoptimestring = datetime.datetime.utcfromtimestamp(stoptimeval).isoformat()
+            stoptimestring = utc_isoformat(stoptimeval)
             valid_stoptime = True
         except:
             stoptimestring = "Error"
@@ -334,7 +567,7 @@ for hit in hits:
         starttimeval = read_filetime(fb)
         if (starttimeval!=0):
             try:
-                starttimestring = datetime.datetime.utcfromtimestamp(starttimeval).isoformat()
+                starttimestring = utc_isoformat(starttimeval)
                 valid_startime = True
             except:
                 starttimestring = "Error"
@@ -354,12 +587,34 @@ for hit in hits:
     #print "Stop = " + stoptimestring
     #print "Flag = " + str(flagvalue)
 
-    # Store parsed data in dictionary keyed by hit offset
-    call_entries[hit] = (str(flagvalue), starttimestring, stoptimestring, idstring, Phone1, Name1, Name2, Phone2)
+    # Store parsed data in dictionary keyed by hit offset (unless it duplicates an earlier record)
+    call_entry = (str(flagvalue), starttimestring, stoptimestring, idstring, Phone1, Name1, Name2, Phone2)
+    if ( (deduper != None) and deduper.check(call_entry, hit, hit) ):
+        continue
+    call_entries[hit] = call_entry
 
 #ends for hits loop
 
-print "Processed " + str(len(hits)) + " Call History entries\n"
+# Save (or verify) the hit index file (-c)
+if (scannedhits != None):
+    scannedhits = [(0, offset) for offset in scannedhits]
+    if (hitindex != None):
+        if (scannedhits == hitindex):
+            print "Hit index file verified OK (" + str(len(hitindex)) + " hits)"
+        else:
+            print "Hit index file MISMATCH (" + str(len(hitindex)) + " cached hits, " + str(len(scannedhits)) + " hits found) ... re-creating " + hitindexfile
+            save_hitindex(hitindexfile, identity, [GUID], scannedhits, version_string)
+    elif (save_hitindex(hitindexfile, identity, [GUID], scannedhits, version_string)):
+        print "Saved " + str(len(scannedhits)) + " hits to hit index file " + hitindexfile
+
+print "Processed " + str(numhits) + " Call History entries\n"
+if (deduper != None):
+    print "Dropped " + str(deduper.listed + deduper.unlisted) + " duplicate call records (" + str(deduper.listed) + " listed in Duplicate_Offsets)"
+    if (deduper.unlisted > 0):
+        print "WARNING: " + str(deduper.unlisted) + " of the dropped duplicates were found beyond the exact budget (-e) so their offsets are NOT listed in Duplicate_Offsets"
+    if (deduper.unchecked > 0):
+        print "WARNING: The duplicate filter filled up so " + str(deduper.unchecked) + " call records were passed through without being deduplicated (use a bigger -e budget)"
+    print ""
 
 # sort by starttimestring
 #sorted_calls_keys = sorted(call_entries, key = lambda x : (call_entries[x][1], call_entries[x][1])) 
@@ -374,11 +629,17 @@ if (options.tsvfile != None):
     except:
         print ("Trouble Opening TSV Output File")
         exit(-1)
-    tsvof.write("GUID_Offset\tFlag\tStart_Time\tStop_Time\tID\tPhone_1\tName_1\tName_2\tPhone_2\n")
+    if (deduper != None):
+        tsvof.write("GUID_Offset\tFlag\tStart_Time\tStop_Time\tID\tPhone_1\tName_1\tName_2\tPhone_2\t" + deduper.header() + "\n")
+    else:
+        tsvof.write("GUID_Offset\tFlag\tStart_Time\tStop_Time\tID\tPhone_1\tName_1\tName_2\tPhone_2\n")
     for key in sorted_calls_keys:
         tsvof.write(hex(key).rstrip("L") + "\t" + call_entries[key][0] + "\t" + call_entries[key][1] + "\t" + call_entries[key][2] + \
         "\t" + call_entries[key][3]+ "\t" + call_entries[key][4] + "\t" + call_entries[key][5] + "\t" + call_entries[key][6] + \
-        "\t" + call_entries[key][7] + "\n")
+        "\t" + call_entries[key][7])
+        if (deduper != None):
+            tsvof.write("\t" + deduper.offsets(key))
+        tsvof.write("\n")
     print "Finished writing out TSV"
     tsvof.close()
 
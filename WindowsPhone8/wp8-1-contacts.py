@@ -68,6 +68,11 @@
 #            (makes it quicker when running against whole .bin files). Thanks to Boss Rob :)
 # v2015-08-19 Fixed bug in chunking code where it was not processing the last chunk properly
 # v2015-08-26 Added sorting/printing for second last (name) field (doesn't seem to have "1:" prepended to email addresses like the last field)
+# v2026-10-17 Added -m option to search a memory mapped view of the input file (no chunk copies/DELTA overlaps)
+#             Added -p option to search the input file with a pool of worker processes
+#             Added -c option to store/re-use search hits in a hit index file (with -i to re-create it and -v to verify it)
+#             rev_extract_unistring now reads blocks backwards instead of one character at a time (see "REV_STRING_WINDOW")
+#             Input file can be the first segment of a split raw image (eg image.001) which reads all segments as one file (see "splitimage.py")
 #
 
 import codecs
@@ -78,14 +83,25 @@ from optparse import OptionParser
 import re
 import os
 import math
+import mmap
+import multiprocessing
+# Split raw image helpers are shared with the other scripts (see utilities/splitimage.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "utilities"))
+from splitimage import open_image, image_stat
+# Helpers shared by the WP8 scripts in this directory (see wp8common.py)
+from wp8common import image_identity, hitindex_path, load_hitindex, save_hitindex, recordhits
 
-version_string = "wp8-1-contacts.py v2015-08-26"
+version_string = "wp8-1-contacts.py v2026-10-17"
 CHUNK_SIZE = 2000000000 # max value of CHUNK_SIZE + DELTA is 2147483647 (C long limit with Python 2)
 DELTA = 1000 # read this extra bit to catch any hits crossing chunk boundaries. Should be AT LEAST max size of record being searched for.
+PARALLEL_RANGE_SIZE = 67108864 # max size of each range searched by a "parallelsearchRE" worker process (64 MB)
+REV_STRING_WINDOW = 256 # initial number of bytes read backwards when looking for the start of a string (see "rev_extract_unistring")
 
 # Find all indices of the "pattern" regular expression in a given string (using regex)
 # Where pattern is a compiled Python re pattern object (ie the output of "re.compile")
-def regsearch(bigstring, pattern, listindex=[]):
+def regsearch(bigstring, pattern, listindex=None):
+    if (listindex == None):
+        listindex = [] # a new list for each call (a default list would be shared between calls)
     hitsit = pattern.finditer(bigstring)
     for it in hitsit:
         # iterators only last for one shot so we capture the offsets to a list
@@ -95,12 +111,41 @@ def regsearch(bigstring, pattern, listindex=[]):
 # Extract a Unicode null terminated string given file pointer to terminating null character. 
 # Starts at the beginning of last (null) Unicode char and 
 # reads Unicode string in reverse. Returns read string or "Error!"
+# Reads blocks ending at the last char (starting with REV_STRING_WINDOW bytes and doubling) and finds the terminating
+# null/unprintable char from the end of the block instead of reading one char at a time.
+# Near the start/end of the file or at a UTF-16 surrogate, the string is read one char at a time (as before).
 def rev_extract_unistring(f):
     readchar = 0xABCD
     readcharlist = []
     flag = True
     charcount = 0
     begin = f.tell()
+    fd = f.stream # binary file underneath the codecs reader
+    fd.seek(begin)
+    lastchar = fd.read(2)
+    if (len(lastchar) == 2):
+        end = begin + 2
+        if (lastchar == "\x00\x00"):
+            end = begin # skip null at end of string
+        size = REV_STRING_WINDOW
+        while True:
+            start = max(end - size, end % 2)
+            fd.seek(start)
+            block = fd.read(end - start)
+            # index of the last Unicode char that isn't printable ASCII (ie the null/unprintable char before the string)
+            lastidx = max(len(block[0::2].rstrip(string.printable)), len(block[1::2].rstrip("\x00"))) - 1
+            if (lastidx >= 0):
+                if (block[2*lastidx + 1] < "\xd8") or (block[2*lastidx + 1] > "\xdf"): # not part of a surrogate pair
+                    f.seek(start + 2*lastidx + 2)
+                    readstring = block[2*lastidx + 2:]
+                    if (readstring == ""):
+                        return ""
+                    return readstring.decode("utf-16-le")
+                break
+            if (start < 2):
+                break # string goes back to the start of the file
+            size *= 2
+    f.seek(begin)
     while (flag):
         try:
             readchar = f.read(1)
@@ -133,7 +178,7 @@ def rev_extract_unistring(f):
 def sliceNsearchRE(fd, chunksize, delta, term):
     final_hitlist = [] # list of file offsets which contain the search term
     pattern = re.compile(term, re.DOTALL) # should only really call this once at start, if same substring.
-    stats = os.fstat(fd.fileno())
+    stats = image_stat(fd)
     #print("sliceNsearchRE Input file " + filename + " is " + str(stats.st_size) + " bytes\n")
     begin_chunk = 0
 
@@ -171,9 +216,71 @@ def sliceNsearchRE(fd, chunksize, delta, term):
     #print("final_hitlist = " + str(final_hitlist))
     return(final_hitlist)
 
+# Searches a read-only memory map of the whole file (using RE) and returns file offsets of any hits.
+# The regex runs directly over the mapped pages so there are no chunk copies and no DELTA overlaps to manage.
+# Hit offsets are the same as "sliceNsearchRE". Falls back to "sliceNsearchRE" if the file cannot be mapped
+# (eg 32 bit Python with a large image).
+def mmapsearchRE(fd, term):
+    final_hitlist = [] # list of file offsets which contain the search term
+    stats = image_stat(fd)
+    if (stats.st_size == 0):
+        return(final_hitlist) # cannot mmap an empty file
+    try:
+        mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    except:
+        print("mmap of input file failed ... using chunked search instead")
+        exctype, value = sys.exc_info()[:2]
+        print("Exception type = ",exctype,", value = ",value)
+        return(sliceNsearchRE(fd, CHUNK_SIZE, DELTA, term))
+    pattern = re.compile(term, re.DOTALL)
+    final_hitlist = regsearch(mm, pattern, [])
+    mm.close()
+    return(final_hitlist)
+
+# Worker function for "parallelsearchRE". Searches one range of the file (plus delta bytes) and
+# returns the file offsets of hits which start inside the range. Each worker opens its own file handle.
+def searchrangeRE(args):
+    filename, begin_range, rangesize, delta, term = args
+    range_hitlist = []
+    pattern = re.compile(term, re.DOTALL)
+    fd = open_image(filename)
+    fd.seek(begin_range)
+    rawrange = fd.read(rangesize + delta) # read returns less at EOF
+    fd.close()
+    for hit in regsearch(rawrange, pattern, []):
+        if (hit < rangesize):
+            range_hitlist.append(begin_range + hit)
+        else:
+            break # hit will be processed with the next range
+    return(range_hitlist)
+
+# Searches a file with a pool of worker processes (using RE) and returns file offsets of any hits.
+# The file is split into ranges (aligned to 4096 bytes and at most PARALLEL_RANGE_SIZE) which are searched
+# concurrently. Like "sliceNsearchRE", each range reads an extra delta bytes to catch hits crossing range boundaries.
+# Hits are returned in offset order and match "sliceNsearchRE". Needs os.fork (ie not Windows) otherwise
+# falls back to "sliceNsearchRE".
+def parallelsearchRE(fd, numworkers, delta, term):
+    if (not hasattr(os, "fork")):
+        print("Parallel search is not supported on this platform ... using chunked search instead")
+        return(sliceNsearchRE(fd, CHUNK_SIZE, delta, term))
+    final_hitlist = [] # list of file offsets which contain the search term
+    stats = image_stat(fd)
+    if (stats.st_size == 0):
+        return(final_hitlist)
+    rangesize = int(math.ceil(float(stats.st_size) / numworkers))
+    rangesize = min(PARALLEL_RANGE_SIZE, ((rangesize + 4095) // 4096) * 4096)
+    tasks = [(fd.name, begin_range, rangesize, delta, term) for begin_range in range(0, stats.st_size, rangesize)]
+    pool = multiprocessing.Pool(numworkers)
+    results = pool.map(searchrangeRE, tasks, 1) # results are in range order
+    pool.close()
+    pool.join()
+    for range_hitlist in results:
+        final_hitlist.extend(range_hitlist)
+    return(final_hitlist)
+
 # Main
 print "Running " + version_string + "\n"
-usage = " %prog -f inputfile -o outputfile"
+usage = " %prog -f inputfile -o outputfile [-m] [-p workers] [-c indexdir [-i] [-v]]"
 
 # Handle command line args
 parser = OptionParser(usage=usage)
@@ -183,6 +290,21 @@ parser.add_option("-f", dest="filename",
 parser.add_option("-o", dest="tsvfile",
                   action="store", type="string",
                   help="Tab Separated Output Filename")
+parser.add_option("-m", dest="usemmap",
+                  action="store_true", default=False,
+                  help="(Optional) Search a memory mapped view of the input file instead of reading it in chunks")
+parser.add_option("-p", dest="workers",
+                  action="store", type="int", default=0,
+                  help="(Optional) Search the input file with this many worker processes (eg 8)")
+parser.add_option("-c", dest="cachedir",
+                  action="store", type="string",
+                  help="(Optional) Directory for storing/re-using a hit index file so repeat runs on the same input file skip the search")
+parser.add_option("-i", dest="rebuildindex",
+                  action="store_true", default=False,
+                  help="(Optional) Ignore any existing hit index file and re-create it (requires -c)")
+parser.add_option("-v", dest="verifyindex",
+                  action="store_true", default=False,
+                  help="(Optional) Search the input file anyway and check the results against the hit index file (requires -c)")
 (options, args) = parser.parse_args()
 
 # Check if no arguments given by user, exit
@@ -197,17 +319,25 @@ if (options.tsvfile == None) :
     parser.print_help()
     print "\nOutput filename incorrectly specified!"
     exit(-1)
+if (((options.rebuildindex) or (options.verifyindex)) and (options.cachedir == None)) :
+    parser.print_help()
+    print "\nThe -i and -v options require a hit index directory (-c)!"
+    exit(-1)
+if ((options.cachedir != None) and (not os.path.isdir(options.cachedir))) :
+    parser.print_help()
+    print "\nHit index directory incorrectly specified!"
+    exit(-1)
 
 # Open store.vol for unicode encoded text reads
 try:
-	funi = codecs.open(options.filename, encoding="utf-16-le", mode="r")
+	funi = codecs.getreader("utf-16-le")(open_image(options.filename))
 except:
     print ("Input File Not Found (unicode attempt)")
     exit(-1)
 
 # Open store.vol for binary byte ops (eg timestamps)
 try:
-	fb = open(options.filename, "rb")
+	fb = open_image(options.filename)
 except:
     print ("Input File Not Found (binary attempt)")
     exit(-1)
@@ -215,7 +345,43 @@ except:
 # search the file chunk strings for the
 # [01 04 00 00 00 82 00 E0 00 74 C5 B7 10 1A 82 E0 08] value which appears at end of Contact records
 contact_sig = "\x01\x04\x00\x00\x00\x82\x00\xE0\x00\x74\xC5\xB7\x10\x1A\x82\xE0\x08"
-contact_hits = sliceNsearchRE(fb, CHUNK_SIZE, DELTA, contact_sig)
+# Re-use the hits from a previous run if there is a matching hit index file (-c)
+hitindex = None # list of (pattern_id, file offset) hits read from the hit index file
+scannedhits = None # list of hits found by searching the input file (when saving/verifying a hit index file)
+if (options.cachedir != None):
+    identity = image_identity(fb)
+    hitindexfile = hitindex_path(options.cachedir, options.filename, [contact_sig])
+    if (options.rebuildindex):
+        print "Re-creating hit index file " + hitindexfile
+    else:
+        hitindex = load_hitindex(hitindexfile, identity, [contact_sig])
+        if (hitindex == None):
+            print "No valid hit index file found ... searching input file"
+if ((hitindex != None) and (not options.verifyindex)):
+    print "Using " + str(len(hitindex)) + " hits from hit index file " + hitindexfile
+    contact_hits = [offset for (pid, offset) in hitindex]
+else:
+    if (options.workers > 1):
+        contact_hits = parallelsearchRE(fb, options.workers, DELTA, contact_sig)
+    elif (options.usemmap):
+        contact_hits = mmapsearchRE(fb, contact_sig)
+    else:
+        contact_hits = sliceNsearchRE(fb, CHUNK_SIZE, DELTA, contact_sig)
+    if (options.cachedir != None):
+        scannedhits = contact_hits
+
+# Save (or verify) the hit index file (-c)
+if (scannedhits != None):
+    scannedhits = [(0, offset) for offset in scannedhits]
+    if (hitindex != None):
+        if (scannedhits == hitindex):
+            print "Hit index file verified OK (" + str(len(hitindex)) + " hits)"
+        else:
+            print "Hit index file MISMATCH (" + str(len(hitindex)) + " cached hits, " + str(len(scannedhits)) + " hits found) ... re-creating " + hitindexfile
+            save_hitindex(hitindexfile, identity, [contact_sig], scannedhits, version_string)
+    elif (save_hitindex(hitindexfile, identity, [contact_sig], scannedhits, version_string)):
+        print "Saved " + str(len(scannedhits)) + " hits to hit index file " + hitindexfile
+
 print "Found " + str(len(contact_hits)) + " potential contacts" 
 
 # Dict for storing results (keyed by offset)
@@ -18,6 +18,23 @@
 #
 # You can view the GNU General Public License at <http://www.gnu.org/licenses/>
 #
+# History
+# v2015-11-14 Initial version
+# v2026-10-17 Attachment/Recipient/Message search terms are now all found in one pass over store.vol (see "multisearch")
+#             read_nullterm_unistring now reads/decodes blocks instead of one character at a time (see "decode_nullterm_unistring")
+#             find_timestamp now reads its search window once and only checks likely FILETIME offsets (see "FILETIME_MSB_RE")
+#             Input file can be the first segment of a split raw image (eg image.001) which reads all segments as one file (see "splitimage.py")
+#             Timestamps are formatted through a least recently used cache of ISO date strings (see "utc_isoformat" in "wp8common.py")
+#             store.vol is searched through a read only memory mapped view (or in chunks for a split raw image) instead of
+#             being read into memory (so whole device images can be processed). The fixed offset size/store/msgid/flag
+#             fields are unpacked straight from the view (see "read_uint32")
+#             Attachment "<digits>" tags are found by a dedicated scanner instead of a backtracking RE (see "find_digittags")
+#             Added -t option to check the scanner's hits against the RE on store.vol (and time them both)
+#             Added -d option to stage the Attachment/Recipient/Message rows in an SQLite database (instead of in memory)
+#             and join/sort them with an ordered query (the search hit offsets are still kept in memory). An interrupted
+#             run resumes from its last checkpoint if re-run with the same staging database (see "stage_open")
+#             Output rows with the same Timestamp2 are sorted by msgid and Unicode fields are written as UTF-8 (see "mms_tsvline")
+#
 
 import sys
 from optparse import OptionParser
@@ -29,50 +46,133 @@ import string
 import re
 import codecs
 import binascii
+import heapq
+import sre_parse
+import sre_constants
+import mmap
+import math
+import time
+import sqlite3
+import itertools
+# Split raw image helpers are shared with the other scripts (see utilities/splitimage.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "utilities"))
+from splitimage import SplitImage, open_image, image_stat
+# Helpers shared by the WP8 scripts in this directory (see wp8common.py)
+from wp8common import utc_isoformat
 
-version_string = "wp8-1-mms.py v2015-11-14"
+version_string = "wp8-1-mms.py v2026-10-17"
+UNISTRING_WINDOW = 256 # initial number of bytes read when looking for the end of a null terminated Unicode string
+# Characters replaced with a space when extracting Unicode strings ie not in string.printable (or "\r", "\n").
+# A UTF-16 surrogate pair (ie 2 chars on narrow Python builds) counts as one character.
+UNPRINTABLE_RE = re.compile(u"[\ud800-\udbff][\udc00-\udfff]|[^\t\x0b\x0c\x20-\x7e]")
+UNICHAR_RE = re.compile(u"[\ud800-\udbff][\udc00-\udfff]|.", re.DOTALL) # one character (incl. surrogate pairs)
+# The 2 most significant bytes of a FILETIME in the "read_filetime" sanity range (0x01CD000000000000 to 0x01D9000000000000)
+FILETIME_MSB_RE = re.compile("[\xcd-\xd9]\x01")
+STAGE_COMMIT = 1000 # number of hits processed between staging database commits (ie resume checkpoints)
+stagedb = None # staging database connection (see "stage_open") or None if the rows are kept in memory
+CHUNK_SIZE = 67108864 # size of each chunk searched when store.vol cannot be memory mapped (64 MB)
+# Bytes allowed between "<\x00" and ">\x00\x00\x00" in an attachment "<digits>" tag (see "find_digittags").
+# Same as the attachterm2 RE character class ie the digits plus the 0x00 and "|" bytes which are also in that class.
+DIGITTAG_CHARS = "0123456789\x00|"
+DIGITTAG_WINDOW = 64 # initial number of bytes checked after "<\x00" for the run of tag characters
+DELTA = 1100 # read this extra bit to catch any hits crossing chunk boundaries. Should be AT LEAST max size of record being searched for.
 
 # Find all indices of the "pattern" regular expression in a given string (using regex)
 # Where pattern is a compiled Python re pattern object (ie the output of "re.compile")
-def regsearch(bigstring, pattern, listindex=[]):
+def regsearch(bigstring, pattern, listindex=None):
+    if (listindex == None):
+        listindex = [] # a new list for each call (a default list would be shared between calls)
     hitsit = pattern.finditer(bigstring)
     for it in hitsit:
         # iterators only last for one shot so we capture the offsets to a list
         listindex.append(it.start())
     return(listindex)
 
-# Read in unicode chars one at a time until a null char ie "0x00 0x00"
-# Returns empty string on error otherwise it filters out return/newlines and returns the string read
-def read_nullterm_unistring(f):
-    readstrg = ""
-    readchar = 0xABCD
-    flag = True
-    unprintablechars = False
-    begin = f.tell()
-    
-    while (flag):
-        try:
-            #print("char at " + hex(f.tell()).rstrip("L"))
-            readchar = f.read(1)
-            if (readchar == unichr(0)): # bailout if null char
-                flag = False
-            if (flag):
-                if (readchar in string.printable) and (readchar != "\r") and (readchar != "\n"):
+# Decodes a UTF-16LE null terminated string starting at "offset" of a binary file.
+# Reads blocks of the file (starting with UNISTRING_WINDOW bytes and doubling) until "find" locates a 2 byte aligned
+# null terminator then decodes the whole string in one go.
+# Returns (decoded string without the null, file offset after the null, decode exception or None).
+# On a decode error, returns the characters before the bad character and the offset after the bad character's bytes
+# (ie the same result as reading the string one character at a time with a codecs reader).
+# If there is no null terminator, returns what could be read up to the end of the file.
+def decode_nullterm_unistring(fd, offset):
+    fd.seek(offset)
+    buf = ""
+    nullpos = -1
+    readsize = UNISTRING_WINDOW
+    while (nullpos < 0):
+        block = fd.read(readsize)
+        if (block == ""):
+            break # EOF and no null terminator
+        searchpos = len(buf) # buf is always an even length here so an aligned null cannot span two blocks
+        buf += block
+        nullpos = buf.find("\x00\x00", searchpos)
+        while ((nullpos >= 0) and (nullpos % 2)):
+            nullpos = buf.find("\x00\x00", nullpos + 1)
+        readsize = min(readsize * 2, 1048576)
+
+    if (nullpos >= 0):
+        data = buf[:nullpos + 2] # decode the null too so a bad char right before it fails like a character at a time read
+    else:
+        data = buf[:len(buf) - (len(buf) % 2)]
+    try:
+        decoded = data.decode("utf-16-le")
+    except UnicodeDecodeError:
+        # Decode the bad character's bytes incrementally (like a codecs reader does) to get the same error and end offset
+        charstart = sys.exc_info()[1].start
+        buf += fd.read(4)
+        for size in range(1, len(buf) - charstart + 1):
+            try:
+                codecs.utf_16_le_decode(buf[charstart:charstart + size], "strict", False)
+            except UnicodeDecodeError:
+                return (buf[:charstart].decode("utf-16-le"), offset + charstart + size, sys.exc_info()[1])
+        return (buf[:charstart].decode("utf-16-le"), offset + len(buf), None)
+    if (nullpos >= 0):
+        return (decoded[:-1], offset + nullpos + 2, None)
+    return (decoded, offset + len(data), None)
+
+# Extracts a null terminated UTF-16LE string starting at "offset" of a binary file (see "decode_nullterm_unistring").
+# Characters not in string.printable (and "\r", "\n") are replaced with a space and reported.
+# Returns (string, file offset after the null terminator, True if any characters were replaced).
+# Returns the partial string on a decode error.
+# Note: Non ASCII characters cannot be hexlified for reporting so (as before) the string is cut short at the first one.
+def extract_nullterm_unistring(fd, offset):
+    decoded, endoffset, decodeerror = decode_nullterm_unistring(fd, offset)
+    readstrg, numsubs = UNPRINTABLE_RE.subn(u" ", decoded)
+    if (len(readstrg) == numsubs):
+        readstrg = str(readstrg) # no printable chars so return a str as before (callers may test 'is ""')
+    if (numsubs > 0):
+        # Only strings with unprintable characters are processed one character at a time
+        readstrg = ""
+        charend = offset
+        for readchar in UNICHAR_RE.findall(decoded):
+            charend += len(readchar.encode("utf-16-le"))
+            try:
+                if (not UNPRINTABLE_RE.match(readchar)):
                     readstrg += readchar
                 else:
                     readstrg += " "
-                    unprintablechars = True
-                    print("Unprintable byte value = " + binascii.hexlify(readchar) + " at " + hex(f.tell()-2).rstrip("L"))
-        except:
-            print("Warning ... bad unicode string at offset " + hex(begin).rstrip("L"))
-            exctype, value = sys.exc_info()[:2]
-            print("Exception type = ",exctype,", value = ",value) 
-            #readstrg = ""
-            return(readstrg) # returns partial strings
+                    print("Unprintable byte value = " + binascii.hexlify(readchar) + " at " + hex(charend-2).rstrip("L"))
+            except:
+                print("Warning ... bad unicode string at offset " + hex(offset).rstrip("L"))
+                exctype, value = sys.exc_info()[:2]
+                print("Exception type = ",exctype,", value = ",value) 
+                return(readstrg, charend, True) # returns partial strings
+    if (decodeerror != None):
+        print("Warning ... bad unicode string at offset " + hex(offset).rstrip("L"))
+        print("Exception type = ",type(decodeerror),", value = ",decodeerror) 
+        return(readstrg, endoffset, numsubs > 0) # returns partial strings
     
-    if (unprintablechars):
-        print("String substitution(s) due to unrecognized/unprintable characters starting at " + hex(begin).rstrip("L"))
+    if (numsubs > 0):
+        print("String substitution(s) due to unrecognized/unprintable characters starting at " + hex(offset).rstrip("L"))
         print("Revised string is: " + readstrg + "\n")
+    return(readstrg, endoffset, numsubs > 0)
+
+# Read in a null terminated Unicode string from a codecs reader (ie starting at the reader's current file offset).
+# Returns the string and leaves the reader positioned after the null terminator (see "extract_nullterm_unistring").
+def read_nullterm_unistring(f):
+    readstrg, endoffset, unprintablechars = extract_nullterm_unistring(f.stream, f.tell())
+    f.seek(endoffset)
     return(readstrg)
 
 # Read in 8 byte MS FILETIME (number of 100 ns since 1 Jan 1601) and 
@@ -104,25 +204,306 @@ def read_filetime(f):
 
 # Searches backwards for a valid timestamp from a given file ptr and range
 # Returns 0 if error or not found otherwise returns unix timestamp value
+# Reads the whole window of candidate offsets once then only checks offsets whose 2 most significant bytes are in the
+# "read_filetime" sanity range (found with FILETIME_MSB_RE) instead of seeking/reading 8 bytes at every offset.
+# Offsets are checked in the same order as before (minoffset first) and the file ptr is left after the returned FILETIME.
 def find_timestamp(f, maxoffset, minoffset):
     begin = f.tell()
-    # maxoffset is inclusive => need range from minoffset : maxoffset+1
-    for i in range(minoffset, maxoffset+1, 1):
-        if ((begin - i) < 0):
-            return(0) # FILETIME can't be before start of file
-        else:
-            f.seek(begin-i)
-            value = read_filetime(f)
-            if (value != 0):
-                return(value)
-            #otherwise keep searching until maxoffset
-    # if we get here, we haven't found a valid timestamp, so return 0
+    if (maxoffset < minoffset):
+        return(0)
+    highest = begin - minoffset # first offset checked
+    if (highest < 0):
+        return(0) # FILETIME can't be before start of file
+    lowest = max(0, begin - maxoffset) # last offset checked
+    f.seek(lowest)
+    window = f.read(highest + 8 - lowest)
+    fullend = lowest + len(window) - 8 # highest offset with 8 bytes before EOF
+    # Offsets too close to EOF for a FILETIME. Let "read_filetime" report them as before.
+    for offset in range(highest, max(fullend, lowest - 1), -1):
+        f.seek(offset)
+        read_filetime(f)
+    # Check the remaining candidates (highest offset first)
+    candidates = [m.start() - 6 for m in FILETIME_MSB_RE.finditer(window, 6)]
+    for idx in reversed(candidates):
+        if (idx + lowest > min(highest, fullend)):
+            continue
+        mstime = struct.unpack('<Q', window[idx:idx + 8])[0]
+        if (mstime >= 0x01CD000000000000) and (mstime <= 0x01D9000000000000):
+            f.seek(lowest + idx + 8)
+            return((mstime - 116444736000000000) // 10000000)
+    # if we get here, we haven't found a valid timestamp, so return(0)
+    f.seek(lowest + min(8, len(window)))
     return(0)
 
+# Returns the literal (ie non-regex) leading characters of a regular expression search term
+# eg "\x3C\x00\x63\x00" returns all 4 chars but "\x3C\x00[\x30\x00|\x31\x00]+" only returns "\x3C\x00"
+def literal_prefix(term):
+    prefix = ""
+    for op, av in sre_parse.parse(term, re.DOTALL):
+        if (op != sre_constants.LITERAL):
+            break
+        prefix += chr(av)
+    return(prefix)
+
+# Generator used by "multisearch". Yields (offset, groupnum) for each candidate offset of a term group.
+# A group with a literal prefix is located with string.find otherwise its combined RE scanner is used.
+# A lone (non-overlapping) term is located by its own "finditer" so no further checks are needed.
+def scangroup(bigstring, group, groupnum):
+    prefix, scanner, pids = group
+    if ((len(pids) == 1) and (scanner != None)):
+        for it in scanner.finditer(bigstring):
+            yield (it.start(), groupnum)
+    elif (prefix != ""):
+        i = bigstring.find(prefix)
+        while i >= 0:
+            yield (i, groupnum)
+            i = bigstring.find(prefix, i + 1)
+    else:
+        m = scanner.search(bigstring, 0)
+        while m:
+            yield (m.start(), groupnum)
+            m = scanner.search(bigstring, m.start() + 1)
+
+# Yields the offset of each attachment "<digits>" tag (eg "<0000>" or "<1>" in UTF-16LE followed by 2 nulls) in a given string.
+# The hits are the same as the attachterm2 RE (a run of DIGITTAG_CHARS bytes between "<\x00" and ">\x00\x00\x00")
+# but "<\x00" is located with find and the run is measured with lstrip (on a window which is extended for long runs)
+# instead of the RE engine backtracking through its alternation at every "<\x00".
+def find_digittags(bigstring):
+    end = len(bigstring)
+    i = bigstring.find("\x3C\x00")
+    while (i >= 0):
+        start = i + 2
+        if (bigstring[start:start + 1] not in DIGITTAG_CHARS):
+            i = bigstring.find("\x3C\x00", start) # most "<" are not followed by a tag character
+            continue
+        window = DIGITTAG_WINDOW
+        while True:
+            block = bigstring[start:start + window]
+            runlen = len(block) - len(block.lstrip(DIGITTAG_CHARS))
+            if ((runlen < len(block)) or (start + window >= end)):
+                break
+            window *= 2 # run reaches the end of the window so check a bigger one
+        tagend = start + runlen
+        if ((runlen > 0) and (bigstring[tagend:tagend + 4] == "\x3E\x00\x00\x00")):
+            yield (i)
+        # a tag cannot start inside the run (it has no "<" bytes)
+        i = bigstring.find("\x3C\x00", max(i + 1, tagend))
+
+# Generator used by "multisearch". Yields (offset, groupnum) for each hit of a scanner function term (see "find_digittags").
+def scanfunc(bigstring, scanner, groupnum):
+    for offset in scanner(bigstring):
+        yield (offset, groupnum)
+
+# Single pass multi-pattern search of a given string for a list of regular expression search terms.
+# Terms sharing the same leading literal char(s) are grouped so each group is located by one scan
+# and only that group's terms are confirmed (via "match") at each candidate offset.
+# A term can also be a scanner function (eg "find_digittags") which yields the offsets of its hits.
+# Returns a list of (pattern_id, offset) tuples in offset order where pattern_id is the index into "terms".
+# Each term's hits are the same as calling "regsearch" for that term on its own 
+# (or "all_indices" for overlapping literal terms if overlap=True).
+def multisearch(bigstring, terms, overlap=False):
+    patterns = [(None if callable(term) else re.compile(term, re.DOTALL)) for term in terms]
+    scanners = [pid for pid in range(len(terms)) if callable(terms[pid])] # pattern_ids of scanner function terms
+    groupkeys = [] # first literal char of each group ("" = no literal prefix)
+    groups = [] # list of [prefix, RE scanner, list of pattern_ids]
+    for pid in range(len(terms)):
+        if (pid in scanners):
+            continue
+        prefix = literal_prefix(terms[pid])
+        key = prefix[:1]
+        if (key in groupkeys):
+            group = groups[groupkeys.index(key)]
+            group[0] = os.path.commonprefix([group[0], prefix])
+            group[2].append(pid)
+        else:
+            groupkeys.append(key)
+            groups.append([prefix, None, [pid]])
+    for group in groups:
+        if ((len(group[2]) == 1) and (not overlap)):
+            group[1] = patterns[group[2][0]]
+        elif (group[0] == ""):
+            group[1] = re.compile("|".join(["(?:" + terms[pid] + ")" for pid in group[2]]), re.DOTALL)
+
+    hits = []
+    last_end = [0] * len(terms) # end of each term's last hit (regsearch hits do not overlap)
+    streams = [scangroup(bigstring, groups[g], g) for g in range(len(groups))]
+    streams += [scanfunc(bigstring, terms[scanners[n]], len(groups) + n) for n in range(len(scanners))]
+    for offset, groupnum in heapq.merge(*streams):
+        if (groupnum >= len(groups)):
+            hits.append((scanners[groupnum - len(groups)], offset)) # already confirmed by the scanner
+            continue
+        pids = groups[groupnum][2]
+        if ((len(pids) == 1) and (not overlap)):
+            hits.append((pids[0], offset)) # already confirmed by finditer
+            continue
+        for pid in pids:
+            if (offset >= last_end[pid]):
+                m = patterns[pid].match(bigstring, offset)
+                if m:
+                    hits.append((pid, offset))
+                    if (overlap):
+                        last_end[pid] = offset + 1
+                    else:
+                        last_end[pid] = max(m.end(), offset + 1)
+    return(hits)
+
+# Returns a read only memory mapped view of an input file opened with "open_image"
+# or None if it cannot be mapped (eg an empty file or a split raw image)
+def map_image(fd):
+    if (isinstance(fd, SplitImage) or (image_stat(fd).st_size == 0)):
+        return(None)
+    try:
+        return(mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ))
+    except:
+        print("mmap of input file failed ... searching it in chunks instead")
+        exctype, value = sys.exc_info()[:2]
+        print("Exception type = ",exctype,", value = ",value)
+        return(None)
+
+# Searches chunks of a file for several RE terms in one pass and returns (pattern_id, file offset) hits in offset order.
+# Only one chunk (plus delta bytes to catch hits crossing chunk boundaries) is in memory at a time.
+# Used when the input file cannot be memory mapped (see "map_image").
+def sliceNsearchMulti(fd, chunksize, delta, terms):
+    filesize = image_stat(fd).st_size
+    hits = []
+    begin_chunk = 0
+    while (begin_chunk < filesize):
+        fd.seek(begin_chunk)
+        rawchunk = fd.read(min(chunksize + delta, filesize - begin_chunk))
+        # hits are in offset order and relative to the start of the rawchunk
+        for pid, hit in multisearch(rawchunk, terms):
+            if (hit < chunksize):
+                hits.append((pid, begin_chunk + hit))
+            else:
+                break # hit will be processed with the next chunk
+        begin_chunk += chunksize
+    return(hits)
+
+# Searches store.vol for several search terms in one pass (see "multisearch") through the memory mapped view (storemap)
+# or in chunks if it could not be mapped. Returns (pattern_id, file offset) hits in offset order.
+def search_store(terms):
+    if (storemap != None):
+        return(multisearch(storemap, terms))
+    return(sliceNsearchMulti(fbstore, CHUNK_SIZE, DELTA, terms))
+
+# Checks that "find_digittags" finds the same hits as the attachterm2 RE ("term") on some edge cases and on store.vol
+# and prints how long each takes to search store.vol. Returns True if all the hit lists match.
+def check_digittags(term):
+    passed = True
+    cases = ["\x3C\x001\x002\x00\x3E\x00\x00\x00", # <12>
+             "\x3C\x00\x3E\x00\x00\x00", # <> has no digits
+             "\x3C\x00\x00|\x3E\x00\x00\x00", # 0x00 and "|" bytes are in the RE character class
+             "\x3C\x00\x3C\x007\x00\x3E\x00\x00\x00", # tag starting inside another "<"
+             "\x3C\x001\x00\x3E\x00\x00\x00\x3C\x002\x00\x3E\x00\x00\x00", # back to back tags
+             "xx\x3C\x009\x00\x3E\x00\x00", # truncated at end of string
+             "\x3C\x00" + "1\x00" * 100 + "\x3E\x00\x00\x00", # run longer than DIGITTAG_WINDOW
+             "\x3C\x00" + "1\x00" * 100, # run to end of string
+             "\x3C\x001\x00\x3E\x00\x00\x01"] # bad terminator
+    pattern = re.compile(term, re.DOTALL)
+    for case in cases:
+        if (regsearch(case, pattern) != list(find_digittags(case))):
+            print("Tag scanner MISMATCH for " + repr(case))
+            passed = False
+    starttime = time.time()
+    rehits = search_store([term])
+    retime = time.time() - starttime
+    starttime = time.time()
+    scanhits = search_store([find_digittags])
+    scantime = time.time() - starttime
+    print("RE found " + str(len(rehits)) + " \"<d+>\" hits in %.3f secs" % retime)
+    print("Tag scanner found " + str(len(scanhits)) + " \"<d+>\" hits in %.3f secs" % scantime)
+    if (scantime > 0):
+        print("Tag scanner is %.1fx the speed of the RE" % (retime / scantime))
+    if (rehits != scanhits):
+        print("Tag scanner hits do NOT match the RE hits")
+        passed = False
+    return(passed)
+
+# Returns the little endian 4 byte unsigned int at "offset" of store.vol.
+# Unpacks it straight from the memory mapped view (storemap) if there is one otherwise seeks/reads fbstore.
+# Raises an exception if there are not 4 bytes at "offset" (like struct.unpack of a short read).
+def read_uint32(offset):
+    if (offset < 0):
+        raise IOError("Offset " + hex(offset).rstrip("L") + " is before the start of the file")
+    if (storemap != None):
+        return(struct.unpack_from('<I', storemap, offset)[0])
+    fbstore.seek(offset)
+    return(struct.unpack('<I', fbstore.read(4))[0])
+
+# Opens (or creates) the staging database "dbname" for the rows extracted from "storefile" (opened as "fd" with "open_image").
+# Rows are committed every STAGE_COMMIT hits along with the number of hits processed for each table (see "stage_checkpoint")
+# so re-running with the same database skips the hits already processed. The database is kept after the run.
+# Returns the connection or None if the database was made from a different file.
+def stage_open(dbname, storefile, fd):
+    filesize = image_stat(fd).st_size
+    conn = sqlite3.connect(dbname)
+    conn.execute("CREATE TABLE IF NOT EXISTS stageinfo (storefile TEXT, filesize INTEGER)")
+    conn.execute("CREATE TABLE IF NOT EXISTS progress (tablename TEXT PRIMARY KEY, hits INTEGER, stored INTEGER)")
+    conn.execute("CREATE TABLE IF NOT EXISTS attachments (seq INTEGER PRIMARY KEY, msgid INTEGER, file0 TEXT, file1 TEXT, file2 TEXT, typeval TEXT, asize INTEGER)")
+    conn.execute("CREATE INDEX IF NOT EXISTS attachments_msgid ON attachments (msgid, seq)")
+    conn.execute("CREATE TABLE IF NOT EXISTS recipients (msgid INTEGER PRIMARY KEY, timestamp TEXT, phone TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS messages (msgid INTEGER PRIMARY KEY, timestamp3 TEXT, timestamp2 TEXT, phone TEXT, flag INTEGER, size INTEGER)")
+    conn.execute("CREATE INDEX IF NOT EXISTS messages_timestamp2 ON messages (timestamp2, msgid)")
+    row = conn.execute("SELECT storefile, filesize FROM stageinfo").fetchone()
+    if (row == None):
+        conn.execute("INSERT INTO stageinfo VALUES (?, ?)", (os.path.abspath(storefile), filesize))
+        conn.commit()
+    elif ((row[0] != os.path.abspath(storefile)) or (row[1] != filesize)):
+        conn.close()
+        return(None)
+    return(conn)
+
+# Returns the (number of hits processed, number of rows stored) for a table from an earlier run (or (0, 0))
+def stage_resume(tablename):
+    row = stagedb.execute("SELECT hits, stored FROM progress WHERE tablename = ?", (tablename,)).fetchone()
+    if (row == None):
+        return((0, 0))
+    if (row[0] > 0):
+        print("Resuming " + tablename + " table from hit " + str(row[0]) + " (" + str(row[1]) + " rows already staged)\n")
+    return((row[0], row[1]))
+
+# Records the number of hits processed/rows stored for a table and commits the staged rows.
+# Only commits every STAGE_COMMIT hits unless "force" is set.
+def stage_checkpoint(tablename, hits, stored, force=False):
+    if ((stagedb == None) or ((hits % STAGE_COMMIT) and not force)):
+        return
+    stagedb.execute("INSERT OR REPLACE INTO progress VALUES (?, ?, ?)", (tablename, hits, stored))
+    stagedb.commit()
+
+# Returns the (Timestamp, Phone) Recipient entry for a msgid from memory or the staging database.
+# Raises KeyError if there is no entry.
+def lookup_recipient(msgid):
+    if (stagedb == None):
+        return(recipients[msgid])
+    row = stagedb.execute("SELECT timestamp, phone FROM recipients WHERE msgid = ?", (msgid,)).fetchone()
+    if (row == None):
+        raise KeyError(msgid)
+    return(row)
+
+# Stores the (Timestamp3, Timestamp2, Phone, Flag, Size) Message entry for a msgid in memory or the staging database
+def store_message(msgid, message):
+    if (stagedb == None):
+        mmsdict[msgid] = message
+    else:
+        stagedb.execute("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?)", (msgid,) + message)
+
+# Returns the output TSV line for a Message (msgid, (Timestamp3, Timestamp2, Phone, Flag, Size)) and one of its
+# Attachments (file0, file1, file2, typeval, asize). Print order is Timestamp2, msgid, Timestamp3, phonestr, flagvalue,
+# totalsize, typeval, filesize, file0, file1, file2. Unicode strings (eg read back from the staging database) are UTF-8 encoded.
+def mms_tsvline(msgid, message, attachment):
+    fields = [message[1], msgid, message[0], message[2], message[3], message[4], attachment[3], attachment[4], attachment[0], attachment[1], attachment[2]]
+    return("\t".join([(field.encode("utf-8") if isinstance(field, unicode) else str(field)) for field in fields]) + "\n")
+
+# Prints the list of attachment tuples (file0, file1, file2, typeval, asize) for a msgid
+def print_attachments(msgid, attachlist):
+    print("\nNo. Attachments = " + str(len(attachlist)))
+    for attachment in attachlist:
+        print("msgid = " + str(msgid) + " : " + str(attachment))
+
 # Main
 print("Running " + version_string + "\n")
 
-usage = " %prog -s store.vol -o output.tsv(Optional)"
+usage = " %prog -s store.vol -o output.tsv(Optional) -d staging.db(Optional) -t(Optional)"
 
 # Handle command line args
 parser = OptionParser(usage=usage)
@@ -130,6 +511,12 @@ parser.add_option("-s", dest="storefile", action="store", type="string", help="s
 parser.add_option("-o", dest="outputfilename", 
                   action="store", type="string",
                   help="Output Tab Separated Variable filename (Optional)")
+parser.add_option("-d", dest="stagefile",
+                  action="store", type="string",
+                  help="Stage the extracted rows in this SQLite database instead of in memory. Re-run with the same database to resume. Note: The search hit offsets are still kept in memory (Optional)")
+parser.add_option("-t", dest="checktags",
+                  action="store_true", default=False,
+                  help="Check the attachment tag scanner finds the same hits as the RE on store.vol, time them both and exit (Optional)")
 (options, args) = parser.parse_args()
 
 # Check if no arguments given by user, exit
@@ -143,17 +530,17 @@ if not os.path.isfile(options.storefile):
 print("Opening " + options.storefile + "...\n")
 # Open store.vol for binary byte ops (eg searching for hex bytes, reading timestamps)
 try:
-    fbstore = open(options.storefile, "rb")
+    fbstore = open_image(options.storefile)
 except:
     print(options.storefile + " File Not Opened (binary attempt)")
     exit(-1)
 
-fbstore.seek(0)
-rawstore = fbstore.read() # reads whole file into memory so probably don't want to use this with whole image
+# Search/read fixed offset fields through a memory mapped view (instead of reading the whole file into memory)
+storemap = map_image(fbstore)
 
 # Open store.vol for unicode encoded text reads
 try:
-	funistore = codecs.open(options.storefile, encoding="utf-16-le", mode="r")
+	funistore = codecs.getreader("utf-16-le")(open_image(options.storefile))
 except:
     print(options.storefile + " File Not Opened (unicode attempt)")
     exit(-1)
@@ -165,15 +552,40 @@ if (options.outputfilename != None):
         print("Cannot create specified output TSV file Exiting ...\n")
         exit(-1)
 
-print("Processing Attachment table ...")
-# Search for Attachment rows containing "<cid" or <d+> in store.vol and note hit offsets. 
+if (options.stagefile != None):
+    try:
+        stagedb = stage_open(options.stagefile, options.storefile, fbstore)
+    except:
+        print("Cannot open specified staging database Exiting ...\n")
+        exctype, value = sys.exc_info()[:2]
+        print("Exception type = ",exctype,", value = ",value)
+        exit(-1)
+    if (stagedb == None):
+        print("Specified staging database was made from a different store.vol Exiting ...\n")
+        exit(-1)
+
+# Search terms for each table. All of them are found in one pass over store.vol
+# Attachment rows containing "<cid" or <d+>
 attachterm1 = "\x3C\x00\x63\x00\x69\x00\x64\x00"
-attachpattern1 = re.compile(attachterm1, re.DOTALL)
-attach_hitlist1 = regsearch(rawstore, attachpattern1, [])
-print(str(len(attach_hitlist1)) + " Attachment \"<cid\" hits found in store.vol\n")
 attachterm2 = "\x3C\x00[\x30\x00|\x31\x00|\x32\x00|\x33\x00|\x34\x00|\x35\x00|\x36\x00|\x37\x00|\x38\x00|\x39\x00]+\x3E\x00\x00\x00" # eg match "<0000>" or <1>
-attachpattern2 = re.compile(attachterm2, re.DOTALL)
-attach_hitlist2 = regsearch(rawstore, attachpattern2, [])
+# attachterm2 is searched for with "find_digittags" (the RE is only used to check it with -t)
+if (options.checktags):
+    if (check_digittags(attachterm2)):
+        print("\nAll tag scanner checks passed")
+        exit(0)
+    print("\nTag scanner checks FAILED")
+    exit(-1)
+# Recipient table rows containing "@.SMS" (MMS rows also contain this)
+smsterm = "\x40\x01\x53\x00\x4d\x00\x53\x00\x00\x00" # "@.SMS" where . is 0x01
+# Message table rows containing "IPM.MMS"
+mmsterm = "\x49\x00\x50\x00\x4D\x00\x2E\x00\x4D\x00\x4D\x00\x53\x00\x00\x00" 
+multihits = search_store([attachterm1, find_digittags, smsterm, mmsterm])
+
+print("Processing Attachment table ...")
+# Note Attachment hit offsets for "<cid" or <d+> in store.vol
+attach_hitlist1 = [offset for (termid, offset) in multihits if termid == 0]
+print(str(len(attach_hitlist1)) + " Attachment \"<cid\" hits found in store.vol\n")
+attach_hitlist2 = [offset for (termid, offset) in multihits if termid == 1]
 print(str(len(attach_hitlist2)) + " Attachment \"<d+>\" hits found in store.vol\n")
 attach_hitlist = attach_hitlist1 + attach_hitlist2
 
@@ -181,9 +593,13 @@ print(str(len(attach_hitlist)) + " Total Attachment hits found in store.vol\n")
 # These should correspond to MMS records in the "Attachment" table.
 # Each record looks like:
 # [X][4 byte rowid][0x07000000][0x03000000][[4 byte msgid][10 bytes][4 byte Size][31 bytes][ "<cidText" or "<cidSmil" or "<cidImage" ][1][filename1][1][filename2][1][filetype][X]
-attachments = {} # dict of tuple lists containing attachment data keyed by msgid
+attachments = {} # dict of tuple lists containing attachment data keyed by msgid (if not staged)
 attachhitcount = 0
-for ahit in attach_hitlist:
+resumehit = 0
+if (stagedb != None):
+    resumehit, attachhitcount = stage_resume("Attachment")
+for ahitnum, ahit in enumerate(attach_hitlist[resumehit:], resumehit):
+    stage_checkpoint("Attachment", ahitnum, attachhitcount)
     try:
         # Read in filename strings from "<cid" onwards
         funistore.seek(ahit)
@@ -206,8 +622,7 @@ for ahit in attach_hitlist:
     asize = 0
     try:
         # size field is 0x23 bytes (35 dec) before "<cid" hit
-        fbstore.seek(ahit - 0x23)
-        asize = struct.unpack('<I', fbstore.read(4))[0] # 4 byte size
+        asize = read_uint32(ahit - 0x23) # 4 byte size
     except:
         print("Bad ASIZE extraction at " + hex(ahit - 0x23).rstrip("L"))
         exctype, value = sys.exc_info()[:2]
@@ -224,8 +639,7 @@ for ahit in attach_hitlist:
         astore = -1
         try:
             # To check, try finding "0x07" x39 (57 dec) bytes before "<cid"
-            fbstore.seek(ahit - 0x39)
-            astore = struct.unpack('<I', fbstore.read(4))[0]
+            astore = read_uint32(ahit - 0x39)
             #print("astore = " + str(astore) + " at offset " + hex(ahit - 0x39).rstrip("L"))
         except:
             print("Bad astore extraction at " + hex(ahit - 0x39).rstrip("L"))
@@ -236,8 +650,7 @@ for ahit in attach_hitlist:
             amsgid = -1
             try:
                 # Try finding msgid 0x31 (49 dec) bytes before "<cid"
-                fbstore.seek(ahit - 0x31)
-                amsgid = struct.unpack('<I', fbstore.read(4))[0]
+                amsgid = read_uint32(ahit - 0x31)
             except:
                 print("Bad amsgid extraction at " + hex(ahit - 0x31).rstrip("L"))
                 exctype, value = sys.exc_info()[:2]
@@ -246,38 +659,49 @@ for ahit in attach_hitlist:
             #print("amsgid = " + str(amsgid) + " at offset " + hex(ahit - 0x31).rstrip("L"))
             
             # Store attachment data if we get this far
-            if not (amsgid in attachments.keys()):
-                attachments[amsgid] = list()
-            attachments[amsgid].append((file0, file1, file2, typeval, asize))
+            if (stagedb != None):
+                stagedb.execute("INSERT OR REPLACE INTO attachments VALUES (?, ?, ?, ?, ?, ?, ?)", (ahitnum, amsgid, file0, file1, file2, typeval, asize))
+            else:
+                if not (amsgid in attachments.keys()):
+                    attachments[amsgid] = list()
+                attachments[amsgid].append((file0, file1, file2, typeval, asize))
             attachhitcount += 1
         else:
             print("Cannot find Attachment msgid! Skipping this hit ...")
     #print("file0 = " + file0 + ", file1 = " + file1 + ", file2 = " + file2 + ", typeval = " + typeval + ", asize = " + str(asize))
 
+stage_checkpoint("Attachment", len(attach_hitlist), attachhitcount, True)
+
 print("\nAttachments sorted by msgid ...")
 print("===================================")
-sortedattachkeys = sorted(attachments.keys())
-for j in sortedattachkeys:
-    print("\nNo. Attachments = " + str(len(attachments[j])))
-    for k in range(len(attachments[j])):
-        print("msgid = " + str(j) + " : " + str(attachments[j][k]))
+if (stagedb != None):
+    # Only one msgid's attachments are held in memory at a time
+    attachrows = stagedb.execute("SELECT msgid, file0, file1, file2, typeval, asize FROM attachments ORDER BY msgid, seq")
+    for j, rows in itertools.groupby(attachrows, lambda row : row[0]):
+        print_attachments(j, [tuple(row[1:]) for row in rows])
+else:
+    sortedattachkeys = sorted(attachments.keys())
+    for j in sortedattachkeys:
+        print_attachments(j, attachments[j])
 
 print("\nProcessed/Stored " + str(attachhitcount) + " out of " + str(len(attach_hitlist)) + " Attachment hits\n")
 
 print("Processing Recipient table ...")
-# Search for Recipient table rows containing "@.SMS" (MMS rows also contain this)
-smsterm = "\x40\x01\x53\x00\x4d\x00\x53\x00\x00\x00" # "@.SMS" where . is 0x01
-smspattern = re.compile(smsterm, re.DOTALL)
-sms_hitlist = regsearch(rawstore, smspattern, [])
+# Recipient table rows containing "@.SMS" (MMS rows also contain this)
+sms_hitlist = [offset for (termid, offset) in multihits if termid == 2]
 print(str(len(sms_hitlist)) + " Recipient hits found in " + options.storefile + "\n")
 # These should correspond to sent records in the "Recipient" table. 
 # Each record looks like:
 # [X][4 byte rowid][0x07000000][0x03000000][4 byte msgid][4 bytes][8 byte Timestamp3][25 bytes]["@.SMS"][1][DestPhone][X]
 # Store the Timestamp3 and Phone No. in a dictionary keyed by msgid.
-recipients = {} # dictionary of SMS recipients (ie destinations) keyed by msgid
+recipients = {} # dictionary of SMS recipients (ie destinations) keyed by msgid (if not staged)
 recipcount = 0
+resumehit = 0
+if (stagedb != None):
+    resumehit, recipcount = stage_resume("Recipient")
 # Process Recipient table
-for hit in sms_hitlist:
+for hitnum, hit in enumerate(sms_hitlist[resumehit:], resumehit):
+    stage_checkpoint("Recipient", hitnum, recipcount)
     phonefield = ""
     try:
         # Read Destination Phone Number string 0xB (11 dec) bytes from start of "@.SMS"
@@ -308,7 +732,7 @@ for hit in sms_hitlist:
                 #print("timestampSMSraw = " + hex(timestampSMSraw))
                 try:
                     # returns UTC ISO time string
-                    timestampSMSstr = datetime.datetime.utcfromtimestamp(timestampSMSraw).isoformat()
+                    timestampSMSstr = utc_isoformat(timestampSMSraw)
                 except:
                     print("Bad Recipient Timestamp calculation at/around " + hex(hit).rstrip("L") + " ... Skipping hit ...")
                     continue # skip hit if bad read
@@ -317,8 +741,7 @@ for hit in sms_hitlist:
     storevalue = -1
     try:
         # Now go back 0x31 (49 dec) bytes from "@.SMS" and check for the 0x07000000 value
-        fbstore.seek(hit - 0x31)
-        storevalue = struct.unpack('<I', fbstore.read(4))[0]
+        storevalue = read_uint32(hit - 0x31)
     except:
         print("Bad Recipient Store extraction at " + hex(hit - 0x31).rstrip("L"))
         exctype, value = sys.exc_info()[:2]
@@ -331,8 +754,7 @@ for hit in sms_hitlist:
         msgidvalue = -1
         try:
             # msgid should be 0x29 (41 dec) bytes back from hit
-            fbstore.seek(hit - 0x29)
-            msgidvalue = struct.unpack('<I', fbstore.read(4))[0]
+            msgidvalue = read_uint32(hit - 0x29)
         except:
             print("Bad Recipient msgid extraction at " + hex(hit - 0x29).rstrip("L"))
             exctype, value = sys.exc_info()[:2]
@@ -341,24 +763,31 @@ for hit in sms_hitlist:
         #print "SMS msgidvalue = " + str(msgidvalue) + " at offset " + hex(hit - 0x29).rstrip("L")
         
         # Store Recipient Sent MMS data
-        recipients[msgidvalue] = (timestampSMSstr, phonefield)
+        if (stagedb != None):
+            stagedb.execute("INSERT OR REPLACE INTO recipients VALUES (?, ?, ?)", (msgidvalue, timestampSMSstr, phonefield))
+        else:
+            recipients[msgidvalue] = (timestampSMSstr, phonefield)
         recipcount += 1
     else:
         print("Recipient Store value not valid! Skipping hit at " + hex(hit).rstrip("L") + "\n") # could be unexpected layout
 
+stage_checkpoint("Recipient", len(sms_hitlist), recipcount, True)
+
 print("\nRecipients sorted by msgid ...")
 print("===================================")
-sortedrepkeys = sorted(recipients.keys())
-for j in sortedrepkeys:
-    print("msgid = " + str(j) + " : " + str(recipients[j]))
+if (stagedb != None):
+    for row in stagedb.execute("SELECT msgid, timestamp, phone FROM recipients ORDER BY msgid"):
+        print("msgid = " + str(row[0]) + " : " + str(tuple(row[1:])))
+else:
+    sortedrepkeys = sorted(recipients.keys())
+    for j in sortedrepkeys:
+        print("msgid = " + str(j) + " : " + str(recipients[j]))
 
 print("\nProcessed/Stored " + str(recipcount) + " out of " + str(len(sms_hitlist)) + " Recipient hits\n")
 
 print("Processing Message table ...")
-# Search for Message table rows containing "IPM.MMS"
-mmsterm = "\x49\x00\x50\x00\x4D\x00\x2E\x00\x4D\x00\x4D\x00\x53\x00\x00\x00" 
-mmspattern = re.compile(mmsterm, re.DOTALL)
-ipmmms_hitlist = regsearch(rawstore, mmspattern, [])
+# Message table rows containing "IPM.MMS"
+ipmmms_hitlist = [offset for (termid, offset) in multihits if termid == 3]
 print(str(len(ipmmms_hitlist)) + " IPM.MMS Message hits found in " + options.storefile + "\n")
 # Search for "IPM.MMS" in given file (store.vol, pagefile.sys?) and note hit offsets. 
 # These should correspond to MMS records in the "Message" table.
@@ -366,9 +795,13 @@ print(str(len(ipmmms_hitlist)) + " IPM.MMS Message hits found in " + options.sto
 # [X][4 byte msgid][0x07000000][162 bytes][Timestamp0][36 bytes][Timestamp1][4 byte Flag][4 bytes][4 byte Size][172 bytes][Timestamp2][226 bytes][Phone0][1]["IPM.MMS"][1][Phone1][1][Phone2][1][Phone3][14 bytes][Timestamp3][X includes Timestamp4]
 # Each Sent MMS record (contains no phone numbers) looks like:
 # [X][4 byte msgid][0x07000000][162 bytes][Timestamp0][36 bytes][Timestamp1][4 byte Flag][4 bytes][4 byte Size][172 bytes][Timestamp2][206 bytes]["IPM.MMS"][14 bytes][Timestamp3][X does NOT include Timestamp4]
-mmsdict = {} # dict of mms keyed by msgid
+mmsdict = {} # dict of mms keyed by msgid (if not staged)
 mmscount = 0
-for hit in ipmmms_hitlist:
+resumehit = 0
+if (stagedb != None):
+    resumehit, mmscount = stage_resume("Message")
+for hitnum, hit in enumerate(ipmmms_hitlist[resumehit:], resumehit):
+    stage_checkpoint("Message", hitnum, mmscount)
     phonefield = ""
     try:
         # Check for Phone1 string 0x11 bytes (17 dec) after hit
@@ -388,7 +821,7 @@ for hit in ipmmms_hitlist:
             timestamp3off = funistore.tell() + 0xB
             fbstore.seek(timestamp3off)
             timestamp3raw = read_filetime(fbstore)
-            timestamp3str = datetime.datetime.utcfromtimestamp(timestamp3raw).isoformat()
+            timestamp3str = utc_isoformat(timestamp3raw)
         except:
             print("Bad Sent Message Timestamp3 extraction at " + hex(timestamp3off).rstrip("L"))
             exctype, value = sys.exc_info()[:2]
@@ -404,7 +837,7 @@ for hit in ipmmms_hitlist:
             #print("timestamp2raw = " + hex(timestamp2raw))
             if (timestamp2raw != 0):
                 # returns ISO UTC time string
-                timestamp2str = datetime.datetime.utcfromtimestamp(timestamp2raw).isoformat()
+                timestamp2str = utc_isoformat(timestamp2raw)
             else:
                 continue # skip this hit, timestamp2 should not be 0
         except:
@@ -423,7 +856,7 @@ for hit in ipmmms_hitlist:
             if (timestamp1raw != 0):
                 #print("timestamp1raw = " + hex(timestamp1raw))
                 # returns ISO UTC time string
-                timestamp1str = datetime.datetime.utcfromtimestamp(timestamp1raw).isoformat()
+                timestamp1str = utc_isoformat(timestamp1raw)
                 flagoffset = fbstore.tell() # flag offset occurs just after timestamp1
             else:
                 # something bad happened reading time
@@ -438,8 +871,7 @@ for hit in ipmmms_hitlist:
         # Now read Flag value (1 byte just after Timestamp1)
         flagvalue = -1
         try:
-            fbstore.seek(flagoffset)
-            flagvalue = struct.unpack('<I', fbstore.read(4))[0]
+            flagvalue = read_uint32(flagoffset)
         except:
             print("Bad Sent Message Flag extraction at " + hex(flagoffset).rstrip("L"))
             exctype, value = sys.exc_info()[:2]
@@ -450,8 +882,7 @@ for hit in ipmmms_hitlist:
         # Go forward 8 bytes from Flag and read MMS message size in bytes
         sizevalue = -1
         try:
-            fbstore.seek(flagoffset + 0x8)
-            sizevalue = struct.unpack('<I', fbstore.read(4))[0]
+            sizevalue = read_uint32(flagoffset + 0x8)
         except:
             print("Bad Sent Message Size extraction at " + hex(flagoffset + 0x8).rstrip("L"))
             exctype, value = sys.exc_info()[:2]
@@ -462,8 +893,7 @@ for hit in ipmmms_hitlist:
         # Go back 0xDA bytes (218 dec) from Flag and check this store value is 0x07000000 (for SMS/MMS)
         storevalue = -1
         try:
-            fbstore.seek(flagoffset - 0xDA)
-            storevalue = struct.unpack('<I', fbstore.read(4))[0]
+            storevalue = read_uint32(flagoffset - 0xDA)
         except:
             print("Bad Sent Message Store extraction at " + hex(flagoffset - 0xDA).rstrip("L"))
             exctype, value = sys.exc_info()[:2]
@@ -476,8 +906,7 @@ for hit in ipmmms_hitlist:
             #print("Sent Store value OK")
             msgidvalue = -1
             try:
-                fbstore.seek(flagoffset - 0xDE)
-                msgidvalue = struct.unpack('<I', fbstore.read(4))[0]
+                msgidvalue = read_uint32(flagoffset - 0xDE)
             except:
                 print("Bad Sent Message Msgid extraction at " + hex(flagoffset - 0xDE).rstrip("L"))
                 exctype, value = sys.exc_info()[:2]
@@ -487,7 +916,7 @@ for hit in ipmmms_hitlist:
             
             try:
                 # Look up Recipient table phone number based on msgid
-                recip = recipients[msgidvalue]
+                recip = lookup_recipient(msgidvalue)
                 #print(recip)
                 phonestr = recip[1]
             except:
@@ -497,7 +926,7 @@ for hit in ipmmms_hitlist:
                 continue # skip hit if error
                 
             # If we get here, all Sent MMS Message data was extracted OK. So store it.
-            mmsdict[msgidvalue] = (timestamp3str, timestamp2str, phonestr, flagvalue, sizevalue)
+            store_message(msgidvalue, (timestamp3str, timestamp2str, phonestr, flagvalue, sizevalue))
             mmscount += 1
         else:
             print("Sent Message Store value not valid for MMS\n") # could be unexpected layout or attachment for another app (eg email)
@@ -528,7 +957,7 @@ for hit in ipmmms_hitlist:
             timestamp3off = funistore.tell() + 0xE
             fbstore.seek(timestamp3off)
             timestamp3raw = read_filetime(fbstore)
-            timestamp3str = datetime.datetime.utcfromtimestamp(timestamp3raw).isoformat()
+            timestamp3str = utc_isoformat(timestamp3raw)
         except:
             print("Bad Recv Message Timestamp3 extraction at " + hex(hit + 0xE).rstrip("L"))
             exctype, value = sys.exc_info()[:2]
@@ -548,7 +977,7 @@ for hit in ipmmms_hitlist:
             if (timestamp2raw != 0):
                 #print("timestamp2raw = " + hex(timestamp2raw))
                 # returns ISO UTC time string
-                timestamp2str = datetime.datetime.utcfromtimestamp(timestamp2raw).isoformat()
+                timestamp2str = utc_isoformat(timestamp2raw)
             else:
                 continue # skip this hit, timestamp2 should not be 0
         except:
@@ -568,7 +997,7 @@ for hit in ipmmms_hitlist:
             timestamp1raw = find_timestamp(fbstore, 0xC0, 0xB8)
             if (timestamp1raw != 0):
                 #print("timestamp1raw = " + hex(timestamp1raw))
-                timestamp1str = datetime.datetime.utcfromtimestamp(timestamp1raw).isoformat()
+                timestamp1str = utc_isoformat(timestamp1raw)
                 flagoffset = fbstore.tell()
             else:
                 continue # timestamp1 should not be 0
@@ -582,8 +1011,7 @@ for hit in ipmmms_hitlist:
         # Now read Flag value (just after Timestamp1)
         flagvalue = -1
         try:
-            fbstore.seek(flagoffset)
-            flagvalue = struct.unpack('<I', fbstore.read(4))[0]
+            flagvalue = read_uint32(flagoffset)
         except:
             print("Bad Recv Message Flag extraction at " + hex(flagoffset).rstrip("L"))
             exctype, value = sys.exc_info()[:2]
@@ -594,8 +1022,7 @@ for hit in ipmmms_hitlist:
         # Go forward 8 bytes from Flag and read MMS message size in bytes
         sizevalue = -1
         try:
-            fbstore.seek(flagoffset + 0x8)
-            sizevalue = struct.unpack('<I', fbstore.read(4))[0]
+            sizevalue = read_uint32(flagoffset + 0x8)
         except:
             print("Bad Recv Message Size extraction at " + hex(flagoffset + 0x8).rstrip("L"))
             exctype, value = sys.exc_info()[:2]
@@ -606,8 +1033,7 @@ for hit in ipmmms_hitlist:
         # Go back 0xDA (218 dec) bytes from Flag and check this store value is 0x07000000 (for SMS/MMS)
         storevalue = -1
         try:
-            fbstore.seek(flagoffset - 0xDA)
-            storevalue = struct.unpack('<I', fbstore.read(4))[0]
+            storevalue = read_uint32(flagoffset - 0xDA)
         except:
             print("Bad Recv Message Store extraction at " + hex(flagoffset - 0xDA).rstrip("L"))
             exctype, value = sys.exc_info()[:2]
@@ -620,8 +1046,7 @@ for hit in ipmmms_hitlist:
             #print("Store value OK")
             msgidvalue = -1
             try:
-                fbstore.seek(flagoffset - 0xDE)
-                msgidvalue = struct.unpack('<I', fbstore.read(4))[0]
+                msgidvalue = read_uint32(flagoffset - 0xDE)
             except:
                 print("Bad Recv Message Msgid extraction at " + hex(flagoffset - 0xDE).rstrip("L"))
                 exctype, value = sys.exc_info()[:2]
@@ -630,19 +1055,25 @@ for hit in ipmmms_hitlist:
             #print("msgidvalue = " + str(msgidvalue) + " at offset " + hex(flagoffset - 0xDE).rstrip("L"))
             
             # If we get here, all Recv MMS Message data was extracted OK. Store it.
-            mmsdict[msgidvalue] = (timestamp3str, timestamp2str, phonestr, flagvalue, sizevalue)
+            store_message(msgidvalue, (timestamp3str, timestamp2str, phonestr, flagvalue, sizevalue))
             mmscount += 1
         else:
             print("Recv Message Store value not valid for MMS\n") # could be unexpected layout or attachment for another app (eg email)
             continue
 
+stage_checkpoint("Message", len(ipmmms_hitlist), mmscount, True)
+
 fbstore.close()
 
 print("MMS sorted by msgid ...")
 print("===================================")
-sortedmmskeys = sorted(mmsdict.keys())
-for j in sortedmmskeys:
-    print("msgid = " + str(j) + " : " + str(mmsdict[j]))
+if (stagedb != None):
+    for row in stagedb.execute("SELECT msgid, timestamp3, timestamp2, phone, flag, size FROM messages ORDER BY msgid"):
+        print("msgid = " + str(row[0]) + " : " + str(tuple(row[1:])))
+else:
+    sortedmmskeys = sorted(mmsdict.keys())
+    for j in sortedmmskeys:
+        print("msgid = " + str(j) + " : " + str(mmsdict[j]))
 
 print("\nProcessed/Stored " + str(mmscount) + " out of " + str(len(ipmmms_hitlist)) + " Message hits\n")
 print("Printing finalized table sorted by Timestamp2 ...")
@@ -651,17 +1082,34 @@ print("Timestamp2\tMsgid\tTimestamp3\tPhone\tFlag\tTotalSize\tType\tFilesize\tFi
 if (options.outputfilename != None):
     outputfile.write("Timestamp2\tMsgid\tTimestamp3\tPhone\tFlag\tTotalSize\tType\tFilesize\tFilename0\tFilename1\tFilename2\n")
 
-# Get a list of mmsdict keys sorted by filetime2 (filesystem modified time)
-sorted_messages_keys = sorted(mmsdict, key = lambda x : (mmsdict[x][1], mmsdict[x][1])) 
+if (stagedb != None):
+    # Join the staged Message and Attachment rows in (Timestamp2, msgid) order (the rows are read one at a time from the query)
+    joinedrows = stagedb.execute("SELECT m.msgid, m.timestamp3, m.timestamp2, m.phone, m.flag, m.size, a.seq, a.file0, a.file1, a.file2, a.typeval, a.asize " + \
+        "FROM messages m LEFT JOIN attachments a ON a.msgid = m.msgid ORDER BY m.timestamp2, m.msgid, a.seq")
+    for j, rows in itertools.groupby(joinedrows, lambda row : row[0]):
+        try:
+            for row in rows: # there may be more than 1 attachment per msgid/MMS
+                if (row[6] == None):
+                    raise KeyError(j) # no attachments (same as the in-memory lookup below)
+                finalstr = mms_tsvline(j, row[1:6], row[7:12])
+                print(finalstr)
+                if (options.outputfilename != None):
+                    outputfile.write(finalstr)
+        except:
+            print("Problems finding/writing Attachment entries for msgid = " + str(j) + " ... Skipping\n")
+            exctype, value = sys.exc_info()[:2]
+            print("Exception type = ",exctype,", value = ",value)
+            continue
+    stagedb.close()
+
+# Get a list of mmsdict keys sorted by filetime2 (filesystem modified time) then msgid (same order as the staged query)
+# (mmsdict is empty if the rows were staged)
+sorted_messages_keys = sorted(mmsdict, key = lambda x : (mmsdict[x][1], x)) 
 for j in sorted_messages_keys: 
-    # Print order for each MMS should start with Timestamp2, msgid, Timestamp3, phonestr, flagvalue, totalsize
-    printmsgstr = str(mmsdict[j][1]) + "\t" + str(j) + "\t" + str(mmsdict[j][0]) + "\t" + str(mmsdict[j][2]) + "\t" + str(mmsdict[j][3]) + "\t" + str(mmsdict[j][4]) + "\t"
-    attachstr = ""
     try:
         #print("\nNo. Attachments for msgid = " + str(j) + " is " + str(len(attachments[j])))
         for k in range(len(attachments[j])): # there may be more than 1 attachment per msgid/MMS
-            # Print order (for each attachment) becomes printmsg, typeval, filesize, file0, file1, file2 
-            finalstr =  printmsgstr + str(attachments[j][k][3]) + "\t" + str(attachments[j][k][4]) + "\t" + str(attachments[j][k][0]) + "\t" + str(attachments[j][k][1]) + "\t" + str(attachments[j][k][2]) + "\n"
+            finalstr = mms_tsvline(j, mmsdict[j], attachments[j][k])
             print(finalstr)
             if (options.outputfilename != None):
                 outputfile.write(finalstr)
@@ -674,6 +1122,9 @@ for j in sorted_messages_keys:
 if (options.outputfilename != None):
     outputfile.close()
 
+if (storemap != None):
+    storemap.close()
+
 print("Finished processing " + options.storefile + " ... Exiting ...")
 
 
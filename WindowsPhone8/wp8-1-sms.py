@@ -68,7 +68,8 @@ Program Notes:
 ==============
 Given a specified input store.vol and output TSV filename, this script will
 - Search for "SMStext" entries (in Area 1 ie "Message" table) and store the sent/recvd direction, FILETIME2, Text message, Offset of the Text Message and PHONE1.
-- For any sent SMS, it will also look up the destination phone number (in Area 2 ie "Recipient" table) using FILETIME2 / FILETIMEX as a key.
+- For any sent SMS, it will also look up the destination phone number (in Area 2 ie "Recipient" table) using FILETIME2 / FILETIMEX as a key
+  (the nearest FILETIMEX within -t FILETIME ticks of FILETIME2).
 - Print out results to a nominated Tab Separated Variable file format (screen output is not typically large enough)
 
 Known Issues:
@@ -115,6 +116,29 @@ v2015-08-26:
 - Adjusted FILETIME2 offsets for Lumia 530 WinPhone 8.10
 - Added some debug printing for auditing false hits
 
+v2026-10-17:
+- Added -m option to search a memory mapped view of the input file (no chunk copies/DELTA overlaps)
+- Searches for "SMStext" and "SMS" in one pass over the input file (see "multisearch")
+- Added -p option to search the input file with a pool of worker processes
+- Hits are now streamed from generator versions of the search functions so records are parsed as they are found
+  (sent SMS phone numbers are looked up from the sms log after all hits are processed)
+- Added -c option to store/re-use search hits in a hit index file (with -i to re-create it and -v to verify it)
+- read_nullterm_unistring now reads/decodes blocks instead of one character at a time (see "decode_nullterm_unistring")
+- find_timestamp now reads its search window once and only checks likely FILETIME offsets (see "FILETIME_MSB_RE")
+- Input file can be the first segment of a split raw image (eg image.001) which reads all segments as one file (see "splitimage.py")
+- Timestamps are formatted through a least recently used cache of ISO date strings (see "utc_isoformat" in "wp8common.py")
+- Sent SMS phone numbers are looked up from a sorted list of the raw sms log FILETIMEs (instead of a dictionary keyed by
+  ISO date strings) with -t option to set the match tolerance (see "find_recipient")
+- Added -P option to learn the FILETIME2 offsets of the current device from the first -n timestamp searches and save them to a
+  device profile file. Later hits (and runs re-using the profile) only probe those offsets, most likely first (see "find_sms_timestamp")
+- Added -d option to decode the hits with a pool of worker processes, each reading a memory mapped view of the input file.
+  Results (and skip counts) are merged back in hit order (see "idecodehits"). With -p as well, the parallel search
+  finishes before the decode workers are started
+- Added -u option to drop duplicate SMS records (same FILETIME2, direction, phone number and text) as they are decoded.
+  The offsets of the duplicates are listed in a Duplicate_Offsets column of the first copy (see "RecordDeduper")
+  and -e sets how many distinct records are remembered exactly (beyond that a Bloom filter is used)
+  until it fills up, after which records are passed through and counted in the summary and Duplicate_Offsets header
+
 """
 
 import codecs
@@ -126,48 +150,123 @@ from optparse import OptionParser
 import re
 import os
 import math
-
-version_string = "wp8-1-sms.py v2015-08-26"
+import mmap
+import multiprocessing
+import heapq
+import sre_parse
+import sre_constants
+import json
+import bisect
+import cStringIO
+# Split raw image helpers are shared with the other scripts (see utilities/splitimage.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "utilities"))
+from splitimage import SplitImage, open_image, image_stat
+# Helpers shared by the WP8 scripts in this directory (see wp8common.py)
+from wp8common import utc_isoformat, image_identity, hitindex_path, load_hitindex, save_hitindex, recordhits, RecordDeduper
+
+version_string = "wp8-1-sms.py v2026-10-17"
 CHUNK_SIZE = 2000000000 # max value of CHUNK_SIZE + DELTA is 2147483647 (C long limit with Python 2)
 DELTA = 1100 # read this extra bit to catch any hits crossing chunk boundaries. Should be AT LEAST max size of record being searched for.
-
-# Read in unicode chars one at a time until a null char ie "0x00 0x00"
-# Returns empty string on error otherwise it filters out return/newlines and returns the string read
-def read_nullterm_unistring(f):
-    readstrg = ""
-    readchar = 0xABCD
-    flag = True
-    unprintablechars = False
-    begin = f.tell()
-    
-    while (flag):
-        try:
-            #print "char at " + hex(f.tell()).rstrip("L")
-            readchar = f.read(1)
-            if (readchar == unichr(0)): # bailout if null char
-                flag = False
-            if (flag):
-                if (readchar in string.printable) and (readchar != "\r") and (readchar != "\n"):
-                    readstrg += readchar
-                else:
-                    readstrg += " "
-                    unprintablechars = True
-                    #print "unprintable at " + hex(f.tell()-1).rstrip("L")
-        except:
-            print "Warning ... bad unicode string at offset " + hex(begin).rstrip("L")
-            exctype, value = sys.exc_info()[:2]
-            print ("Exception type = ",exctype,", value = ",value) 
-            #readstrg = ""
-            return readstrg # returns partial strings
+PARALLEL_RANGE_SIZE = 67108864 # max size of each range searched by a "parallelsearchMulti" worker process (64 MB)
+UNISTRING_WINDOW = 256 # initial number of bytes read when looking for the end of a null terminated Unicode string
+# Characters replaced with a space when extracting Unicode strings ie not in string.printable (or "\r", "\n").
+# A UTF-16 surrogate pair (ie 2 chars on narrow Python builds) counts as one character.
+UNPRINTABLE_RE = re.compile(u"[\ud800-\udbff][\udc00-\udfff]|[^\t\x0b\x0c\x20-\x7e]")
+# The 2 most significant bytes of a FILETIME in the "read_filetime" sanity range (0x01CD000000000000 to 0x01D9000000000000)
+FILETIME_MSB_RE = re.compile("[\xcd-\xd9]\x01")
+DECODE_BATCH = 256 # number of hits decoded by each "decodehits" worker task
+decodefb = None # memory mapped view of the input file used by "decodehits" worker processes (see "initdecoder")
+decodefuni = None # UTF-16LE codecs reader of decodefb
+DEDUPE_BUDGET = 1000000 # default number of distinct records remembered exactly by "RecordDeduper" (-e)
+PROFILE_MAGIC = "WP8SMSPROFILE1" # first line of a device profile file (see "save_profile")
+PROFILE_SAMPLES = 100 # default number of timestamp searches sampled to learn a device profile
+FILETIME_TOLERANCE = 10000000 # default max difference (in 100 ns FILETIME ticks ie 1 sec) between a sent SMS FILETIME2 and its sms log FILETIMEX
+
+# Decodes a UTF-16LE null terminated string starting at "offset" of a binary file.
+# Reads blocks of the file (starting with UNISTRING_WINDOW bytes and doubling) until "find" locates a 2 byte aligned
+# null terminator then decodes the whole string in one go.
+# Returns (decoded string without the null, file offset after the null, decode exception or None).
+# On a decode error, returns the characters before the bad character and the offset after the bad character's bytes
+# (ie the same result as reading the string one character at a time with a codecs reader).
+# If there is no null terminator, returns what could be read up to the end of the file.
+def decode_nullterm_unistring(fd, offset):
+    fd.seek(offset)
+    buf = ""
+    nullpos = -1
+    readsize = UNISTRING_WINDOW
+    while (nullpos < 0):
+        block = fd.read(readsize)
+        if (block == ""):
+            break # EOF and no null terminator
+        searchpos = len(buf) # buf is always an even length here so an aligned null cannot span two blocks
+        buf += block
+        nullpos = buf.find("\x00\x00", searchpos)
+        while ((nullpos >= 0) and (nullpos % 2)):
+            nullpos = buf.find("\x00\x00", nullpos + 1)
+        readsize = min(readsize * 2, 1048576)
+
+    if (nullpos >= 0):
+        data = buf[:nullpos + 2] # decode the null too so a bad char right before it fails like a character at a time read
+    else:
+        data = buf[:len(buf) - (len(buf) % 2)]
+    try:
+        decoded = data.decode("utf-16-le")
+    except UnicodeDecodeError:
+        # Decode the bad character's bytes incrementally (like a codecs reader does) to get the same error and end offset
+        charstart = sys.exc_info()[1].start
+        buf += fd.read(4)
+        for size in range(1, len(buf) - charstart + 1):
+            try:
+                codecs.utf_16_le_decode(buf[charstart:charstart + size], "strict", False)
+            except UnicodeDecodeError:
+                return (buf[:charstart].decode("utf-16-le"), offset + charstart + size, sys.exc_info()[1])
+        return (buf[:charstart].decode("utf-16-le"), offset + len(buf), None)
+    if (nullpos >= 0):
+        return (decoded[:-1], offset + nullpos + 2, None)
+    return (decoded, offset + len(data), None)
+
+# Extracts a null terminated UTF-16LE string starting at "offset" of a binary file (see "decode_nullterm_unistring").
+# Characters not in string.printable (and "\r", "\n") are replaced with a space.
+# Returns (string, file offset after the null terminator, True if any characters were replaced).
+# Returns the partial string on a decode error.
+def extract_nullterm_unistring(fd, offset):
+    decoded, endoffset, decodeerror = decode_nullterm_unistring(fd, offset)
+    readstrg, numsubs = UNPRINTABLE_RE.subn(u" ", decoded)
+    if (len(readstrg) == numsubs):
+        readstrg = str(readstrg) # no printable chars so return a str as before (callers may test 'is ""')
+    if (decodeerror != None):
+        print "Warning ... bad unicode string at offset " + hex(offset).rstrip("L")
+        print ("Exception type = ",type(decodeerror),", value = ",decodeerror) 
+        return (readstrg, endoffset, numsubs > 0) # returns partial strings
     
-    if (unprintablechars):
-        print "String substitution(s) due to unrecognized/unprintable characters at " + hex(begin).rstrip("L")
+    if (numsubs > 0):
+        print "String substitution(s) due to unrecognized/unprintable characters at " + hex(offset).rstrip("L")
     
+    return (readstrg, endoffset, numsubs > 0)
+
+# Read in a null terminated Unicode string from a codecs reader (ie starting at the reader's current file offset).
+# Returns the string and leaves the reader positioned after the null terminator (see "extract_nullterm_unistring").
+def read_nullterm_unistring(f):
+    readstrg, endoffset, unprintablechars = extract_nullterm_unistring(f.stream, f.tell())
+    f.seek(endoffset)
     return readstrg
 
 # Read in 8 byte MS FILETIME (number of 100 ns since 1 Jan 1601) and 
 # Returns equivalent unix epoch offset or 0 on error
 def read_filetime(f):
+    return filetime_to_unix(read_rawfiletime(f))
+
+# Converts a FILETIME (number of 100 ns since 1 Jan 1601) to a unix epoch offset (0 stays 0 ie error)
+def filetime_to_unix(mstime):
+    if (mstime == 0):
+        return 0
+    # From https://libforensics.googlecode.com/hg-history/a41c6dfb1fdbd12886849ea3ac91de6ad931c363/code/lf/utils/time.py
+    # Function filetime_to_unix_time(filetime)
+    return (mstime - 116444736000000000) // 10000000
+
+# Read in 8 byte MS FILETIME (number of 100 ns since 1 Jan 1601)
+# Returns the raw FILETIME value or 0 on error/if it fails the date range sanity check
+def read_rawfiletime(f):
     begin = f.tell()
     try:
         #print "time at offset: " + str(begin)
@@ -186,14 +285,13 @@ def read_filetime(f):
     if (mstime < 0x01CD000000000000) or (mstime > 0x01D9000000000000):
         #print "Bad filetime value!"
         return 0
-    # From https://libforensics.googlecode.com/hg-history/a41c6dfb1fdbd12886849ea3ac91de6ad931c363/code/lf/utils/time.py
-    # Function filetime_to_unix_time(filetime)
-    unixtime = (mstime - 116444736000000000) // 10000000
-    return unixtime
+    return mstime
 
 # Find all indices of the "pattern" regular expression in a given string (using regex)
 # Where pattern is a compiled Python re pattern object (ie the output of "re.compile")
-def regsearch(bigstring, pattern, listindex=[]):
+def regsearch(bigstring, pattern, listindex=None):
+    if (listindex == None):
+        listindex = [] # a new list for each call (a default list would be shared between calls)
     hitsit = pattern.finditer(bigstring)
     for it in hitsit:
         # iterators only last for one shot so we capture the offsets to a list
@@ -204,11 +302,11 @@ def regsearch(bigstring, pattern, listindex=[]):
 # If we see a digit, we know its a received SMS
 def find_flag(f):
     begin = f.tell()
-    #fb.seek(begin - 0xD) # last digit offset 
-    fb.seek(begin - 0x11) # usually the 3rd last digit offset but can be the last digit eg 1SEP DUB data
-    val = struct.unpack("B", fb.read(1))[0]
+    #f.seek(begin - 0xD) # last digit offset 
+    f.seek(begin - 0x11) # usually the 3rd last digit offset but can be the last digit eg 1SEP DUB data
+    val = struct.unpack("B", f.read(1))[0]
     if (val >= 0x30) and (val <= 0x39):
-        val2 = struct.unpack("B", fb.read(1))[0]
+        val2 = struct.unpack("B", f.read(1))[0]
         if (val2 == 0x00):
             return val # 0x30 0x00 to 0x39 0x00 (corresponds to Unicode for "0" to "9")    
         else:
@@ -219,20 +317,132 @@ def find_flag(f):
 # Searches backwards for a valid timestamp from a given file ptr and range
 # Returns 0 if error or not found otherwise returns unix timestamp value
 def find_timestamp(f, maxoffset, minoffset):
+    return filetime_to_unix(find_rawtimestamp(f, maxoffset, minoffset))
+
+# Searches backwards for a valid timestamp from a given file ptr and range
+# Returns 0 if error or not found otherwise returns the raw FILETIME value
+# Reads the whole window of candidate offsets once then only checks offsets whose 2 most significant bytes are in the
+# "read_filetime" sanity range (found with FILETIME_MSB_RE) instead of seeking/reading 8 bytes at every offset.
+# Offsets are checked in the same order as before (minoffset first) and the file ptr is left after the returned FILETIME.
+def find_rawtimestamp(f, maxoffset, minoffset):
     begin = f.tell()
-    # maxoffset is inclusive => need range from minoffset : maxoffset+1
-    for i in range(minoffset, maxoffset+1, 1):
-        if ((begin - i) < 0):
-            return 0 # FILETIME can't be before start of file
-        else:
-            f.seek(begin-i)
-            value = read_filetime(f)
-            if (value != 0):
-                return value
-            #otherwise keep searching until maxoffset
+    if (maxoffset < minoffset):
+        return 0
+    highest = begin - minoffset # first offset checked
+    if (highest < 0):
+        return 0 # FILETIME can't be before start of file
+    lowest = max(0, begin - maxoffset) # last offset checked
+    f.seek(lowest)
+    window = f.read(highest + 8 - lowest)
+    fullend = lowest + len(window) - 8 # highest offset with 8 bytes before EOF
+    # Offsets too close to EOF for a FILETIME. Let "read_filetime" report them as before.
+    for offset in range(highest, max(fullend, lowest - 1), -1):
+        f.seek(offset)
+        read_rawfiletime(f)
+    # Check the remaining candidates (highest offset first)
+    candidates = [m.start() - 6 for m in FILETIME_MSB_RE.finditer(window, 6)]
+    for idx in reversed(candidates):
+        if (idx + lowest > min(highest, fullend)):
+            continue
+        mstime = struct.unpack('<Q', window[idx:idx + 8])[0]
+        if (mstime >= 0x01CD000000000000) and (mstime <= 0x01D9000000000000):
+            f.seek(lowest + idx + 8)
+            return mstime
     # if we get here, we haven't found a valid timestamp, so return 0
+    f.seek(lowest + min(8, len(window)))
     return 0
 
+# Checks for a valid FILETIME at each learned offset (ie number of bytes before "base") of a device profile, in the order given.
+# Offsets outside of the find_rawtimestamp search range for the hit (maxoffset/minoffset) are not checked.
+# Returns the first valid raw FILETIME found (leaving the file ptr after it) or 0 if none of the offsets hold one.
+def probe_timestamp(f, hit, base, offsets, maxoffset, minoffset):
+    for offset in offsets:
+        pos = base - offset
+        if ((pos < 0) or (pos < hit - maxoffset) or (pos > hit - minoffset)):
+            continue
+        f.seek(pos)
+        data = f.read(8)
+        if (len(data) == 8):
+            mstime = struct.unpack('<Q', data)[0]
+            if (mstime >= 0x01CD000000000000) and (mstime <= 0x01D9000000000000):
+                return mstime
+    return 0
+
+# Finds the FILETIME2 of a "SMStext" hit (searching from maxoffset to minoffset bytes before the hit).
+# base is the position the profile offsets are measured from (the hit for Sent SMS, the hit less the PHONE0 bytes for
+# Recvd SMS as FILETIME2 moves with the phone number length) and direction is "Sent" or "Recvd".
+# With a device profile, the learned offsets are probed first and the whole range is only searched if none of them are valid.
+# While calibrating (-P without a valid profile file), the whole range is searched and the offset of each FILETIME found
+# is counted. Once options.samples have been counted, the profile is saved and used for the remaining hits.
+# Returns the raw FILETIME or 0 if not found.
+def find_sms_timestamp(f, hit, base, direction, maxoffset, minoffset):
+    global profile, profilecounts
+    if (profile != None):
+        filetime = probe_timestamp(f, hit, base, profile[direction], maxoffset, minoffset)
+        if (filetime != 0):
+            profilestats["probed"] += 1
+            return filetime
+        profilestats["searched"] += 1
+    f.seek(hit)
+    filetime = find_rawtimestamp(f, maxoffset, minoffset)
+    if ((profilecounts != None) and (filetime != 0)):
+        offset = base - (f.tell() - 8)
+        profilecounts[direction][offset] = profilecounts[direction].get(offset, 0) + 1
+        if (sum([sum(counts.values()) for counts in profilecounts.values()]) >= options.samples):
+            profile = profile_offsets(profilecounts)
+            if (save_profile(options.profilefile, profilecounts)):
+                print "Saved device profile file " + options.profilefile + " (" + str(len(profile["Sent"])) + " Sent, " + str(len(profile["Recvd"])) + " Recvd offsets)"
+            profilecounts = None
+    return filetime
+
+# Returns the learned offsets for each direction ordered by how often they were seen (most likely first)
+# given a dictionary of {offset : count} for each direction
+def profile_offsets(counts):
+    offsets = {}
+    for direction in ["Sent", "Recvd"]:
+        offsets[direction] = sorted(counts.get(direction, {}), key = lambda x : (-counts[direction][x], x))
+    return offsets
+
+# Reads a device profile file and returns its learned offsets for each direction (see "profile_offsets").
+# Returns None if the profile file cannot be read.
+# File format: PROFILE_MAGIC line then a JSON line of {"Sent" : [[offset, count], ...], "Recvd" : [[offset, count], ...], ...}
+def load_profile(path):
+    try:
+        pf = open(path, "rb")
+        magic = pf.readline().rstrip("\n")
+        header = json.loads(pf.readline())
+        pf.close()
+        if (magic != PROFILE_MAGIC):
+            return None
+        counts = {}
+        for direction in ["Sent", "Recvd"]:
+            counts[direction] = dict([(int(offset), int(count)) for offset, count in header[direction]])
+    except:
+        return None
+    return profile_offsets(counts)
+
+# Writes the offset counts (for each direction) to a device profile file. See "load_profile" for the format.
+# Writes to a temporary file first so an interrupted run cannot leave a partial profile behind.
+def save_profile(path, counts):
+    offsets = profile_offsets(counts)
+    header = {"version" : version_string}
+    for direction in ["Sent", "Recvd"]:
+        header[direction] = [[offset, counts[direction][offset]] for offset in offsets[direction]]
+    try:
+        pf = open(path + ".tmp", "wb")
+        pf.write(PROFILE_MAGIC + "\n")
+        pf.write(json.dumps(header, sort_keys=True) + "\n")
+        pf.close()
+        if (os.path.exists(path)):
+            os.remove(path) # os.rename will not replace an existing file on Windows
+        os.rename(path + ".tmp", path)
+    except:
+        print("Trouble writing device profile file " + path)
+        exctype, value = sys.exc_info()[:2]
+        print("Exception type = ",exctype,", value = ",value)
+        return False
+    return True
+
 # Takes a binary file ptr, a starting offset and reads bytes until it finds 0x1 or the maxbytes limit.
 # Returns True if 0x1 found, False otherwise
 # Used to get to the next field offset (assuming they are separated by a byte value of 0x1. 
@@ -245,154 +455,37 @@ def goto_next_field(f, offset, maxbytes):
             return True
     return False
 
-# Searches chunks of a file (using RE) and returns file offsets of any hits.
-# Intended for searching of large files where we cant read the whole thing into memory
-# This function calls the "regsearch" search method
-def sliceNsearchRE(fd, chunksize, delta, term):
-    final_hitlist = [] # list of file offsets which contain the search term
-    pattern = re.compile(term, re.DOTALL) # should only really call this once at start, if same substring.
-    stats = os.fstat(fd.fileno())
-    #print("sliceNsearchRE Input file " + " is " + str(stats.st_size) + " bytes\n")
-    begin_chunk = 0
-    #print("chunksize = " + str(chunksize))
-
-    # Handle if filesize is less than CHUNK_SIZE (eg store.vol instead of image.bin)
-    # Should be able to read whole file in 1 chunk 
-    if (chunksize >= stats.st_size):
-        fd.seek(begin_chunk)
-        raw = fd.read()
-        final_hitlist = regsearch(raw, pattern, [])
-        #print(str(len(final_hitlist)) + " hits found in 1 chunk for " + str(term))
-    else:
-        # Filesize is greater than 1 chunk, need to loop thru
-        numchunks = int(math.ceil(float(stats.st_size) / chunksize))
-        #print("numchunks required = " + str(numchunks))
-        chunk_size_to_read = chunksize + delta
-        for chunknum in range(numchunks):
-            if ((chunk_size_to_read + begin_chunk) > stats.st_size):
-                chunk_size_to_read = stats.st_size - begin_chunk # last chunk only gets until end of file
-            #print("seeking " + str(begin_chunk) + " with size = " + str(chunk_size_to_read))
-            fd.seek(begin_chunk)
-            rawchunk = fd.read(chunk_size_to_read)
-            subhits = regsearch(rawchunk, pattern, [])
-            #print(str(len(subhits)) + " hits found at " + str(subhits))
-            # Items in subhits will be offsets relative to the start of the rawchunk (not relative to the file)
-            # Need to adjust offsets ...
-            for hit in subhits :
-                if (hit < chunksize) :
-                    final_hitlist.append(begin_chunk + hit)
-                    #print("adding " + str(begin_chunk + hit) + " to list")
-                elif (hit >= chunksize) :
-                    #print("ignoring " + str(begin_chunk + hit) + " to list")
-                    break # don't care if we get here because hit should be processed in next chunk
-                    # subhits can start at index 0 so possible hit offsets are 0 to chunksize-1 inclusive
-            begin_chunk += chunksize
-    #print("final_hitlist = " + str(final_hitlist))
-    return(final_hitlist)
-
-# Main
-print "Running " + version_string + "\n"
-
-usage = " %prog -f inputfile -o outputfile"
-
-# Handle command line args
-parser = OptionParser(usage=usage)
-parser.add_option("-f", dest="filename", 
-                  action="store", type="string",
-                  help="Input File To Be Searched")
-parser.add_option("-o", dest="tsvfile",
-                  action="store", type="string",
-                  help="Tab Separated Output Filename")
-(options, args) = parser.parse_args()
-
-# Check if no arguments given by user, exit
-if len(sys.argv) == 1:
-    parser.print_help()
-    exit(-1)
-if (options.filename == None) :
-    parser.print_help()
-    print "\nInput filename incorrectly specified!"
-    exit(-1)
-if (options.tsvfile == None) :
-    parser.print_help()
-    print "\nOutput filename incorrectly specified!"
-    exit(-1)
-
-# Open store.vol for unicode encoded text reads
-try:
-	funi = codecs.open(options.filename, encoding="utf-16-le", mode="r")
-except:
-    print ("Input File Not Found (unicode attempt)")
-    exit(-1)
-
-# Open store.vol for binary byte ops (eg timestamps)
-try:
-	fb = open(options.filename, "rb")
-except:
-    print ("Input File Not Found (binary attempt)")
-    exit(-1)
-
-# search the file chunks for the hex equivalent of "SMStext" which marks SMS Text content (ie Area 1)
-substring1 = "\x53\x00\x4d\x00\x53\x00\x74\x00\x65\x00\x78\x00\x74\x00\x00\x00" #ie "SMStext"
-hits = sliceNsearchRE(fb, CHUNK_SIZE, DELTA, substring1)
-#print "SMStext hits = " + str(len(hits))
-
-# search for "SMS" which marks the SMS log entries (ie Area 2 times and phone number)
-# this will include SMStext hits so we need to some de-duping afterwards
-substring2 = "\x53\x00\x4d\x00\x53\x00\x00\x00" # ie "SMS"
-smshits = sliceNsearchRE(fb, CHUNK_SIZE, DELTA, substring2)
-#print "SMS hits = " + str(len(smshits)) + " smshits"
-
-# Filter smshits further (the hits above will include some false positives eg "SMStext")
-smslogdict = {}
-# for each valid "SMS" log hit, grab the filetime and phone number for later use
-for smshit in smshits:
-    # go back 2 bytes and check for "@" (0x40) and process as sms log entry if required
-    fb.seek(smshit - 2)
-    val = struct.unpack("B", fb.read(1))[0]
-    if (val == 0x40):
-        #print "sms log hit = " + hex(smshit - 2).rstrip("L")
-        # Get sms log filetime associated with this SMS (ASS-UME it matches with FILETIME2 retrieved later)
-        fb.seek(smshit - 0x23) # seek to 1st byte of FILETIMEX
-        smstimeval = read_filetime(fb)
-        smstimestring = ""
-        if (smstimeval != 0):
-            try:
-                # returns UTC time
-                smstimestring = datetime.datetime.utcfromtimestamp(smstimeval).isoformat()
-            except:
-                smstimestring = "Error" # if we get here, the hit is a false one. The date at this offset is not valid
-                continue
-            #print "SMS log Time2 (UTC) = " + smstimestring
-        else:
-            # must be wrong offset / read error so ignore this hit
-            continue
-
-        # Retrieve phone number string (PHONEX) from sms log
-        funi.seek(smshit + 0x9) # seek to 1st byte of phone num
-        smsnumstring = read_nullterm_unistring(funi)
-        #print "SMS log # = " + smsnumstring + "\n"
-        if ( (smstimestring not in smslogdict.keys()) and (smsnumstring != "") ):
-            # If not already there and not an empty string, store phone number in dictionary keyed by time
-            smslogdict[smstimestring] = smsnumstring
-
-#print "smslogdict = " + str(len(smslogdict.keys()))    
-    
-# storage variable for printing parsed data to TSV later
-sms_entries = {}
-failednexthits = 0
-badreadPHONE1 = 0
-badfindPHONE2 = 0
-badreadPHONE2 = 0
-badfindPHONE2 = 0
-badreadPHONE3 = 0
-badrecvmsg = 0
-failednexthitlist = []
-badfindPHONE2list = []
-badrecvmsglist = []
-
-# for each "SMStext" hit
-for hit in hits:
+# Returns the phone number of the sms log (Area 2) entry whose FILETIMEX is nearest to a sent SMS FILETIME2
+# (and no more than "tolerance" ticks away) or None if there is no such entry.
+# logtimes is the sorted list of sms log FILETIMEs and lognumbers the phone number for each FILETIME (see "sort_smslog").
+# Equally near entries are resolved in favour of the earlier FILETIME.
+def find_recipient(logtimes, lognumbers, filetime, tolerance):
+    idx = bisect.bisect_left(logtimes, filetime - tolerance)
+    best = None
+    while ((idx < len(logtimes)) and (logtimes[idx] <= filetime + tolerance)):
+        if ((best == None) or (abs(logtimes[idx] - filetime) < abs(logtimes[best] - filetime))):
+            best = idx
+        idx += 1
+    if (best == None):
+        return None
+    return lognumbers[best]
+
+# Sorts the (FILETIME, phone number) sms log entries by FILETIME and returns (list of FILETIMEs, list of phone numbers).
+# Only the first entry (in file order) for each FILETIME is kept.
+def sort_smslog(smslog):
+    logtimes = []
+    lognumbers = []
+    for filetime, number in sorted(smslog, key = lambda x : x[0]): # stable sort so file order is kept for each FILETIME
+        if ((len(logtimes) == 0) or (logtimes[-1] != filetime)):
+            logtimes.append(filetime)
+            lognumbers.append(number)
+    return logtimes, lognumbers
+
+# Decodes the "SMStext" (Area 1) record at a hit using a binary file object (fb) and a UTF-16LE codecs reader (funi) of the input file.
+# Returns (skip reason, SMS string offset, (timestring, sentflag, phonestring, unistring), raw FILETIME2).
+# skip reason is None if the record was decoded otherwise the name of the skip counter (eg "failednexthits").
+# Sent SMS phone numbers are "Unknown" until they are looked up in the sms log (see "find_recipient").
+def decode_smstext(fb, funi, hit):
     nums_listed = -1
     string_offset = 0
     unistring = ""
@@ -422,9 +515,7 @@ for hit in hits:
     found_next_field = goto_next_field(fb, offset_after_IPMSMStext, 3)
     if (not found_next_field):
         print "Skipping hit at " + hex(hit) + " - cannot find next field after SMStext"
-        failednexthits += 1
-        failednexthitlist.append(hit)
-        continue # can't find next field so skip this hit
+        return ("failednexthits", 0, None, 0) # can't find next field so skip this hit
 
     #print "found next string after IPM.SMStext at " + hex(fb.tell()).rstrip("L")
     # we are either at beginning of sms string (sent) or at beginning of list of 3 null terminated phone numbers (each *usually* separated by 1 byte ... for recvd)
@@ -442,8 +533,7 @@ for hit in hits:
         phonestring1 = read_nullterm_unistring(funi)
         if (phonestring1 == ""):
             print "Skipping hit at " + hex(hit) + " - cannot read PHONE1 field"
-            badreadPHONE1 += 1
-            continue # skip this hit if empty string
+            return ("badreadPHONE1", 0, None, 0) # skip this hit if empty string
         phonestring = phonestring1 # just collect the first phone string for printing at this time
         #print phonestring1
 
@@ -451,29 +541,24 @@ for hit in hits:
         found_next_field = goto_next_field(fb, offset_after_string, 3)
         if (not found_next_field):
             print "Skipping hit at " + hex(hit) + " - cannot find PHONE2 field"
-            badfindPHONE2 += 1
-            badfindPHONE2list.append(hit)
-            continue # can't find next field so skip this hit
+            return ("badfindPHONE2", 0, None, 0) # can't find next field so skip this hit
         funi.seek(fb.tell())
         phonestring2 = read_nullterm_unistring(funi)
         if (phonestring2 == ""):
             print "Skipping hit at " + hex(hit) + " - cannot read PHONE2 field"
-            badreadPHONE2 += 1
-            continue # skip this hit if empty string
+            return ("badreadPHONE2", 0, None, 0) # skip this hit if empty string
         #print phonestring2
 
         offset_after_string = funi.tell()
         found_next_field = goto_next_field(fb, offset_after_string, 3)
         if (not found_next_field):
             print "Skipping hit at " + hex(hit) + " - cannot find PHONE3 field"
-            badfindPHONE3 += 1
-            continue # can't find next field so skip this hit
+            return ("badfindPHONE3", 0, None, 0) # can't find next field so skip this hit
         funi.seek(fb.tell())
         phonestring3 = read_nullterm_unistring(funi)
         if (phonestring3 == ""):
             print "Skipping hit at " + hex(hit) + " - cannot read PHONE3 field"
-            badreadPHONE3 += 1
-            continue # skip this hit if empty string
+            return ("badreadPHONE3", 0, None, 0) # skip this hit if empty string
         #print phonestring3
         #print "Number(s): " + phonestring1 + ", " + phonestring2 + ", " + phonestring3
 
@@ -481,16 +566,14 @@ for hit in hits:
         found_next_field = goto_next_field(fb, offset_after_string, 3)
         if (not found_next_field):
             print "Skipping hit at " + hex(hit) + " - cannot find Received text field"
-            badrecvmsg += 1
-            badrecvmsglist.append(hit)
-            continue # can't find next field so skip this hit
+            return ("badrecvmsg", 0, None, 0) # can't find next field so skip this hit
 
         string_offset = fb.tell()
         funi.seek(string_offset)
         unistring = read_nullterm_unistring(funi)
         #print "Text (" + hex(string_offset).rstrip("L")  +"): " + unistring
 
-    timeval = 0
+    filetime = 0
     if (nums_listed == 0):
         # Original method: Manual adjustment of FILETIME2 offset value
         # Offsets between begin of FILETIME2 and begin of "SMStext" string for Sent SMS 
@@ -507,10 +590,9 @@ for hit in hits:
         # From test data, maximum offset was 0xBF. 
         # Allowing for some tolerance => 0xBF + 5 = 0xC4 as max offset
         # Some adjustment may be required for other data sets
-        fb.seek(hit)
         #timeval = find_timestamp(fb, 0xC4, 0xAF)
         #timeval = find_timestamp(fb, 0xEA+0x5, 0x7D) # Based on 30AUG DUB data, change the max offset to 0xEA + 5 = 0xEF, Based on 1SEP data change min to x7D (from 0xAF)
-        timeval = find_timestamp(fb, 0x12C, 0x7D) # Based on 530 data
+        filetime = find_sms_timestamp(fb, hit, hit, "Sent", 0x12C, 0x7D) # Based on 530 data
     if (nums_listed == 1):
         # Old method: This doesnt handle variable length phone numbers
         # Offsets between begin of FILETIME2 and begin of "SMStext" string for Recvd SMS 
@@ -537,13 +619,13 @@ for hit in hits:
         # From the test data, we can see a minimum offset of 0xDF (223 dec) for 13 digits (ie DUB2). 
         # So for the theoretical minimum of 1 digit, this projects to 0xC7 (199 dec).
         # Add in some tolerance and we will use 0xBD (189 dec) for our min offset between FILETIME2 and "SMStext"
-        fb.seek(hit)
         #timeval = find_timestamp(fb, 0xFA, 0xBD)
         #timeval = find_timestamp(fb, 0xFA, 0x9B) # Based on 30AUG DUB data, change the min offset to 0xB8 - 5
         # Based on MPD log file data, changed min offset to 0x9B
         #timeval = find_timestamp(fb, 0x120, 0x9B) # Based on Garda test data changed max offset to 0x120
-        timeval = find_timestamp(fb, 0x157, 0x9B) # Based on 530 data changed max offset to 0x12C then 0x157
+        filetime = find_sms_timestamp(fb, hit, hit - len(phonestring)*2, "Recvd", 0x157, 0x9B) # Based on 530 data changed max offset to 0x12C then 0x157
         
+    timeval = filetime_to_unix(filetime)
     timestring = ""
     if (timeval != 0):
         #print "timeval = " + hex(timeval)
@@ -551,7 +633,7 @@ for hit in hits:
             # returns time referenced to local system timezone
             #timestring = datetime.datetime.fromtimestamp(timeval).isoformat()
             # returns UTC time
-            timestring = datetime.datetime.utcfromtimestamp(timeval).isoformat()
+            timestring = utc_isoformat(timeval)
         except:
             timestring = "Error"
     else:
@@ -559,33 +641,609 @@ for hit in hits:
         timestring = "Error"
     #print "Time2 (UTC) = " + timestring + "\n"
     
-    # If no number listed (ie sent SMS), try grabbing the PHONEX phone number based on the FILETIME2 timestamp retrieved
+    # If no number listed (ie sent SMS), the PHONEX phone number is looked up based on the FILETIME2 timestamp
+    # after all hits have been processed (the matching "SMS" log hit may be later in the file)
     if ( (nums_listed == 0) and (timestring != "Error") ):
         phonestring = "Unknown"
-        if (timestring in smslogdict.keys()):
-            phonestring = smslogdict[timestring]
     
+    return (None, string_offset, (timestring, sentflag, phonestring, unistring), filetime)
+
+# Decodes the "SMS" log (Area 2) entry at a hit using a binary file object (fb) and a UTF-16LE codecs reader (funi).
+# Returns (raw FILETIMEX, phone number) or None if the hit is not a valid sms log entry.
+def decode_smslog(fb, funi, smshit):
+    # go back 2 bytes and check for "@" (0x40) and process as sms log entry if required
+    fb.seek(smshit - 2)
+    val = struct.unpack("B", fb.read(1))[0]
+    if (val == 0x40):
+        #print "sms log hit = " + hex(smshit - 2).rstrip("L")
+        # Get sms log filetime associated with this SMS (ASS-UME it matches with FILETIME2 retrieved later)
+        fb.seek(smshit - 0x23) # seek to 1st byte of FILETIMEX
+        # raw FILETIME is kept for the lookup (no date string formatting needed)
+        smsfiletime = read_rawfiletime(fb)
+        if (smsfiletime == 0):
+            # must be wrong offset / read error so ignore this hit
+            return None
+
+        # Retrieve phone number string (PHONEX) from sms log
+        funi.seek(smshit + 0x9) # seek to 1st byte of phone num
+        smsnumstring = read_nullterm_unistring(funi)
+        #print "SMS log # = " + smsnumstring + "\n"
+        if (smsnumstring != ""):
+            # If not an empty string, store phone number with its time (sorted after all hits are processed)
+            return (smsfiletime, smsnumstring)
+    return None
+
+# Decodes a (pattern_id, file offset) hit ie an "SMStext" record (pattern_id 0, see "decode_smstext")
+# or an "SMS" log entry (pattern_id 1, see "decode_smslog")
+def decode_hit(fb, funi, termid, hit):
+    if (termid == 1):
+        return (decode_smslog(fb, funi, hit))
+    return (decode_smstext(fb, funi, hit))
+
+# Worker process initializer for "idecodehits". Opens a read only memory mapped view of the input file
+# (or a file handle if it cannot be mapped eg a split raw image) for decoding hits.
+def initdecoder(filename):
+    global decodefb, decodefuni
+    decodefb = open_image(filename)
+    if ((not isinstance(decodefb, SplitImage)) and (image_stat(decodefb).st_size > 0)):
+        try:
+            decodefb = mmap.mmap(decodefb.fileno(), 0, access=mmap.ACCESS_READ)
+        except:
+            pass # decode from the file handle instead
+    decodefuni = codecs.getreader("utf-16-le")(decodefb)
+
+# Worker function for "idecodehits". Decodes a batch of (pattern_id, file offset) hits and returns
+# (list of (pattern_id, file offset, decoded result), printed output, number of timestamps found by profile probes/searches).
+def decodehits(hits):
+    results = []
+    stdout = sys.stdout
+    sys.stdout = cStringIO.StringIO()
+    profilestats["probed"] = 0
+    profilestats["searched"] = 0
+    try:
+        for termid, hit in hits:
+            results.append((termid, hit, decode_hit(decodefb, decodefuni, termid, hit)))
+        printed = sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+    return (results, printed, dict(profilestats))
+
+# Yields lists of up to batchsize hits
+def batchhits(hits, batchsize):
+    batch = []
+    for hit in hits:
+        batch.append(hit)
+        if (len(batch) == batchsize):
+            yield (batch)
+            batch = []
+    if (len(batch) > 0):
+        yield (batch)
+
+# Decodes each (pattern_id, file offset) hit and yields (pattern_id, file offset, decoded result) in hit order.
+# With more than one worker, batches of DECODE_BATCH hits are decoded by a pool of worker processes (each with its own
+# memory mapped view of the input file) and their printed output is written here (in hit order) so the output is
+# the same as decoding the hits one at a time. Adds the workers' profile probe/search counts to profilestats.
+# While a device profile is being learned (-P), hits are decoded here (so all the workers use the same learned profile).
+# Needs os.fork (ie not Windows) otherwise falls back to decoding the hits one at a time.
+def idecodehits(fb, funi, hits, numworkers):
+    if ((numworkers > 1) and (not hasattr(os, "fork"))):
+        print("Parallel decoding is not supported on this platform ... decoding hits one at a time")
+        numworkers = 0
+    hits = iter(hits)
+    while ((numworkers <= 1) or (profilecounts != None)):
+        try:
+            termid, hit = next(hits)
+        except StopIteration:
+            return
+        yield (termid, hit, decode_hit(fb, funi, termid, hit))
+    sys.stdout.flush()
+    pool = multiprocessing.Pool(numworkers, initdecoder, (fb.name,))
+    try:
+        for results, printed, stats in pool.imap(decodehits, batchhits(hits, DECODE_BATCH), 1): # results are in hit order
+            sys.stdout.write(printed)
+            profilestats["probed"] += stats["probed"]
+            profilestats["searched"] += stats["searched"]
+            for result in results:
+                yield result
+    finally:
+        pool.close()
+        pool.join()
+
+# Searches chunks of a file (using RE) and returns file offsets of any hits.
+# Intended for searching of large files where we cant read the whole thing into memory
+# This function calls the "regsearch" search method
+def sliceNsearchRE(fd, chunksize, delta, term):
+    final_hitlist = [] # list of file offsets which contain the search term
+    pattern = re.compile(term, re.DOTALL) # should only really call this once at start, if same substring.
+    stats = image_stat(fd)
+    #print("sliceNsearchRE Input file " + " is " + str(stats.st_size) + " bytes\n")
+    begin_chunk = 0
+    #print("chunksize = " + str(chunksize))
+
+    # Handle if filesize is less than CHUNK_SIZE (eg store.vol instead of image.bin)
+    # Should be able to read whole file in 1 chunk 
+    if (chunksize >= stats.st_size):
+        fd.seek(begin_chunk)
+        raw = fd.read()
+        final_hitlist = regsearch(raw, pattern, [])
+        #print(str(len(final_hitlist)) + " hits found in 1 chunk for " + str(term))
+    else:
+        # Filesize is greater than 1 chunk, need to loop thru
+        numchunks = int(math.ceil(float(stats.st_size) / chunksize))
+        #print("numchunks required = " + str(numchunks))
+        chunk_size_to_read = chunksize + delta
+        for chunknum in range(numchunks):
+            if ((chunk_size_to_read + begin_chunk) > stats.st_size):
+                chunk_size_to_read = stats.st_size - begin_chunk # last chunk only gets until end of file
+            #print("seeking " + str(begin_chunk) + " with size = " + str(chunk_size_to_read))
+            fd.seek(begin_chunk)
+            rawchunk = fd.read(chunk_size_to_read)
+            subhits = regsearch(rawchunk, pattern, [])
+            #print(str(len(subhits)) + " hits found at " + str(subhits))
+            # Items in subhits will be offsets relative to the start of the rawchunk (not relative to the file)
+            # Need to adjust offsets ...
+            for hit in subhits :
+                if (hit < chunksize) :
+                    final_hitlist.append(begin_chunk + hit)
+                    #print("adding " + str(begin_chunk + hit) + " to list")
+                elif (hit >= chunksize) :
+                    #print("ignoring " + str(begin_chunk + hit) + " to list")
+                    break # don't care if we get here because hit should be processed in next chunk
+                    # subhits can start at index 0 so possible hit offsets are 0 to chunksize-1 inclusive
+            begin_chunk += chunksize
+    #print("final_hitlist = " + str(final_hitlist))
+    return(final_hitlist)
+
+# Searches a read-only memory map of the whole file (using RE) and returns file offsets of any hits.
+# The regex runs directly over the mapped pages so there are no chunk copies and no DELTA overlaps to manage.
+# Hit offsets are the same as "sliceNsearchRE". Falls back to "sliceNsearchRE" if the file cannot be mapped
+# (eg 32 bit Python with a large image).
+def mmapsearchRE(fd, term):
+    final_hitlist = [] # list of file offsets which contain the search term
+    stats = image_stat(fd)
+    if (stats.st_size == 0):
+        return(final_hitlist) # cannot mmap an empty file
+    try:
+        mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    except:
+        print("mmap of input file failed ... using chunked search instead")
+        exctype, value = sys.exc_info()[:2]
+        print("Exception type = ",exctype,", value = ",value)
+        return(sliceNsearchRE(fd, CHUNK_SIZE, DELTA, term))
+    pattern = re.compile(term, re.DOTALL)
+    final_hitlist = regsearch(mm, pattern, [])
+    mm.close()
+    return(final_hitlist)
+
+# Returns the literal (ie non-regex) leading characters of a regular expression search term
+# eg "\x3C\x00\x63\x00" returns all 4 chars but "\x3C\x00[\x30\x00|\x31\x00]+" only returns "\x3C\x00"
+def literal_prefix(term):
+    prefix = ""
+    for op, av in sre_parse.parse(term, re.DOTALL):
+        if (op != sre_constants.LITERAL):
+            break
+        prefix += chr(av)
+    return(prefix)
+
+# Generator used by "multisearch". Yields (offset, groupnum) for each candidate offset of a term group.
+# A group with a literal prefix is located with string.find otherwise its combined RE scanner is used.
+# A lone (non-overlapping) term is located by its own "finditer" so no further checks are needed.
+def scangroup(bigstring, group, groupnum):
+    prefix, scanner, pids = group
+    if ((len(pids) == 1) and (scanner != None)):
+        for it in scanner.finditer(bigstring):
+            yield (it.start(), groupnum)
+    elif (prefix != ""):
+        i = bigstring.find(prefix)
+        while i >= 0:
+            yield (i, groupnum)
+            i = bigstring.find(prefix, i + 1)
+    else:
+        m = scanner.search(bigstring, 0)
+        while m:
+            yield (m.start(), groupnum)
+            m = scanner.search(bigstring, m.start() + 1)
+
+# Single pass multi-pattern search (generator) of a given string for a list of regular expression search terms.
+# Terms sharing the same leading literal char(s) are grouped so each group is located by one scan
+# and only that group's terms are confirmed (via "match") at each candidate offset.
+# Yields (pattern_id, offset) tuples in offset order where pattern_id is the index into "terms".
+# Each term's hits are the same as calling "regsearch" for that term on its own 
+# (or "all_indices" for overlapping literal terms if overlap=True).
+def imultisearch(bigstring, terms, overlap=False):
+    patterns = [re.compile(term, re.DOTALL) for term in terms]
+    groupkeys = [] # first literal char of each group ("" = no literal prefix)
+    groups = [] # list of [prefix, RE scanner, list of pattern_ids]
+    for pid in range(len(terms)):
+        prefix = literal_prefix(terms[pid])
+        key = prefix[:1]
+        if (key in groupkeys):
+            group = groups[groupkeys.index(key)]
+            group[0] = os.path.commonprefix([group[0], prefix])
+            group[2].append(pid)
+        else:
+            groupkeys.append(key)
+            groups.append([prefix, None, [pid]])
+    for group in groups:
+        if ((len(group[2]) == 1) and (not overlap)):
+            group[1] = patterns[group[2][0]]
+        elif (group[0] == ""):
+            group[1] = re.compile("|".join(["(?:" + terms[pid] + ")" for pid in group[2]]), re.DOTALL)
+
+    last_end = [0] * len(terms) # end of each term's last hit (regsearch hits do not overlap)
+    streams = [scangroup(bigstring, groups[g], g) for g in range(len(groups))]
+    for offset, groupnum in heapq.merge(*streams):
+        pids = groups[groupnum][2]
+        if ((len(pids) == 1) and (not overlap)):
+            yield (pids[0], offset) # already confirmed by finditer
+            continue
+        for pid in pids:
+            if (offset >= last_end[pid]):
+                m = patterns[pid].match(bigstring, offset)
+                if m:
+                    yield (pid, offset)
+                    if (overlap):
+                        last_end[pid] = offset + 1
+                    else:
+                        last_end[pid] = max(m.end(), offset + 1)
+
+# Single pass multi-pattern search (see "imultisearch") returning a list of (pattern_id, offset) tuples in offset order.
+def multisearch(bigstring, terms, overlap=False):
+    return(list(imultisearch(bigstring, terms, overlap)))
+
+# Generator version of "sliceNsearchMulti". Searches chunks of a file for several RE terms in one pass and yields
+# (pattern_id, file offset) hits in offset order as each chunk is searched. This lets the caller start parsing records
+# straight away and avoids building a list of every hit offset.
+# Note: Only seeks/reads "fd" before searching each chunk so the caller can use "fd" between hits.
+def isliceNsearchMulti(fd, chunksize, delta, terms):
+    stats = image_stat(fd)
+    begin_chunk = 0
+
+    # Handle if filesize is less than CHUNK_SIZE (eg store.vol instead of image.bin)
+    if (chunksize >= stats.st_size):
+        fd.seek(begin_chunk)
+        raw = fd.read()
+        for pid, hit in imultisearch(raw, terms):
+            yield (pid, hit)
+    else:
+        # Filesize is greater than 1 chunk, need to loop thru
+        numchunks = int(math.ceil(float(stats.st_size) / chunksize))
+        chunk_size_to_read = chunksize + delta
+        for chunknum in range(numchunks):
+            if ((chunk_size_to_read + begin_chunk) > stats.st_size):
+                chunk_size_to_read = stats.st_size - begin_chunk
+            fd.seek(begin_chunk)
+            rawchunk = fd.read(chunk_size_to_read)
+            # hits are in offset order and relative to the start of the rawchunk
+            for pid, hit in imultisearch(rawchunk, terms):
+                if (hit < chunksize) :
+                    yield (pid, begin_chunk + hit)
+                else :
+                    break # hit should be processed in next chunk
+            begin_chunk += chunksize
+
+# Searches chunks of a file for several RE terms in one pass and returns (pattern_id, file offset) hits.
+# Each chunk is read once and handed to "multisearch". Uses the same chunksize/delta rules as "sliceNsearchRE".
+def sliceNsearchMulti(fd, chunksize, delta, terms):
+    return(list(isliceNsearchMulti(fd, chunksize, delta, terms)))
+
+# Generator version of "mmapsearchMulti". Yields (pattern_id, file offset) hits as they are found.
+def immapsearchMulti(fd, terms):
+    stats = image_stat(fd)
+    if (stats.st_size == 0):
+        return # cannot mmap an empty file
+    try:
+        mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    except:
+        print("mmap of input file failed ... using chunked search instead")
+        exctype, value = sys.exc_info()[:2]
+        print("Exception type = ",exctype,", value = ",value)
+        for pid, hit in isliceNsearchMulti(fd, CHUNK_SIZE, DELTA, terms):
+            yield (pid, hit)
+        return
+    try:
+        for pid, hit in imultisearch(mm, terms):
+            yield (pid, hit)
+    finally:
+        mm.close()
+
+# Memory mapped version of "sliceNsearchMulti". Returns (pattern_id, file offset) hits.
+def mmapsearchMulti(fd, terms):
+    return(list(immapsearchMulti(fd, terms)))
+
+# Worker function for "parallelsearchMulti". Searches one range of the file (plus delta bytes) and
+# returns (pattern_id, file offset) hits which start inside the range. Each worker opens its own file handle.
+def searchrangeMulti(args):
+    filename, begin_range, rangesize, delta, terms = args
+    range_hitlist = []
+    fd = open_image(filename)
+    fd.seek(begin_range)
+    rawrange = fd.read(rangesize + delta) # read returns less at EOF
+    fd.close()
+    for pid, hit in multisearch(rawrange, terms):
+        if (hit < rangesize):
+            range_hitlist.append((pid, begin_range + hit))
+        else:
+            break # hit will be processed with the next range
+    return(range_hitlist)
+
+# Generator version of "parallelsearchMulti". Searches a file for several RE terms with a pool of worker processes
+# and yields (pattern_id, file offset) hits in offset order. Each range's hits are yielded as soon as that range
+# (and all the ranges before it) have been searched.
+# The file is split into ranges (aligned to 4096 bytes and at most PARALLEL_RANGE_SIZE) which are searched
+# concurrently. Like "sliceNsearchMulti", each range reads an extra delta bytes to catch hits crossing range boundaries.
+# Hits match "sliceNsearchMulti". Needs os.fork (ie not Windows) otherwise falls back to "isliceNsearchMulti".
+def iparallelsearchMulti(fd, numworkers, delta, terms):
+    if (not hasattr(os, "fork")):
+        print("Parallel search is not supported on this platform ... using chunked search instead")
+        for pid, hit in isliceNsearchMulti(fd, CHUNK_SIZE, delta, terms):
+            yield (pid, hit)
+        return
+    stats = image_stat(fd)
+    if (stats.st_size == 0):
+        return
+    rangesize = int(math.ceil(float(stats.st_size) / numworkers))
+    rangesize = min(PARALLEL_RANGE_SIZE, ((rangesize + 4095) // 4096) * 4096)
+    tasks = [(fd.name, begin_range, rangesize, delta, terms) for begin_range in range(0, stats.st_size, rangesize)]
+    pool = multiprocessing.Pool(numworkers)
+    try:
+        for range_hitlist in pool.imap(searchrangeMulti, tasks, 1): # results are in range order
+            for pid, hit in range_hitlist:
+                yield (pid, hit)
+    finally:
+        pool.close()
+        pool.join()
+
+# Searches a file for several RE terms with a pool of worker processes and returns (pattern_id, file offset) hits.
+# Hits are returned in offset order and match "sliceNsearchMulti". See "iparallelsearchMulti".
+def parallelsearchMulti(fd, numworkers, delta, terms):
+    return(list(iparallelsearchMulti(fd, numworkers, delta, terms)))
+
+# Main
+print "Running " + version_string + "\n"
+
+usage = " %prog -f inputfile -o outputfile [-m] [-p workers] [-c indexdir [-i] [-v]] [-t ticks] [-P profilefile [-n samples]] [-d workers] [-u [-e budget]]"
+
+# Handle command line args
+parser = OptionParser(usage=usage)
+parser.add_option("-f", dest="filename", 
+                  action="store", type="string",
+                  help="Input File To Be Searched")
+parser.add_option("-o", dest="tsvfile",
+                  action="store", type="string",
+                  help="Tab Separated Output Filename")
+parser.add_option("-m", dest="usemmap",
+                  action="store_true", default=False,
+                  help="(Optional) Search a memory mapped view of the input file instead of reading it in chunks")
+parser.add_option("-p", dest="workers",
+                  action="store", type="int", default=0,
+                  help="(Optional) Search the input file with this many worker processes (eg 8)")
+parser.add_option("-c", dest="cachedir",
+                  action="store", type="string",
+                  help="(Optional) Directory for storing/re-using a hit index file so repeat runs on the same input file skip the search")
+parser.add_option("-i", dest="rebuildindex",
+                  action="store_true", default=False,
+                  help="(Optional) Ignore any existing hit index file and re-create it (requires -c)")
+parser.add_option("-v", dest="verifyindex",
+                  action="store_true", default=False,
+                  help="(Optional) Search the input file anyway and check the results against the hit index file (requires -c)")
+parser.add_option("-t", dest="tolerance",
+                  action="store", type="int", default=FILETIME_TOLERANCE,
+                  help="(Optional) Max difference (in 100 ns FILETIME ticks) between a sent SMS timestamp and its sms log timestamp. Default is 10000000 (1 sec).")
+parser.add_option("-P", dest="profilefile",
+                  action="store", type="string",
+                  help="(Optional) Device profile file of learned timestamp offsets. Re-used if it exists otherwise it is learned from this input file.")
+parser.add_option("-n", dest="samples",
+                  action="store", type="int", default=PROFILE_SAMPLES,
+                  help="(Optional) Number of timestamp searches sampled to learn a device profile (requires -P). Default is 100.")
+parser.add_option("-d", dest="decoders",
+                  action="store", type="int", default=0,
+                  help="(Optional) Decode the hits with this many worker processes (eg 8)")
+parser.add_option("-u", dest="dedupe",
+                  action="store_true", default=False,
+                  help="(Optional) Drop duplicate SMS records and list their offsets in a Duplicate_Offsets column instead")
+parser.add_option("-e", dest="budget",
+                  action="store", type="int", default=DEDUPE_BUDGET,
+                  help="(Optional) Number of distinct records remembered exactly when dropping duplicates (requires -u). Default is 1000000.")
+(options, args) = parser.parse_args()
+
+# Check if no arguments given by user, exit
+if len(sys.argv) == 1:
+    parser.print_help()
+    exit(-1)
+if (options.filename == None) :
+    parser.print_help()
+    print "\nInput filename incorrectly specified!"
+    exit(-1)
+if (options.tsvfile == None) :
+    parser.print_help()
+    print "\nOutput filename incorrectly specified!"
+    exit(-1)
+if (((options.rebuildindex) or (options.verifyindex)) and (options.cachedir == None)) :
+    parser.print_help()
+    print "\nThe -i and -v options require a hit index directory (-c)!"
+    exit(-1)
+if ((options.cachedir != None) and (not os.path.isdir(options.cachedir))) :
+    parser.print_help()
+    print "\nHit index directory incorrectly specified!"
+    exit(-1)
+if (options.tolerance < 0) :
+    parser.print_help()
+    print "\nTolerance must not be negative!"
+    exit(-1)
+if (options.samples < 1) :
+    parser.print_help()
+    print "\nNumber of samples must be at least 1!"
+    exit(-1)
+if (options.budget < 1) :
+    parser.print_help()
+    print "\nDuplicate record budget must be at least 1!"
+    exit(-1)
+
+# Learned FILETIME2 offsets (-P) see "find_sms_timestamp"
+profile = None # learned offsets for each direction (None if not using/not yet learned a profile)
+profilecounts = None # {offset : count} for each direction while calibrating (None if not calibrating)
+profilestats = {"probed" : 0, "searched" : 0} # number of timestamps found at a profile offset/by searching the whole range
+if (options.profilefile != None):
+    profile = load_profile(options.profilefile)
+    if (profile != None):
+        print "Using device profile file " + options.profilefile + " (" + str(len(profile["Sent"])) + " Sent, " + str(len(profile["Recvd"])) + " Recvd offsets)"
+    else:
+        print "No valid device profile file found ... learning it from the first " + str(options.samples) + " timestamp searches"
+        profilecounts = {"Sent" : {}, "Recvd" : {}}
+
+# Open store.vol for unicode encoded text reads
+try:
+	funi = codecs.getreader("utf-16-le")(open_image(options.filename))
+except:
+    print ("Input File Not Found (unicode attempt)")
+    exit(-1)
+
+# Open store.vol for binary byte ops (eg timestamps)
+try:
+	fb = open_image(options.filename)
+except:
+    print ("Input File Not Found (binary attempt)")
+    exit(-1)
+
+# search the file chunks for the hex equivalent of "SMStext" which marks SMS Text content (ie Area 1)
+substring1 = "\x53\x00\x4d\x00\x53\x00\x74\x00\x65\x00\x78\x00\x74\x00\x00\x00" #ie "SMStext"
+# and for "SMS" which marks the SMS log entries (ie Area 2 times and phone number)
+# this will include SMStext hits so we need to some de-duping afterwards
+substring2 = "\x53\x00\x4d\x00\x53\x00\x00\x00" # ie "SMS"
+# Both terms are found in the same pass over the file
+# Re-use the hits from a previous run if there is a matching hit index file (-c)
+hitindex = None # list of (pattern_id, file offset) hits read from the hit index file
+scannedhits = None # list of hits found by searching the input file (when saving/verifying a hit index file)
+if (options.cachedir != None):
+    identity = image_identity(fb)
+    hitindexfile = hitindex_path(options.cachedir, options.filename, [substring1, substring2])
+    if (options.rebuildindex):
+        print "Re-creating hit index file " + hitindexfile
+    else:
+        hitindex = load_hitindex(hitindexfile, identity, [substring1, substring2])
+        if (hitindex == None):
+            print "No valid hit index file found ... searching input file"
+if ((hitindex != None) and (not options.verifyindex)):
+    print "Using " + str(len(hitindex)) + " hits from hit index file " + hitindexfile
+    multihits = hitindex
+else:
+    # Hits are streamed from the search (instead of collected into lists) so records are parsed as soon as they are found
+    if ((options.workers > 1) and (options.decoders > 1)):
+        # The decode pool pulls hits on one of its own threads so a streamed search would create its pool (ie fork)
+        # from that thread while the decode pool's threads are running. Finish the search here first instead.
+        multihits = parallelsearchMulti(fb, options.workers, DELTA, [substring1, substring2])
+    elif (options.workers > 1):
+        multihits = iparallelsearchMulti(fb, options.workers, DELTA, [substring1, substring2])
+    elif (options.usemmap):
+        multihits = immapsearchMulti(fb, [substring1, substring2])
+    else:
+        multihits = isliceNsearchMulti(fb, CHUNK_SIZE, DELTA, [substring1, substring2])
+    if (options.cachedir != None):
+        scannedhits = []
+        multihits = recordhits(multihits, scannedhits)
+
+# Filter "SMS" hits further (the hits above will include some false positives eg "SMStext")
+smslog = [] # list of (FILETIMEX, phone number) from the sms log (in file order)
+sentfiletimes = {} # FILETIME2 of each sent SMS keyed by SMS string offset
+# storage variable for printing parsed data to TSV later
+sms_entries = {}
+# number of "SMStext" hits skipped for each reason (see "decode_smstext")
+skipcounts = {"failednexthits" : 0, "badreadPHONE1" : 0, "badfindPHONE2" : 0, "badreadPHONE2" : 0,
+              "badfindPHONE3" : 0, "badreadPHONE3" : 0, "badrecvmsg" : 0}
+failednexthitlist = []
+badfindPHONE2list = []
+badrecvmsglist = []
+skiplists = {"failednexthits" : failednexthitlist, "badfindPHONE2" : badfindPHONE2list, "badrecvmsg" : badrecvmsglist}
+
+numhits = 0 # number of "SMStext" hits
+numsmshits = 0 # number of "SMS" hits
+deduper = None # duplicate record filter (-u)
+if (options.dedupe):
+    deduper = RecordDeduper(options.budget)
+
+# for each hit (in offset order)
+for termid, hit, result in idecodehits(fb, funi, multihits, options.decoders):
+    if (termid == 1):
+        # for each valid "SMS" log hit, keep the filetime and phone number for later use
+        numsmshits += 1
+        if (result != None):
+            smslog.append(result)
+        continue
+
+    # for each "SMStext" hit
+    numhits += 1
+    (skip, string_offset, entry, filetime) = result
+    if (skip != None):
+        skipcounts[skip] += 1
+        if (skip in skiplists):
+            skiplists[skip].append(hit)
+        continue
+    # Sent SMS phone numbers are not known yet but are looked up by FILETIME2 so the raw FILETIME2 is used instead of the time string
+    if ( (deduper != None) and deduper.check((str(filetime), entry[1], entry[2], entry[3]), string_offset, string_offset) ):
+        continue
+    if ( (entry[1] == "Sent") and (entry[0] != "Error") ):
+        sentfiletimes[string_offset] = filetime
     # Store parsed data in dictionary keyed by SMS string offset
-    sms_entries[string_offset] = (timestring, sentflag, phonestring, unistring)
+    sms_entries[string_offset] = entry
 
-#ends for hits loop
 
-print "\nProcessed " + str(len(hits)) + " SMStext hits\n"
-#print "badreadPHONE1 = " + str(badreadPHONE1)
-#print "badfindPHONE2 = " + str(badfindPHONE2)
-#print "badreadPHONE2 = " + str(badreadPHONE2)
-#print "badreadPHONE3 = " + str(badreadPHONE3)
-#print "badrecvmsg = " + str(badrecvmsg)
+#ends for hits loop
 
-#print "\nfailednexthits = " + str(failednexthits)
+# Save (or verify) the hit index file (-c)
+if (scannedhits != None):
+    if (hitindex != None):
+        if (scannedhits == hitindex):
+            print "Hit index file verified OK (" + str(len(hitindex)) + " hits)"
+        else:
+            print "Hit index file MISMATCH (" + str(len(hitindex)) + " cached hits, " + str(len(scannedhits)) + " hits found) ... re-creating " + hitindexfile
+            save_hitindex(hitindexfile, identity, [substring1, substring2], scannedhits, version_string)
+    elif (save_hitindex(hitindexfile, identity, [substring1, substring2], scannedhits, version_string)):
+        print "Saved " + str(len(scannedhits)) + " hits to hit index file " + hitindexfile
+
+# Save a partly learned device profile (ie fewer timestamps than -n were found)
+if ((profilecounts != None) and (sum([sum(counts.values()) for counts in profilecounts.values()]) > 0)):
+    profile = profile_offsets(profilecounts)
+    if (save_profile(options.profilefile, profilecounts)):
+        print "Saved device profile file " + options.profilefile + " (" + str(len(profile["Sent"])) + " Sent, " + str(len(profile["Recvd"])) + " Recvd offsets)"
+if (options.profilefile != None):
+    print "Found " + str(profilestats["probed"]) + " timestamps at device profile offsets (" + str(profilestats["searched"]) + " searched the whole range)"
+
+# For sent SMS, try grabbing the PHONEX phone number from the sms log based on the FILETIME2 timestamp retrieved
+# ie the sms log entry with the nearest FILETIMEX (within the -t tolerance)
+smslogtimes, smslognumbers = sort_smslog(smslog)
+for key in sentfiletimes:
+    (timestring, sentflag, phonestring, unistring) = sms_entries[key]
+    if ( (sentflag != "Sent") or (timestring == "Error") ):
+        continue # a later hit replaced this entry
+    lognumber = find_recipient(smslogtimes, smslognumbers, sentfiletimes[key], options.tolerance)
+    if (lognumber != None):
+        sms_entries[key] = (timestring, sentflag, lognumber, unistring)
+
+#print "SMS hits = " + str(numsmshits) + ", smslog = " + str(len(smslogtimes))
+print "\nProcessed " + str(numhits) + " SMStext hits\n"
+if (deduper != None):
+    print "Dropped " + str(deduper.listed + deduper.unlisted) + " duplicate SMS records (" + str(deduper.listed) + " listed in Duplicate_Offsets)"
+    if (deduper.unlisted > 0):
+        print "WARNING: " + str(deduper.unlisted) + " of the dropped duplicates were found beyond the exact budget (-e) so their offsets are NOT listed in Duplicate_Offsets"
+    if (deduper.unchecked > 0):
+        print "WARNING: The duplicate filter filled up so " + str(deduper.unchecked) + " SMS records were passed through without being deduplicated (use a bigger -e budget)"
+    print ""
+#print "badreadPHONE1 = " + str(skipcounts["badreadPHONE1"])
+#print "badfindPHONE2 = " + str(skipcounts["badfindPHONE2"])
+#print "badreadPHONE2 = " + str(skipcounts["badreadPHONE2"])
+#print "badreadPHONE3 = " + str(skipcounts["badreadPHONE3"])
+#print "badrecvmsg = " + str(skipcounts["badrecvmsg"])
+
+#print "\nfailednexthits = " + str(skipcounts["failednexthits"])
 #for miss in failednexthitlist:
 #    print hex(miss)
 
-#print "\nbadfindPHONE2 = " + str(badfindPHONE2)
+#print "\nbadfindPHONE2 = " + str(skipcounts["badfindPHONE2"])
 #for misread in badfindPHONE2list:
 #    print hex(misread)
 
-#print "\nbadrecvmsg = " + str(badrecvmsg)
+#print "\nbadrecvmsg = " + str(skipcounts["badrecvmsg"])
 #for badmsg in badrecvmsglist:
 #    print hex(badmsg)
     
@@ -601,9 +1259,15 @@ if (options.tsvfile != None):
     except:
         print ("Trouble Opening TSV Output File")
         exit(-1)
-    tsvof.write("Text_Offset\tUTC_Time2\tDirection\tPhone_No\tText\n")
+    if (deduper != None):
+        tsvof.write("Text_Offset\tUTC_Time2\tDirection\tPhone_No\tText\t" + deduper.header() + "\n")
+    else:
+        tsvof.write("Text_Offset\tUTC_Time2\tDirection\tPhone_No\tText\n")
     for key in sorted_messages_keys:
-        tsvof.write(hex(key).rstrip("L") + "\t" + sms_entries[key][0] + "\t" + sms_entries[key][1] + "\t" + sms_entries[key][2] + "\t" + sms_entries[key][3] + "\n")
+        if (deduper != None):
+            tsvof.write(hex(key).rstrip("L") + "\t" + sms_entries[key][0] + "\t" + sms_entries[key][1] + "\t" + sms_entries[key][2] + "\t" + sms_entries[key][3] + "\t" + deduper.offsets(key) + "\n")
+        else:
+            tsvof.write(hex(key).rstrip("L") + "\t" + sms_entries[key][0] + "\t" + sms_entries[key][1] + "\t" + sms_entries[key][2] + "\t" + sms_entries[key][3] + "\n")
     print "\nFinished writing out " + str(len(sorted_messages_keys)) + " TSV entries\n"
     tsvof.close()
 
@@ -45,6 +45,11 @@
 # v2015-07-12 Changed script to search for hex strings in chunks of CHUNK_SIZE rather than in one big read 
 #            (makes it quicker when running against whole .bin files). Thanks to Boss Rob :)
 # v2015-08-19 Fixed bug in chunking code where it was not processing the last chunk properly
+# v2026-10-17 Added -m option to search a memory mapped view of the input file (no chunk copies/DELTA overlaps)
+#             Added -p option to search the input file with a pool of worker processes
+#             rev_extract_unistring/rev_extract_ascii_string now read blocks backwards instead of one character at a time
+#             Input file can be the first segment of a split raw image (eg image.001) which reads all segments as one file (see "splitimage.py")
+#             Timestamps are formatted through a least recently used cache of ISO date strings (see "utc_isoformat" in "wp8common.py")
 #
 
 import codecs
@@ -56,10 +61,19 @@ from optparse import OptionParser
 import re
 import os
 import math
-
-version_string = "wp8-callhistory.py v2015-08-19"
+import mmap
+import multiprocessing
+# Split raw image helpers are shared with the other scripts (see utilities/splitimage.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "utilities"))
+from splitimage import open_image, image_stat
+# Helpers shared by the WP8 scripts in this directory (see wp8common.py)
+from wp8common import utc_isoformat
+
+version_string = "wp8-callhistory.py v2026-10-17"
 CHUNK_SIZE = 2000000000 # max value of CHUNK_SIZE + DELTA is 2147483647 (C long limit with Python 2)
 DELTA = 1000 # read this extra bit to catch any hits crossing chunk boundaries. Should be AT LEAST max size of record being searched for.
+PARALLEL_RANGE_SIZE = 67108864 # max size of each range searched by a "parallelsearchRE" worker process (64 MB)
+REV_STRING_WINDOW = 256 # initial number of bytes read backwards when looking for the start of a string (see "rev_extract_unistring")
 
 # Read in 8 byte MS FILETIME (number of 100 ns since 1 Jan 1601) and 
 # Returns equivalent unix epoch offset or 0 on error
@@ -89,7 +103,9 @@ def read_filetime(f):
 
 # Find all indices of the "pattern" regular expression in a given string (using regex)
 # Where pattern is a compiled Python re pattern object (ie the output of "re.compile")
-def regsearch(bigstring, pattern, listindex=[]):
+def regsearch(bigstring, pattern, listindex=None):
+    if (listindex == None):
+        listindex = [] # a new list for each call (a default list would be shared between calls)
     hitsit = pattern.finditer(bigstring)
     for it in hitsit:
         # iterators only last for one shot so we capture the offsets to a list
@@ -99,12 +115,41 @@ def regsearch(bigstring, pattern, listindex=[]):
 # Extract a Unicode null terminated string given file. 
 # Starts at the beginning of last (null) Unicode char and 
 # reads Unicode string in reverse. Returns read string or "Error!"
+# Reads blocks ending at the last char (starting with REV_STRING_WINDOW bytes and doubling) and finds the terminating
+# null/unprintable char from the end of the block instead of reading one char at a time.
+# Near the start/end of the file or at a UTF-16 surrogate, the string is read one char at a time (as before).
 def rev_extract_unistring(f):
     readchar = 0xABCD
     readcharlist = []
     flag = True
     charcount = 0
     begin = f.tell()
+    fd = f.stream # binary file underneath the codecs reader
+    fd.seek(begin)
+    lastchar = fd.read(2)
+    if (len(lastchar) == 2):
+        end = begin + 2
+        if (lastchar == "\x00\x00"):
+            end = begin # skip null at end of string
+        size = REV_STRING_WINDOW
+        while True:
+            start = max(end - size, end % 2)
+            fd.seek(start)
+            block = fd.read(end - start)
+            # index of the last Unicode char that isn't printable ASCII (ie the null/unprintable char before the string)
+            lastidx = max(len(block[0::2].rstrip(string.printable)), len(block[1::2].rstrip("\x00"))) - 1
+            if (lastidx >= 0):
+                if (block[2*lastidx + 1] < "\xd8") or (block[2*lastidx + 1] > "\xdf"): # not part of a surrogate pair
+                    f.seek(start + 2*lastidx + 2)
+                    readstring = block[2*lastidx + 2:]
+                    if (readstring == ""):
+                        return ""
+                    return readstring.decode("utf-16-le")
+                break
+            if (start < 2):
+                break # string goes back to the start of the file
+            size *= 2
+    f.seek(begin)
     while (flag):
         try:
             readchar = f.read(1)
@@ -133,12 +178,34 @@ def rev_extract_unistring(f):
 
 # Reads ASCII encoded string given file.
 # Returns read string or "Error!" (reads backwards from last char (null))
+# Reads blocks ending at the last char (starting with REV_STRING_WINDOW bytes and doubling) and finds the terminating
+# null/unprintable char from the end of the block instead of reading one char at a time.
+# Near the start/end of the file, the string is read one char at a time (as before).
 def rev_extract_ascii_string(f):
     readchar = 0xAB
     readcharlist = []
     flag = True
     charcount = 0
     begin = f.tell()
+    lastchar = f.read(1)
+    if (lastchar != ""):
+        end = begin + 1
+        if (lastchar == "\x00"):
+            end = begin # skip null at end of string
+        size = REV_STRING_WINDOW
+        while True:
+            start = max(end - size, 0)
+            f.seek(start)
+            block = f.read(end - start)
+            # index of the last char that isn't printable ASCII (ie the null/unprintable char before the string)
+            lastidx = len(block.rstrip(string.printable)) - 1
+            if (lastidx >= 0):
+                f.seek(start + lastidx + 1)
+                return block[lastidx + 1:]
+            if (start == 0):
+                break # string goes back to the start of the file
+            size *= 2
+    f.seek(begin)
     while (flag):
         try:
             readchar = f.read(1)
@@ -188,7 +255,7 @@ def find_timestamp(f, maxoffset, minoffset):
 def sliceNsearchRE(fd, chunksize, delta, term):
     final_hitlist = [] # list of file offsets which contain the search term
     pattern = re.compile(term, re.DOTALL) # should only really call this once at start, if same substring.
-    stats = os.fstat(fd.fileno())
+    stats = image_stat(fd)
     #print("sliceNsearchRE Input file " + filename + " is " + str(stats.st_size) + " bytes\n")
     begin_chunk = 0
 
@@ -226,9 +293,71 @@ def sliceNsearchRE(fd, chunksize, delta, term):
     #print("final_hitlist = " + str(final_hitlist))
     return(final_hitlist)
 
+# Searches a read-only memory map of the whole file (using RE) and returns file offsets of any hits.
+# The regex runs directly over the mapped pages so there are no chunk copies and no DELTA overlaps to manage.
+# Hit offsets are the same as "sliceNsearchRE". Falls back to "sliceNsearchRE" if the file cannot be mapped
+# (eg 32 bit Python with a large image).
+def mmapsearchRE(fd, term):
+    final_hitlist = [] # list of file offsets which contain the search term
+    stats = image_stat(fd)
+    if (stats.st_size == 0):
+        return(final_hitlist) # cannot mmap an empty file
+    try:
+        mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    except:
+        print("mmap of input file failed ... using chunked search instead")
+        exctype, value = sys.exc_info()[:2]
+        print("Exception type = ",exctype,", value = ",value)
+        return(sliceNsearchRE(fd, CHUNK_SIZE, DELTA, term))
+    pattern = re.compile(term, re.DOTALL)
+    final_hitlist = regsearch(mm, pattern, [])
+    mm.close()
+    return(final_hitlist)
+
+# Worker function for "parallelsearchRE". Searches one range of the file (plus delta bytes) and
+# returns the file offsets of hits which start inside the range. Each worker opens its own file handle.
+def searchrangeRE(args):
+    filename, begin_range, rangesize, delta, term = args
+    range_hitlist = []
+    pattern = re.compile(term, re.DOTALL)
+    fd = open_image(filename)
+    fd.seek(begin_range)
+    rawrange = fd.read(rangesize + delta) # read returns less at EOF
+    fd.close()
+    for hit in regsearch(rawrange, pattern, []):
+        if (hit < rangesize):
+            range_hitlist.append(begin_range + hit)
+        else:
+            break # hit will be processed with the next range
+    return(range_hitlist)
+
+# Searches a file with a pool of worker processes (using RE) and returns file offsets of any hits.
+# The file is split into ranges (aligned to 4096 bytes and at most PARALLEL_RANGE_SIZE) which are searched
+# concurrently. Like "sliceNsearchRE", each range reads an extra delta bytes to catch hits crossing range boundaries.
+# Hits are returned in offset order and match "sliceNsearchRE". Needs os.fork (ie not Windows) otherwise
+# falls back to "sliceNsearchRE".
+def parallelsearchRE(fd, numworkers, delta, term):
+    if (not hasattr(os, "fork")):
+        print("Parallel search is not supported on this platform ... using chunked search instead")
+        return(sliceNsearchRE(fd, CHUNK_SIZE, delta, term))
+    final_hitlist = [] # list of file offsets which contain the search term
+    stats = image_stat(fd)
+    if (stats.st_size == 0):
+        return(final_hitlist)
+    rangesize = int(math.ceil(float(stats.st_size) / numworkers))
+    rangesize = min(PARALLEL_RANGE_SIZE, ((rangesize + 4095) // 4096) * 4096)
+    tasks = [(fd.name, begin_range, rangesize, delta, term) for begin_range in range(0, stats.st_size, rangesize)]
+    pool = multiprocessing.Pool(numworkers)
+    results = pool.map(searchrangeRE, tasks, 1) # results are in range order
+    pool.close()
+    pool.join()
+    for range_hitlist in results:
+        final_hitlist.extend(range_hitlist)
+    return(final_hitlist)
+
 # Main
 print "Running " + version_string + "\n"
-usage = " %prog -f inputfile -o outputfile"
+usage = " %prog -f inputfile -o outputfile [-m] [-p workers]"
 
 # Handle command line args
 parser = OptionParser(usage=usage)
@@ -238,6 +367,12 @@ parser.add_option("-f", dest="filename",
 parser.add_option("-o", dest="tsvfile",
                   action="store", type="string",
                   help="Tab Separated Output Filename")
+parser.add_option("-m", dest="usemmap",
+                  action="store_true", default=False,
+                  help="(Optional) Search a memory mapped view of the input file instead of reading it in chunks")
+parser.add_option("-p", dest="workers",
+                  action="store", type="int", default=0,
+                  help="(Optional) Search the input file with this many worker processes (eg 8)")
 (options, args) = parser.parse_args()
 
 # Check if no arguments given by user, exit
@@ -255,14 +390,14 @@ if (options.tsvfile == None) :
 
 # Open "Phone" file for unicode encoded text reads
 try:
-	funi = codecs.open(options.filename, encoding="utf-16-le", mode="r")
+	funi = codecs.getreader("utf-16-le")(open_image(options.filename))
 except:
     print ("Input File Not Found (unicode attempt)")
     exit(-1)
 
 # Open "Phone" file for binary byte ops (eg timestamps)
 try:
-	fb = open(options.filename, "rb")
+	fb = open_image(options.filename)
 except:
     print ("Input File Not Found (binary attempt)")
     exit(-1)
@@ -271,7 +406,12 @@ except:
 # GUID is "{B1776703-738E-437D-B891-44555CEB6669}" in hex
 GUID = "\x7b\x00\x42\x00\x31\x00\x37\x00\x37\x00\x36\x00\x37\x00\x30\x00\x33\x00\x2d\x00\x37\x00\x33\x00\x38\x00\x45\x00\x2d\x00\x34\x00\x33\x00\x37\x00\x44\x00\x2d\x00\x42\x00\x38\x00\x39\x00\x31\x00\x2d\x00\x34\x00\x34\x00\x35\x00\x35\x00\x35\x00\x43\x00\x45\x00\x42\x00\x36\x00\x36\x00\x36\x00\x39\x00\x7d\x00"
 #print GUID
-hits = sliceNsearchRE(fb, CHUNK_SIZE, DELTA, GUID)
+if (options.workers > 1):
+    hits = parallelsearchRE(fb, options.workers, DELTA, GUID)
+elif (options.usemmap):
+    hits = mmapsearchRE(fb, GUID)
+else:
+    hits = sliceNsearchRE(fb, CHUNK_SIZE, DELTA, GUID)
 #print "CallHistory hits = " + str(len(hits))
 
 # Dict for storing results (keyed by offset)
@@ -319,7 +459,7 @@ for hit in hits:
 
     if (stoptimeval!=0):
         try:
-            stoptimestring = datetime.datetime.utcfromtimestamp(stoptimeval).isoformat()
+            stoptimestring = utc_isoformat(stoptimeval)
             valid_stoptime = True
         except:
             stoptimestring = "Error"
@@ -331,7 +471,7 @@ for hit in hits:
         starttimeval = read_filetime(fb)
         if (starttimeval!=0):
             try:
-                starttimestring = datetime.datetime.utcfromtimestamp(starttimeval).isoformat()
+                starttimestring = utc_isoformat(starttimeval)
                 valid_startime = True
             except:
                 starttimestring = "Error"
@@ -34,14 +34,22 @@
 # History
 # v2014-08-24 Initial version
 # v2014-10-05 Renamed script from "fb-msg-parser.py" to "wp8-fb-msg.py"
+# v2026-10-17 Input file can be the first segment of a split raw image (eg image.001) which reads all segments as one file (see "splitimage.py")
+#             Timestamps are formatted through a least recently used cache of ISO date strings (see "utc_isoformat" in "wp8common.py")
 
 import sys
 import codecs
 import datetime
 import string
 from optparse import OptionParser
+import os
+# Split raw image helpers are shared with the other scripts (see utilities/splitimage.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "utilities"))
+from splitimage import open_image
+# Helpers shared by the WP8 scripts in this directory (see wp8common.py)
+from wp8common import utc_isoformat
 
-version_string = "wp8-fb-msg.py v2014-10-05"
+version_string = "wp8-fb-msg.py v2026-10-17"
 
 # Max Offset Tolerance (bytes) between author_name and author_fbid fields
 AUTHOR_NAME_FUDGE = 40
@@ -55,7 +63,9 @@ TIMESTAMP_ESC_FUDGE = 2500
 
 # Find all indices of a substring in a given string (Python recipe) 
 # From http://code.activestate.com/recipes/499314-find-all-indices-of-a-substring-in-a-given-string/
-def all_indices(bigstring, substring, listindex=[], offset=0):
+def all_indices(bigstring, substring, listindex=None, offset=0):
+    if (listindex == None):
+        listindex = [] # a new list for each call (a default list would be shared between calls)
     i = bigstring.find(substring, offset)
     while i >= 0:
         listindex.append(i)
@@ -128,10 +138,10 @@ if (options.tsvfile == None) :
 
 try:
     # Open input file for binary reads
-    fb = open(options.filename, mode="rb")
+    fb = open_image(options.filename)
     if (options.unicode):
         # Open input file for unicode encoded text reads (if required)
-        funi = codecs.open(options.filename, encoding="utf-16-le", mode="r")
+        funi = codecs.getreader("utf-16-le")(open_image(options.filename))
 except:
     print ("Problems Opening Input File")
     exctype, value = sys.exc_info()[:2]
@@ -293,7 +303,7 @@ for idx in range(len(author_fbid_hits)):
             ts_int = int(timestamp_src) # convert str to int
             timestamp_flt = float( ts_int // 1000 ) # convert ms to seconds
             #print "timestamp_flt = " + str(timestamp_flt)
-            timestamp_str = datetime.datetime.utcfromtimestamp(timestamp_flt).isoformat()
+            timestamp_str = utc_isoformat(timestamp_flt)
         except:
             exctype, value = sys.exc_info()[:2]
             print ("Timestamp Exception type = ",exctype,", value = ",value) 
@@ -404,7 +414,7 @@ for idx in range(len(author_fbid_esc_hits)):
             ts_int = int(timestamp_src) # convert str to int
             timestamp_flt = float( ts_int // 1000 ) # convert ms to seconds
             #print "timestamp_flt = " + str(timestamp_flt)
-            timestamp_str = datetime.datetime.utcfromtimestamp(timestamp_flt).isoformat()
+            timestamp_str = utc_isoformat(timestamp_flt)
         except:
             exctype, value = sys.exc_info()[:2]
             print ("Timestamp Exception type = ",exctype,", value = ",value) 
@@ -111,6 +111,13 @@ v2015-08-19:
 - Adjusted DELTA to cater for a larger max size record
 - Adjusted timestamp search max offset for received SMS
 
+v2026-10-17:
+- Added -m option to search a memory mapped view of the input file (no chunk copies/DELTA overlaps)
+- Added -p option to search the input file with a pool of worker processes
+- read_nullterm_unistring now reads/decodes blocks instead of one character at a time (see "decode_nullterm_unistring")
+- Input file can be the first segment of a split raw image (eg image.001) which reads all segments as one file (see "splitimage.py")
+- Timestamps are formatted through a least recently used cache of ISO date strings (see "utc_isoformat" in "wp8common.py")
+
 """
 
 import codecs
@@ -122,43 +129,90 @@ from optparse import OptionParser
 import re
 import os
 import math
-
-version_string = "wp8-sms.py v2015-08-19"
+import mmap
+import multiprocessing
+# Split raw image helpers are shared with the other scripts (see utilities/splitimage.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "utilities"))
+from splitimage import open_image, image_stat
+# Helpers shared by the WP8 scripts in this directory (see wp8common.py)
+from wp8common import utc_isoformat
+
+version_string = "wp8-sms.py v2026-10-17"
 CHUNK_SIZE = 2000000000 # max value of CHUNK_SIZE + DELTA is 2147483647 (C long limit with Python 2)
 DELTA = 1100 # read this extra bit to catch any hits crossing chunk boundaries. Should be AT LEAST max size of record being searched for.
-
-# Read in unicode chars one at a time until a null char ie "0x00 0x00"
-# Returns empty string on error otherwise it filters out return/newlines and returns the string read
-def read_nullterm_unistring(f):
-    readstrg = ""
-    readchar = 0xABCD
-    flag = True
-    unprintablechars = False
-    begin = f.tell()
-    
-    while (flag):
-        try:
-            #print "char at " + hex(f.tell()).rstrip("L")
-            readchar = f.read(1)
-            if (readchar == unichr(0)): # bailout if null char
-                flag = False
-            if (flag):
-                if (readchar in string.printable) and (readchar != "\r") and (readchar != "\n"):
-                    readstrg += readchar
-                else:
-                    readstrg += " "
-                    unprintablechars = True
-                    #print "unprintable at " + hex(f.tell()-1).rstrip("L")
-        except:
-            print "Warning ... bad unicode string at offset " + hex(begin).rstrip("L")
-            exctype, value = sys.exc_info()[:2]
-            print ("Exception type = ",exctype,", value = ",value) 
-            #readstrg = ""
-            return readstrg # returns partial strings
+PARALLEL_RANGE_SIZE = 67108864 # max size of each range searched by a "parallelsearchRE" worker process (64 MB)
+UNISTRING_WINDOW = 256 # initial number of bytes read when looking for the end of a null terminated Unicode string
+# Characters replaced with a space when extracting Unicode strings ie not in string.printable (or "\r", "\n").
+# A UTF-16 surrogate pair (ie 2 chars on narrow Python builds) counts as one character.
+UNPRINTABLE_RE = re.compile(u"[\ud800-\udbff][\udc00-\udfff]|[^\t\x0b\x0c\x20-\x7e]")
+
+# Decodes a UTF-16LE null terminated string starting at "offset" of a binary file.
+# Reads blocks of the file (starting with UNISTRING_WINDOW bytes and doubling) until "find" locates a 2 byte aligned
+# null terminator then decodes the whole string in one go.
+# Returns (decoded string without the null, file offset after the null, decode exception or None).
+# On a decode error, returns the characters before the bad character and the offset after the bad character's bytes
+# (ie the same result as reading the string one character at a time with a codecs reader).
+# If there is no null terminator, returns what could be read up to the end of the file.
+def decode_nullterm_unistring(fd, offset):
+    fd.seek(offset)
+    buf = ""
+    nullpos = -1
+    readsize = UNISTRING_WINDOW
+    while (nullpos < 0):
+        block = fd.read(readsize)
+        if (block == ""):
+            break # EOF and no null terminator
+        searchpos = len(buf) # buf is always an even length here so an aligned null cannot span two blocks
+        buf += block
+        nullpos = buf.find("\x00\x00", searchpos)
+        while ((nullpos >= 0) and (nullpos % 2)):
+            nullpos = buf.find("\x00\x00", nullpos + 1)
+        readsize = min(readsize * 2, 1048576)
+
+    if (nullpos >= 0):
+        data = buf[:nullpos + 2] # decode the null too so a bad char right before it fails like a character at a time read
+    else:
+        data = buf[:len(buf) - (len(buf) % 2)]
+    try:
+        decoded = data.decode("utf-16-le")
+    except UnicodeDecodeError:
+        # Decode the bad character's bytes incrementally (like a codecs reader does) to get the same error and end offset
+        charstart = sys.exc_info()[1].start
+        buf += fd.read(4)
+        for size in range(1, len(buf) - charstart + 1):
+            try:
+                codecs.utf_16_le_decode(buf[charstart:charstart + size], "strict", False)
+            except UnicodeDecodeError:
+                return (buf[:charstart].decode("utf-16-le"), offset + charstart + size, sys.exc_info()[1])
+        return (buf[:charstart].decode("utf-16-le"), offset + len(buf), None)
+    if (nullpos >= 0):
+        return (decoded[:-1], offset + nullpos + 2, None)
+    return (decoded, offset + len(data), None)
+
+# Extracts a null terminated UTF-16LE string starting at "offset" of a binary file (see "decode_nullterm_unistring").
+# Characters not in string.printable (and "\r", "\n") are replaced with a space.
+# Returns (string, file offset after the null terminator, True if any characters were replaced).
+# Returns the partial string on a decode error.
+def extract_nullterm_unistring(fd, offset):
+    decoded, endoffset, decodeerror = decode_nullterm_unistring(fd, offset)
+    readstrg, numsubs = UNPRINTABLE_RE.subn(u" ", decoded)
+    if (len(readstrg) == numsubs):
+        readstrg = str(readstrg) # no printable chars so return a str as before (callers may test 'is ""')
+    if (decodeerror != None):
+        print "Warning ... bad unicode string at offset " + hex(offset).rstrip("L")
+        print ("Exception type = ",type(decodeerror),", value = ",decodeerror) 
+        return (readstrg, endoffset, numsubs > 0) # returns partial strings
     
-    if (unprintablechars):
-        print "String substitution(s) due to unrecognized/unprintable characters at " + hex(begin).rstrip("L")
+    if (numsubs > 0):
+        print "String substitution(s) due to unrecognized/unprintable characters at " + hex(offset).rstrip("L")
     
+    return (readstrg, endoffset, numsubs > 0)
+
+# Read in a null terminated Unicode string from a codecs reader (ie starting at the reader's current file offset).
+# Returns the string and leaves the reader positioned after the null terminator (see "extract_nullterm_unistring").
+def read_nullterm_unistring(f):
+    readstrg, endoffset, unprintablechars = extract_nullterm_unistring(f.stream, f.tell())
+    f.seek(endoffset)
     return readstrg
 
 # Read in 8 byte MS FILETIME (number of 100 ns since 1 Jan 1601) and 
@@ -189,7 +243,9 @@ def read_filetime(f):
 
 # Find all indices of the "pattern" regular expression in a given string (using regex)
 # Where pattern is a compiled Python re pattern object (ie the output of "re.compile")
-def regsearch(bigstring, pattern, listindex=[]):
+def regsearch(bigstring, pattern, listindex=None):
+    if (listindex == None):
+        listindex = [] # a new list for each call (a default list would be shared between calls)
     hitsit = pattern.finditer(bigstring)
     for it in hitsit:
         # iterators only last for one shot so we capture the offsets to a list
@@ -247,7 +303,7 @@ def goto_next_field(f, offset, maxbytes):
 def sliceNsearchRE(fd, chunksize, delta, term):
     final_hitlist = [] # list of file offsets which contain the search term
     pattern = re.compile(term, re.DOTALL) # should only really call this once at start, if same substring.
-    stats = os.fstat(fd.fileno())
+    stats = image_stat(fd)
     #print("sliceNsearchRE Input file " + " is " + str(stats.st_size) + " bytes\n")
     begin_chunk = 0
     #print("chunksize = " + str(chunksize))
@@ -286,10 +342,72 @@ def sliceNsearchRE(fd, chunksize, delta, term):
     #print("final_hitlist = " + str(final_hitlist))
     return(final_hitlist)
 
+# Searches a read-only memory map of the whole file (using RE) and returns file offsets of any hits.
+# The regex runs directly over the mapped pages so there are no chunk copies and no DELTA overlaps to manage.
+# Hit offsets are the same as "sliceNsearchRE". Falls back to "sliceNsearchRE" if the file cannot be mapped
+# (eg 32 bit Python with a large image).
+def mmapsearchRE(fd, term):
+    final_hitlist = [] # list of file offsets which contain the search term
+    stats = image_stat(fd)
+    if (stats.st_size == 0):
+        return(final_hitlist) # cannot mmap an empty file
+    try:
+        mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    except:
+        print("mmap of input file failed ... using chunked search instead")
+        exctype, value = sys.exc_info()[:2]
+        print("Exception type = ",exctype,", value = ",value)
+        return(sliceNsearchRE(fd, CHUNK_SIZE, DELTA, term))
+    pattern = re.compile(term, re.DOTALL)
+    final_hitlist = regsearch(mm, pattern, [])
+    mm.close()
+    return(final_hitlist)
+
+# Worker function for "parallelsearchRE". Searches one range of the file (plus delta bytes) and
+# returns the file offsets of hits which start inside the range. Each worker opens its own file handle.
+def searchrangeRE(args):
+    filename, begin_range, rangesize, delta, term = args
+    range_hitlist = []
+    pattern = re.compile(term, re.DOTALL)
+    fd = open_image(filename)
+    fd.seek(begin_range)
+    rawrange = fd.read(rangesize + delta) # read returns less at EOF
+    fd.close()
+    for hit in regsearch(rawrange, pattern, []):
+        if (hit < rangesize):
+            range_hitlist.append(begin_range + hit)
+        else:
+            break # hit will be processed with the next range
+    return(range_hitlist)
+
+# Searches a file with a pool of worker processes (using RE) and returns file offsets of any hits.
+# The file is split into ranges (aligned to 4096 bytes and at most PARALLEL_RANGE_SIZE) which are searched
+# concurrently. Like "sliceNsearchRE", each range reads an extra delta bytes to catch hits crossing range boundaries.
+# Hits are returned in offset order and match "sliceNsearchRE". Needs os.fork (ie not Windows) otherwise
+# falls back to "sliceNsearchRE".
+def parallelsearchRE(fd, numworkers, delta, term):
+    if (not hasattr(os, "fork")):
+        print("Parallel search is not supported on this platform ... using chunked search instead")
+        return(sliceNsearchRE(fd, CHUNK_SIZE, delta, term))
+    final_hitlist = [] # list of file offsets which contain the search term
+    stats = image_stat(fd)
+    if (stats.st_size == 0):
+        return(final_hitlist)
+    rangesize = int(math.ceil(float(stats.st_size) / numworkers))
+    rangesize = min(PARALLEL_RANGE_SIZE, ((rangesize + 4095) // 4096) * 4096)
+    tasks = [(fd.name, begin_range, rangesize, delta, term) for begin_range in range(0, stats.st_size, rangesize)]
+    pool = multiprocessing.Pool(numworkers)
+    results = pool.map(searchrangeRE, tasks, 1) # results are in range order
+    pool.close()
+    pool.join()
+    for range_hitlist in results:
+        final_hitlist.extend(range_hitlist)
+    return(final_hitlist)
+
 # Main
 print "Running " + version_string + "\n"
 
-usage = " %prog -f inputfile -o outputfile"
+usage = " %prog -f inputfile -o outputfile [-m] [-p workers]"
 
 # Handle command line args
 parser = OptionParser(usage=usage)
@@ -299,6 +417,12 @@ parser.add_option("-f", dest="filename",
 parser.add_option("-o", dest="tsvfile",
                   action="store", type="string",
                   help="Tab Separated Output Filename")
+parser.add_option("-m", dest="usemmap",
+                  action="store_true", default=False,
+                  help="(Optional) Search a memory mapped view of the input file instead of reading it in chunks")
+parser.add_option("-p", dest="workers",
+                  action="store", type="int", default=0,
+                  help="(Optional) Search the input file with this many worker processes (eg 8)")
 (options, args) = parser.parse_args()
 
 # Check if no arguments given by user, exit
@@ -316,27 +440,37 @@ if (options.tsvfile == None) :
 
 # Open store.vol for unicode encoded text reads
 try:
-	funi = codecs.open(options.filename, encoding="utf-16-le", mode="r")
+	funi = codecs.getreader("utf-16-le")(open_image(options.filename))
 except:
     print ("Input File Not Found (unicode attempt)")
     exit(-1)
 
 # Open store.vol for binary byte ops (eg timestamps)
 try:
-	fb = open(options.filename, "rb")
+	fb = open_image(options.filename)
 except:
     print ("Input File Not Found (binary attempt)")
     exit(-1)
 
 # search the file chunks for the hex equivalent of "SMStext" which marks SMS Text content (ie Area 1)
 substring1 = "\x53\x00\x4d\x00\x53\x00\x74\x00\x65\x00\x78\x00\x74\x00\x00\x00" #ie "SMStext"
-hits = sliceNsearchRE(fb, CHUNK_SIZE, DELTA, substring1)
+if (options.workers > 1):
+    hits = parallelsearchRE(fb, options.workers, DELTA, substring1)
+elif (options.usemmap):
+    hits = mmapsearchRE(fb, substring1)
+else:
+    hits = sliceNsearchRE(fb, CHUNK_SIZE, DELTA, substring1)
 #print "SMStext hits = " + str(len(hits))
 
 # search for "SMS" which marks the SMS log entries (ie Area 2 times and phone number)
 # this will include SMStext hits so we need to some de-duping afterwards
 substring2 = "\x53\x00\x4d\x00\x53\x00\x00\x00" # ie "SMS"
-smshits = sliceNsearchRE(fb, CHUNK_SIZE, DELTA, substring2)
+if (options.workers > 1):
+    smshits = parallelsearchRE(fb, options.workers, DELTA, substring2)
+elif (options.usemmap):
+    smshits = mmapsearchRE(fb, substring2)
+else:
+    smshits = sliceNsearchRE(fb, CHUNK_SIZE, DELTA, substring2)
 #print "SMS hits = " + str(len(smshits)) + " smshits"
 
 # Filter smshits further (the hits above will include some false positives eg "SMStext")
@@ -355,7 +489,7 @@ for smshit in smshits:
         if (smstimeval != 0):
             try:
                 # returns UTC time
-                smstimestring = datetime.datetime.utcfromtimestamp(smstimeval).isoformat()
+                smstimestring = utc_isoformat(smstimeval)
             except:
                 smstimestring = "Error" # if we get here, the hit is a false one. The date at this offset is not valid
                 continue
@@ -525,7 +659,7 @@ for hit in hits:
             # returns time referenced to local system timezone
             #timestring = datetime.datetime.fromtimestamp(timeval).isoformat()
             # returns UTC time
-            timestring = datetime.datetime.utcfromtimestamp(timeval).isoformat()
+            timestring = utc_isoformat(timeval)
         except:
             timestring = "Error"
     else:
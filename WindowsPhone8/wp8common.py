@@ -0,0 +1,211 @@
+# Python module of helpers shared by the Windows Phone 8 scripts in this directory (eg "wp8-1-sms.py", "wp8-sms.py")
+# Author: cheeky4n6monkey@gmail.com (Adrian Leong)
+#
+# Copyright (C) 2026 Adrian Leong (cheeky4n6monkey@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You can view the GNU General Public License at <http://www.gnu.org/licenses/>
+#
+# History
+# v2026-10-17 Initial version (timestamp formatting moved here from each script)
+#             ISO date strings are remembered in a least recently used cache (see "utc_isoformat")
+#             Hit index file helpers moved here from each script (see "load_hitindex")
+#             Duplicate record filter moved here from each script (see "RecordDeduper")
+#             RecordDeduper stops checking records once its Bloom filter is full instead of dropping more unique records
+
+import sys
+import os
+import datetime
+import collections
+import hashlib
+import json
+import zlib
+import binascii
+import array
+import struct
+import math
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "utilities"))
+from splitimage import image_stat
+
+ISODATE_CACHE_SIZE = 65536 # max number of ISO date strings remembered by "utc_isoformat"
+HITINDEX_MAGIC = "WP8HITIDX1" # first line of a hit index file (see "save_hitindex")
+HITINDEX_SAMPLES = 16 # number of samples hashed to identify the input file (see "image_identity")
+HITINDEX_SAMPLE_SIZE = 65536 # size of each sample (in bytes)
+BLOOM_CAPACITY = 8 # "RecordDeduper" Bloom filter is sized for this many times the exact budget of records
+BLOOM_ERROR_RATE = 0.001 # "RecordDeduper" Bloom filter false positive rate
+isodate_cache = collections.OrderedDict() # ISO date strings keyed by secs since 1JAN1970 in least recently used order (see "utc_isoformat")
+
+# Returns the ISO UTC date string (ie datetime.datetime.utcfromtimestamp(secs).isoformat()) for a number of secs since 1JAN1970.
+# Carved records often repeat the same timestamps (eg duplicate records in slack space) so the strings are remembered
+# in a least recently used cache of ISODATE_CACHE_SIZE entries. Bad values raise the same exceptions as utcfromtimestamp.
+def utc_isoformat(secs):
+    try:
+        isostring = isodate_cache.pop(secs) # re-inserted below as the most recently used entry
+    except KeyError:
+        isostring = datetime.datetime.utcfromtimestamp(secs).isoformat()
+        if (len(isodate_cache) >= ISODATE_CACHE_SIZE):
+            isodate_cache.popitem(last=False) # evict the least recently used entry
+    isodate_cache[secs] = isostring
+    return (isostring)
+
+# Returns the identity of the input file as a dictionary of its size, modified time and a SHA1 hash of
+# HITINDEX_SAMPLES evenly spaced samples (plus the end of the file). Used to check that a hit index file
+# still belongs to the input file without having to hash the whole (multi-GB) file.
+def image_identity(fd):
+    stats = image_stat(fd)
+    sha = hashlib.sha1()
+    samplestep = max(HITINDEX_SAMPLE_SIZE, stats.st_size // HITINDEX_SAMPLES)
+    sampleoffsets = range(0, stats.st_size, samplestep)[:HITINDEX_SAMPLES]
+    sampleoffsets.append(max(0, stats.st_size - HITINDEX_SAMPLE_SIZE))
+    for offset in sampleoffsets:
+        fd.seek(offset)
+        sha.update(fd.read(HITINDEX_SAMPLE_SIZE))
+    return {"size" : stats.st_size, "mtime" : int(stats.st_mtime), "samplehash" : sha.hexdigest()}
+
+# Returns the path of the hit index file (in cachedir) for the given input file and search terms
+def hitindex_path(cachedir, filename, terms):
+    termhash = hashlib.sha1(",".join([binascii.hexlify(term) for term in terms])).hexdigest()[:16]
+    return os.path.join(cachedir, os.path.basename(filename) + "." + termhash + ".hitidx")
+
+# Reads a hit index file and returns its list of (pattern_id, file offset) hits.
+# Returns None if the hit index file cannot be read or was made from a different input file (identity) or search terms.
+# File format: HITINDEX_MAGIC line, JSON header line then zlib compressed data made up of
+# the delta encoded offsets (little endian 8 byte unsigned ints) followed by the pattern_ids (1 byte each).
+def load_hitindex(path, identity, terms):
+    try:
+        hf = open(path, "rb")
+        magic = hf.readline().rstrip("\n")
+        header = json.loads(hf.readline())
+        data = zlib.decompress(hf.read())
+        hf.close()
+    except:
+        return None
+    if ((magic != HITINDEX_MAGIC) or (header["identity"] != identity) or
+        (header["terms"] != [binascii.hexlify(term) for term in terms])):
+        return None
+    count = header["count"]
+    if (len(data) != count * 9):
+        return None
+    deltas = struct.unpack("<" + str(count) + "Q", data[:count * 8])
+    pids = array.array("B", data[count * 8:])
+    hits = []
+    offset = 0
+    for idx in range(count):
+        offset += deltas[idx]
+        hits.append((pids[idx], offset))
+    return hits
+
+# Writes a list of (pattern_id, file offset) hits (in offset order) to a hit index file. See "load_hitindex" for the format.
+# "version" is the writing script's version string (recorded in the header).
+# Writes to a temporary file first so an interrupted run cannot leave a partial hit index behind.
+def save_hitindex(path, identity, terms, hits, version):
+    deltas = []
+    pids = array.array("B")
+    prev_offset = 0
+    for pid, offset in hits:
+        deltas.append(offset - prev_offset)
+        pids.append(pid)
+        prev_offset = offset
+    header = {"identity" : identity, "terms" : [binascii.hexlify(term) for term in terms], "count" : len(hits), "version" : version}
+    try:
+        hf = open(path + ".tmp", "wb")
+        hf.write(HITINDEX_MAGIC + "\n")
+        hf.write(json.dumps(header, sort_keys=True) + "\n")
+        hf.write(zlib.compress(struct.pack("<" + str(len(deltas)) + "Q", *deltas) + pids.tostring()))
+        hf.close()
+        if (os.path.exists(path)):
+            os.remove(path) # os.rename will not replace an existing file on Windows
+        os.rename(path + ".tmp", path)
+    except:
+        print("Trouble writing hit index file " + path)
+        exctype, value = sys.exc_info()[:2]
+        print("Exception type = ",exctype,", value = ",value)
+        return False
+    return True
+
+# Generator which passes hits through unchanged while also appending them to hitlist.
+# Used to save streamed hits to a hit index file once they have all been processed.
+def recordhits(hits, hitlist):
+    for hit in hits:
+        hitlist.append(hit)
+        yield hit
+
+# Streaming duplicate record filter keyed by a SHA1 hash of each record's canonical fields (see "check").
+# The first "budget" distinct records are remembered exactly (hash -> key of the first copy) so the offsets of their
+# duplicates can be listed with the first copy. Once the budget is reached, new hashes go into a Bloom filter
+# (sized for BLOOM_CAPACITY times the budget at a BLOOM_ERROR_RATE false positive rate) which still drops duplicates
+# but cannot say which record they copy (and may drop a unique record at the false positive rate).
+# Once that many records have been added, the Bloom filter is full (its false positive rate would keep climbing) so
+# later records are passed through without being checked (see "incomplete").
+class RecordDeduper(object):
+    def __init__(self, budget):
+        self.budget = budget
+        self.exact = {} # first copy's key keyed by record hash
+        self.duplicates = {} # list of duplicate offsets keyed by first copy's key
+        self.listed = 0 # number of duplicates found in the exact set
+        self.unlisted = 0 # number of duplicates found in the Bloom filter
+        self.unchecked = 0 # number of records passed through (not checked) once the Bloom filter was full
+        self.capacity = BLOOM_CAPACITY * budget # max number of records added to the Bloom filter
+        self.bloomcount = 0 # number of records added to the Bloom filter
+        self.numbits = max(8, int(math.ceil(-BLOOM_CAPACITY * budget * math.log(BLOOM_ERROR_RATE) / (math.log(2) ** 2))))
+        self.numhashes = max(1, int(round(math.log(2) * self.numbits / (BLOOM_CAPACITY * budget))))
+        self.bloom = None # bytearray of numbits bits (only allocated once the budget is reached)
+
+    # Returns the Bloom filter bit positions for a record hash (double hashing of two 64 bit halves of the SHA1)
+    def bloombits(self, digest):
+        h1, h2 = struct.unpack("<QQ", digest[:16])
+        return [(h1 + i * h2) % self.numbits for i in range(self.numhashes)]
+
+    # Returns True if the record (a sequence of str/unicode canonical fields) was already seen otherwise remembers it
+    # (under "key" eg its offset) and returns False. Duplicates of exactly remembered records have their "offset" listed.
+    def check(self, fields, key, offset):
+        digest = hashlib.sha1("\x00".join([field.encode("utf-8") if isinstance(field, unicode) else field for field in fields])).digest()
+        firstkey = self.exact.get(digest)
+        if (firstkey != None):
+            self.duplicates.setdefault(firstkey, []).append(offset)
+            self.listed += 1
+            return True
+        if (len(self.exact) < self.budget):
+            self.exact[digest] = key
+            return False
+        if (self.bloomcount >= self.capacity):
+            self.unchecked += 1 # a full Bloom filter would drop too many unique records
+            return False
+        if (self.bloom == None):
+            self.bloom = bytearray((self.numbits + 7) // 8)
+        bits = self.bloombits(digest)
+        if (all([self.bloom[bit >> 3] & (1 << (bit & 7)) for bit in bits])):
+            self.unlisted += 1
+            return True
+        for bit in bits:
+            self.bloom[bit >> 3] |= (1 << (bit & 7))
+        self.bloomcount += 1
+        return False
+
+    # Returns a note on why the Duplicate_Offsets column is incomplete (or "" if every duplicate was found and listed)
+    def incomplete(self):
+        notes = []
+        if (self.unlisted > 0):
+            notes.append(str(self.unlisted) + " duplicates found beyond the exact budget are not listed")
+        if (self.unchecked > 0):
+            notes.append(str(self.unchecked) + " records after the Bloom filter filled were not deduplicated")
+        return ("; ".join(notes))
+
+    # Returns the Duplicate_Offsets column header (noting if the column is incomplete)
+    def header(self):
+        if (self.incomplete() == ""):
+            return ("Duplicate_Offsets")
+        return ("Duplicate_Offsets (incomplete: " + self.incomplete() + ")")
+
+    # Returns the duplicate offsets of the record stored under "key" as a compact list column (eg "0x1a2,0x3b4")
+    def offsets(self, key):
+        return (",".join([hex(offset).rstrip("L") for offset in self.duplicates.get(key, [])]))
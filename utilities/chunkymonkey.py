@@ -23,12 +23,20 @@
 # Searches for the hex 53004d00530074006500780074000000 using a chunk size of 2000000000 decimal bytes 
 # with a 1000 byte sized delta buffer.
 #
+# Example: python chunkymonkey.py test.bin 53004d00530074006500780074000000 10000000,100000000,2000000000 1000 -w 4 -r 3 -j results.json
+# Times each search method 3 times (keeping the fastest) for each of the 3 chunk sizes (and 4 worker processes for
+# the parallel methods) then writes the results to results.json.
+#
 # Issues: For Python 2, there's appears to be a size limitation on (chunksize + delta). It must be less than ~2147483647
 # This is probably because a Python int is implemented via a C long which is limited to 2^32 bits (ie max range is +/-2147483647).
 # See: https://docs.python.org/2/library/stdtypes.html#numeric-types-int-float-long-complex
 # Python 3 apparently does not have this limitation.
 #
 # v2015-08-19 = Fixed bug in chunking code where it was not processing the last chunk properly
+# v2026-10-17 = Added optional -w argument to also search the chunks with a pool of worker processes
+#               Now times each search method (incl. mmap) over a sweep of chunk sizes/deltas and reports MB/s,
+#               hits/s, peak RSS and a recommended chunk size. Optional -j argument writes the results to JSON.
+#               Input file can be the first segment of a split raw image (eg image.001) which reads all segments as one file (see "splitimage.py")
 #
 
 import os
@@ -38,10 +46,21 @@ import re
 import argparse
 import binascii
 import math
+import multiprocessing
+import mmap
+import timeit
+import json
+from splitimage import split_segments, open_image, image_stat
+try:
+    import resource # for peak RSS (not available on Windows)
+except ImportError:
+    resource = None
 
 # Find all indices of a substring in a given string (using string.find) 
 # From http://code.activestate.com/recipes/499314-find-all-indices-of-a-substring-in-a-given-string/
-def all_indices(bigstring, substring, listindex=[], offset=0):
+def all_indices(bigstring, substring, listindex=None, offset=0):
+    if (listindex == None):
+        listindex = [] # a new list for each call (a default list would be shared between calls)
     i = bigstring.find(substring, offset)
     while i >= 0:
         listindex.append(i)
@@ -50,7 +69,9 @@ def all_indices(bigstring, substring, listindex=[], offset=0):
 
 # Find all indices of the "pattern" regular expression in a given string (using regex)
 # Where pattern is a compiled Python re pattern object (ie the output of "re.compile")
-def regsearch(bigstring, pattern, listindex=[]):
+def regsearch(bigstring, pattern, listindex=None):
+    if (listindex == None):
+        listindex = [] # a new list for each call (a default list would be shared between calls)
     hitsit = pattern.finditer(bigstring)
     for it in hitsit:
         # iterators only last for one shot so we capture the offsets to a list
@@ -63,14 +84,14 @@ def regsearch(bigstring, pattern, listindex=[]):
 def sliceNsearch(filename, chunksize, delta, term):
     final_hitlist = [] # list of file offsets which contain the search term
     try:
-        fd = open(filename, mode="rb")
+        fd = open_image(filename)
     except:
         print("Problems Opening Input File")
         exctype, value = sys.exc_info()[:2]
         print("Exception type = ",exctype,", value = ",value) 
         exit(-1)
 
-    stats = os.stat(filename)
+    stats = image_stat(fd)
     #print("sliceNsearch Input file " + filename + " is " + str(stats.st_size) + " bytes\n")
     begin_chunk = 0
 
@@ -117,14 +138,14 @@ def sliceNsearchRE(filename, chunksize, delta, term):
     pattern = re.compile(term, re.DOTALL) # should only really call this once at start, if same substring.
 
     try:
-        fd = open(filename, mode="rb")
+        fd = open_image(filename)
     except:
         print("Problems Opening Input File")
         exctype, value = sys.exc_info()[:2]
         print("Exception type = ",exctype,", value = ",value) 
         exit(-1)
 
-    stats = os.stat(filename)
+    stats = image_stat(fd)
     #print("sliceNsearchRE Input file " + filename + " is " + str(stats.st_size) + " bytes\n")
     begin_chunk = 0
 
@@ -163,11 +184,69 @@ def sliceNsearchRE(filename, chunksize, delta, term):
     fd.close()
     return(final_hitlist)
 
+# Worker function for the parallel searches. Searches one chunk of the file (plus delta bytes) and 
+# returns the file offsets of hits which start inside the chunk. Each worker opens its own file handle.
+# Uses "regsearch" if useRE is True otherwise "all_indices".
+def searchchunk(args):
+    filename, begin_chunk, chunksize, delta, term, useRE = args
+    chunk_hitlist = []
+    fd = open_image(filename)
+    fd.seek(begin_chunk)
+    rawchunk = fd.read(chunksize + delta) # read returns less at EOF
+    fd.close()
+    if (useRE):
+        subhits = regsearch(rawchunk, re.compile(term, re.DOTALL), [])
+    else:
+        subhits = all_indices(rawchunk, term, [])
+    for hit in subhits :
+        if (hit < chunksize) :
+            chunk_hitlist.append(begin_chunk + hit)
+        else :
+            break # hit should be processed in next chunk
+    return(chunk_hitlist)
+
+# Searches the chunks of a file concurrently with a pool of worker processes and returns file offsets of any hits.
+# Chunks follow the same chunksize/delta rules as "sliceNsearch" so the hits (and their order) are the same.
+# Worker processes are forked so this is not available on Windows (returns None).
+def parallelslice(filename, chunksize, delta, term, workers, useRE):
+    if (not hasattr(os, "fork")):
+        print("Parallel search is not supported on this platform")
+        return None
+    final_hitlist = [] # list of file offsets which contain the search term
+    try:
+        fd = open_image(filename)
+        stats = image_stat(fd)
+        fd.close()
+    except:
+        print("Problems Opening Input File")
+        exctype, value = sys.exc_info()[:2]
+        print("Exception type = ",exctype,", value = ",value) 
+        exit(-1)
+    tasks = [(filename, begin_chunk, chunksize, delta, term, useRE) for begin_chunk in range(0, stats.st_size, chunksize)]
+    if hasattr(multiprocessing, "get_context"):
+        pool = multiprocessing.get_context("fork").Pool(workers) # Python 3 (default may not be fork)
+    else:
+        pool = multiprocessing.Pool(workers)
+    results = pool.map(searchchunk, tasks, 1) # results are in chunk order
+    pool.close()
+    pool.join()
+    for chunk_hitlist in results:
+        final_hitlist.extend(chunk_hitlist)
+    return(final_hitlist)
+
+# Parallel version of "sliceNsearch" (calls "all_indices" in each worker)
+def parallelsliceNsearch(filename, chunksize, delta, term, workers):
+    return(parallelslice(filename, chunksize, delta, term, workers, False))
+
+# Parallel version of "sliceNsearchRE" (calls "regsearch" in each worker)
+def parallelsliceNsearchRE(filename, chunksize, delta, term, workers):
+    return(parallelslice(filename, chunksize, delta, term, workers, True))
+
 # Basic read everything and wait method (calls "all_indices" function)
 def wholeread(filename, substring):
     hits = []
     try:
-        fd = open(filename, mode="rb")
+        fd = open_image(filename)
     except:
         print("Problems Opening Input File")
         exctype, value = sys.exc_info()[:2]
@@ -182,7 +261,7 @@ def wholeread(filename, substring):
 def wholereadRE(filename, substring):
     hits = []
     try:
-        fd = open(filename, mode="rb")
+        fd = open_image(filename)
     except:
         print("Problems Opening Input File")
         exctype, value = sys.exc_info()[:2]
@@ -194,47 +273,178 @@ def wholereadRE(filename, substring):
     fd.close()
     return hits
 
+# Memory mapped read method (calls "all_indices" function ie bytes.find on the mapped file)
+def mmapsearch(filename, substring):
+    hits = []
+    try:
+        fd = open_image(filename)
+        mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    except:
+        print("Problems Memory Mapping Input File")
+        exctype, value = sys.exc_info()[:2]
+        print("Exception type = ",exctype,", value = ",value) 
+        exit(-1)
+    hits = all_indices(mm, substring, [])
+    mm.close()
+    fd.close()
+    return hits
+
+# Memory mapped read method (calls "regsearch" function)
+def mmapsearchRE(filename, substring):
+    hits = []
+    try:
+        fd = open_image(filename)
+        mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    except:
+        print("Problems Memory Mapping Input File")
+        exctype, value = sys.exc_info()[:2]
+        print("Exception type = ",exctype,", value = ",value) 
+        exit(-1)
+    pattern = re.compile(substring, re.DOTALL)
+    hits = regsearch(mm, pattern, [])
+    mm.close()
+    fd.close()
+    return hits
+
+# Returns the peak resident set size (in MB) of this process or of its largest finished child process
+# (eg parallel search workers). Returns None if the resource module is not available (eg Windows).
+def peak_rss():
+    if (resource == None):
+        return None
+    maxrss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    if (sys.platform == "darwin"):
+        return(maxrss / 1048576.0) # bytes on OS X
+    return(maxrss / 1024.0) # kilobytes on Linux
+
+# Times one call of a search method and puts (elapsed seconds, hits, peak RSS in MB) on the queue.
+# Called in a forked child process by "benchmark".
+def timesearch(searchfunc, funcargs, queue):
+    start = timeit.default_timer()
+    hits = searchfunc(*funcargs)
+    elapsed = timeit.default_timer() - start
+    queue.put((elapsed, hits, peak_rss()))
+
+# Calls a search method "repeats" times and returns (fastest elapsed seconds, hits, peak RSS in MB).
+# Where os.fork is available, each run is done in its own forked process so that the peak RSS of one method
+# does not carry over into the next. Otherwise the runs are done in this process and the peak RSS is cumulative.
+def benchmark(searchfunc, funcargs, repeats):
+    times = []
+    hits = None
+    maxrss = None
+    for run in range(repeats):
+        if hasattr(os, "fork"):
+            if hasattr(multiprocessing, "get_context"):
+                ctx = multiprocessing.get_context("fork") # Python 3 (default may not be fork)
+            else:
+                ctx = multiprocessing
+            queue = ctx.Queue()
+            proc = ctx.Process(target=timesearch, args=(searchfunc, funcargs, queue))
+            proc.start()
+            elapsed, hits, rss = queue.get() # get before join so a large hit list cannot block the child
+            proc.join()
+        else:
+            start = timeit.default_timer()
+            hits = searchfunc(*funcargs)
+            elapsed = timeit.default_timer() - start
+            rss = peak_rss()
+        times.append(elapsed)
+        if (rss != None):
+            maxrss = max(rss, maxrss) if (maxrss != None) else rss
+    return(min(times), hits, maxrss)
+
+# Converts a comma separated string of decimal byte sizes (eg "1000000,2000000000") into a list of ints (for argparse)
+def intlist(sizes):
+    return [int(size) for size in sizes.split(",")]
+
 # Main
-version_string = "chunkymonkey.py v2015-08-19"
+version_string = "chunkymonkey.py v2026-10-17"
 print("Running " + version_string + "\n")
 
-parser = argparse.ArgumentParser(description='Helps find optimal chunk sizes when searching large binary files for a known hex string')
-parser.add_argument("inputfile", help='File to be searched')
+parser = argparse.ArgumentParser(description='Benchmarks search methods/chunk sizes when searching large binary files for a known hex string')
+parser.add_argument("inputfile", help='File to be searched (or first segment of a split raw image eg image.001)')
 parser.add_argument("term", help='Hex Search string eg 53004d00')
-parser.add_argument("chunksize", type=int, help="Size of each chunk (in decimal bytes)")
-parser.add_argument("delta", type=int, help="Size of the extra read buffer (in decimal bytes)")
+parser.add_argument("chunksize", type=intlist, help="Size of each chunk (in decimal bytes). Use commas to sweep several sizes eg 1000000,100000000,2000000000")
+parser.add_argument("delta", type=intlist, help="Size of the extra read buffer (in decimal bytes). Use commas to sweep several sizes eg 100,1000")
+parser.add_argument("-w", "--workers", type=int, default=0, help="(Optional) Also search the chunks with this many worker processes")
+parser.add_argument("-r", "--repeats", type=int, default=1, help="(Optional) Run each method this many times and report the fastest (default 1)")
+parser.add_argument("-j", "--json", dest="jsonfile", help="(Optional) Write the results to this JSON file (eg to track results between releases)")
 
 args = parser.parse_args()
 searchterm = binascii.unhexlify(args.term) # convert input hex string into its binary representation to use in searches
-print("Search term is: " + binascii.hexlify(searchterm))
+print("Search term is: " + binascii.hexlify(searchterm).decode("ascii"))
+try:
+    fd = open_image(args.inputfile)
+    filesize = image_stat(fd).st_size
+    fd.close()
+except:
+    print("Problems Opening Input File")
+    exctype, value = sys.exc_info()[:2]
+    print("Exception type = ",exctype,", value = ",value) 
+    exit(-1)
+filesizeMB = filesize / 1048576.0
+print("Input file is " + str(filesize) + " bytes, running each method " + str(args.repeats) + " time(s)\n")
 
 # For benchmark monitoring (via the "-m cProfile" arg), we have each string search method called from its own function
-hits = sliceNsearch(args.inputfile, args.chunksize, args.delta, searchterm)
-rehits = sliceNsearchRE(args.inputfile, args.chunksize, args.delta, searchterm)
-print("Chunky sliceNsearch hits = " + str(len(hits)) + ", Chunky sliceNsearchRE hits = " + str(len(rehits)))
-if (len(hits) != len(rehits)):
-    print("Hit length mismatch for chunky searches!")
-else:
-    # check hit offsets are same
-    for jj in range(len(hits)):
-        if (hits[jj] != rehits[jj]):
-            print("Chunky hit MISMATCH at index " + str(jj) + ", sliceNsearch hit at " + str(hits[jj]) + ", sliceNsearchRE hit at " + str(rehits[jj]))
-#        else:
-#            print("Chunky hit at index " + str(jj) + ", sliceNsearch hit at " + str(hits[jj]) + ", sliceNsearchRE hit at " + str(rehits[jj]))
-
-# Simple read for comparison (no chunking, reads file into one big BINARY string before calling "all_indices"
-whits = wholeread(args.inputfile, searchterm)
-# Simple read for comparison (no chunking, reads file into one big BINARY string before calling "regsearch"
-whitsre = wholereadRE(args.inputfile, searchterm)
-print("Wholeread all_indices hits = " + str(len(whits)) + ", Wholeread regsearch hits = " + str(len(whitsre)) )
-if (len(whits) != len(whitsre)):
-    print("Hit length mismatch for simple searches!")
-else:
-    # check hit offsets are same
-    for jj in range(len(whits)):
-        if (whits[jj] != whitsre[jj]):
-            print("Simple hit MISMATCH at index " + str(jj) + ", all_indices hit at " + str(whits[jj]) + ", regsearch hit at " + str(whitsre[jj]))
-#        else:
-#            print("Simple hit at index " + str(jj) + ", all_indices hit at " + str(whits[jj]) + ", regsearch hit at " + str(whitsre[jj]))
+# Each entry is [method name, function, function args, chunksize, delta, workers]
+methods = []
+for chunksize in args.chunksize:
+    for delta in args.delta:
+        methods.append(["sliceNsearch", sliceNsearch, (args.inputfile, chunksize, delta, searchterm), chunksize, delta, 0])
+        methods.append(["sliceNsearchRE", sliceNsearchRE, (args.inputfile, chunksize, delta, searchterm), chunksize, delta, 0])
+        if ((args.workers > 0) and hasattr(os, "fork")):
+            methods.append(["parallelsliceNsearch", parallelsliceNsearch, (args.inputfile, chunksize, delta, searchterm, args.workers), chunksize, delta, args.workers])
+            methods.append(["parallelsliceNsearchRE", parallelsliceNsearchRE, (args.inputfile, chunksize, delta, searchterm, args.workers), chunksize, delta, args.workers])
+# Simple reads for comparison (no chunking, reads file into one big BINARY string before calling "all_indices" (ie bytes.find) or "regsearch")
+methods.append(["wholeread", wholeread, (args.inputfile, searchterm), None, None, 0])
+methods.append(["wholereadRE", wholereadRE, (args.inputfile, searchterm), None, None, 0])
+numsegments = len(split_segments(args.inputfile))
+if (numsegments > 1):
+    print("Input file is a split raw image (" + str(numsegments) + " segments) ... skipping the mmap methods\n")
+elif (filesize > 0): # cannot mmap an empty file
+    methods.append(["mmapsearch", mmapsearch, (args.inputfile, searchterm), None, None, 0])
+    methods.append(["mmapsearchRE", mmapsearchRE, (args.inputfile, searchterm), None, None, 0])
+
+results = []
+refhits = None # hits from the first method are used to check the others
+print("%-24s %12s %6s %3s %10s %10s %10s %12s %9s" % ("Method", "Chunksize", "Delta", "W", "Seconds", "MB/s", "Hits", "Hits/s", "PeakRSS"))
+for name, searchfunc, funcargs, chunksize, delta, workers in methods:
+    elapsed, hits, maxrss = benchmark(searchfunc, funcargs, args.repeats)
+    if (refhits == None):
+        refhits = hits
+    result = {"method" : name, "chunksize" : chunksize, "delta" : delta, "workers" : workers,
+              "seconds" : elapsed, "hits" : len(hits), "hits_match" : (hits == refhits), "peak_rss_mb" : maxrss,
+              "mb_per_sec" : (filesizeMB / elapsed) if (elapsed > 0) else None,
+              "hits_per_sec" : (len(hits) / elapsed) if (elapsed > 0) else None}
+    results.append(result)
+    print("%-24s %12s %6s %3s %10.4f %10s %10d %12s %9s" % (name, chunksize if (chunksize != None) else "-", delta if (delta != None) else "-", workers if workers else "-", elapsed,
+        "%.1f" % result["mb_per_sec"] if (result["mb_per_sec"] != None) else "-", len(hits),
+        "%.1f" % result["hits_per_sec"] if (result["hits_per_sec"] != None) else "-",
+        "%.1fMB" % maxrss if (maxrss != None) else "-"))
+
+mismatches = [result for result in results if not result["hits_match"]]
+for result in mismatches:
+    print("Hit MISMATCH for " + result["method"] + " (chunksize = " + str(result["chunksize"]) + ", delta = " + str(result["delta"]) + ") compared to " + results[0]["method"])
 
+# Recommend the chunksize/delta with the fastest sliceNsearchRE (the method used by the WP8 scripts)
+recommendation = None
+chunkyresults = [result for result in results if ((result["method"] == "sliceNsearchRE") and result["hits_match"])]
+if (len(chunkyresults) > 0):
+    best = min(chunkyresults, key=lambda result: result["seconds"])
+    fastest = min(results, key=lambda result: result["seconds"])
+    recommendation = {"chunksize" : best["chunksize"], "delta" : best["delta"], "fastest_method" : fastest["method"]}
+    print("\nRecommended chunksize = " + str(best["chunksize"]) + ", delta = " + str(best["delta"]) + " (fastest sliceNsearchRE)")
+    print("Fastest method overall = " + fastest["method"] + " (" + ("%.4f" % fastest["seconds"]) + " seconds)")
 
+if (args.jsonfile != None):
+    report = {"version" : version_string, "python" : sys.version.split()[0], "platform" : sys.platform,
+              "cpu_count" : multiprocessing.cpu_count(), "inputfile" : args.inputfile, "filesize" : filesize,
+              "term" : args.term, "repeats" : args.repeats, "results" : results, "recommendation" : recommendation}
+    try:
+        with open(args.jsonfile, "w") as jf:
+            json.dump(report, jf, indent=2, sort_keys=True)
+        print("\nResults written to " + args.jsonfile)
+    except:
+        print("Problems Writing JSON File")
+        exctype, value = sys.exc_info()[:2]
+        print("Exception type = ",exctype,", value = ",value) 
+        exit(-1)
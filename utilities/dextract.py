@@ -18,18 +18,47 @@
 #
 # Version History:
 # v2013-12-11 Initial Version
+# v2026-10-17 Input file can be the first segment of a split raw image (eg image.001) which reads all segments as one file (see "splitimage.py")
+#             Template definition file is compiled once into a plan of field decoders (see "compile_plan")
+#             Added -b option to bulk decode templates with fixed size records (see "bulk_parse_records")
+#             Added -s option to parse a record at each hit of a hex signature (instead of back to back records)
+#             and -p option to parse those records with a pool of worker processes
+#             Input file size is only read once, added -v option to turn off the per field output,
+#             buffered the TSV output and print a records/s, fields/s summary
+#             Added -q option to write one row per record (one column per template field) to a SQLite database
+#             Special date types are decoded from byte strings (struct/lookup tables instead of building hex strings
+#             a byte at a time) and can be bulk decoded. Added -g option to check/time these decoders.
+#             Dates are formatted through a least recently used cache (see "format_date"), a whole column at a time for -b
+#             Input can be a directory or glob pattern. Each file is extracted into the same TSV/SQLite output
+#             (tagged by filename) with -p worker processes, reporting each file's throughput/errors (see "iextractfiles")
 
 # Instructions:
-# (Mandatory) Use the -f argument to specify the input file you wish to search
+# (Mandatory) Use the -f argument to specify the input file you wish to search (or the first segment of a split raw image eg image.001)
+#             or a directory/quoted glob pattern (eg "/cases/*.bin") to extract the records from each of its files.
+#             An error in one file does not stop the remaining files from being extracted.
 # (Mandatory) Use the -t argument to specify the template definition file (specifies field offsets from a known search term field)
 # (Optional) Use the -o argument to output results to the specified Tab Seperated Variable file
 # (Optional) Use the -a argument to specify a start offset (decimal). Default value is 0.
 # (Optional) Use the -z argument to specify an end offset (decimal). Default value is end of file.
+# (Optional) Use the -b argument to bulk decode records if the template has a fixed record size
+#            (ie no null terminated/deferred sized fields)
+# (Optional) Use the -s argument to specify a hex signature (eg 534D5300). A record is parsed at each hit of the signature
+#            between the start and end offsets (the template's first field starts at the signature).
+#            An error in one record does not stop the remaining records from being parsed.
+# (Optional) Use the -p argument (with -s) to parse the records with a pool of worker processes (eg 8)
+#            or (with a directory/glob -f) to extract that many files at a time.
+# (Optional) Use the -q argument to write one row per record (one column per template field) to the specified SQLite database.
+#            The "records" table has filename, offset (of the record) and field columns (plus a "<field>_date" column for dates).
+# (Optional) Use the -g argument (by itself) to check the special date decoders against golden values and time them.
+# (Optional) Use the -v argument to set the verbosity level. 0 = only print errors and a summary (fastest),
+#            1 = print every extracted field (default).
 #
 # It was developed/tested on SIFT v2.14 (Ubuntu 9.10 Karmic) running Python v2.6.4.
 #
 # Usage Example:
 # python dextract.py -f /mnt/hgfs/SIFT_WORKSTATION_2.14_SHARE/meow.bin -d meow.def -o meow.tsv -a 350 -z 428
+# python dextract.py -f /mnt/hgfs/SIFT_WORKSTATION_2.14_SHARE/meow.bin -d meow.def -o meow.tsv -s 4D454F57 -p 8
+# python dextract.py -f "/mnt/hgfs/SIFT_WORKSTATION_2.14_SHARE/*.bin" -d meow.def -o meow.tsv -q meow.db -s 4D454F57 -p 8 -v 0
 #
 # References:
 # http://sandersonforensics.com/forum/content.php?131-A-brief-history-of-time-stamps
@@ -41,15 +70,43 @@ import struct
 from optparse import OptionParser
 import os
 import string
+import binascii
+import multiprocessing
+import cStringIO
+import time
+import sqlite3
+import glob
+import tempfile
+import shutil
 
 import pprint
+import collections
+from splitimage import split_segments, open_image, image_stat
 
-version_string = "dextract v2013-12-11 Initial Version"
+version_string = "dextract v2026-10-17"
 
 # Global variables for storing template definition file values
 field_names = [] # stores field_names 
 num_types_dict = {} # stores num_types (keyed by field_name)
 type_dict = {} # stores types (keyed by field_name)
+record_plan = [] # compiled template (list of field decoders) used by parse_record (see "compile_plan")
+BULK_SIZE = 1024*1024 # size of the blocks of records read by bulk_parse_records (rounded down to whole records)
+CHUNK_SIZE = 67108864 # size of each chunk read when searching for the signature (64 MB)
+ANCHOR_BATCH = 256 # number of signature hits parsed by each "parseanchors" worker task
+OUTPUT_BUFFER_SIZE = 1048576 # size of the TSV output file write buffer (1 MB)
+verbose = 1 # verbosity level (0 = errors and summary only, 1 = print every extracted field)
+filesize = 0 # size of the input file (read once)
+fieldcount = 0 # number of fields extracted (for the summary)
+DATE_CACHE_SIZE = 65536 # max number of ISO date strings remembered by "format_date"
+date_cache = collections.OrderedDict() # ISO date strings keyed by (date conversion function, raw value) in least recently used order (see "format_date")
+BCD_HEX = ["%02x" % val for val in range(256)] # raw BCD string for each byte value
+BCD_DIGITS = [((val >> 4)*10 + (val & 0xF)) if (((val >> 4) < 10) and ((val & 0xF) < 10)) else -1 for val in range(256)] # decimal value of each BCD byte (-1 if not BCD)
+DB_BATCH_SIZE = 10000 # number of record rows inserted (and committed) at a time into the SQLite output database
+db = None # SQLite output database connection (if -q was specified)
+db_columns = [] # list of (column name, record_values key) for the SQLite output table (see "record_columns")
+db_insert = "" # SQL statement for inserting a record row
+dbrows = [] # record rows waiting to be inserted into the SQLite output database
+record_values = {} # values (and interpreted dates) of the fields of the current record keyed by field name
 
 # Function to return unpack string & size of type declared in template definition file.
 # Will return 0 for unknown types and deferred types. eg something with size set
@@ -103,209 +160,207 @@ def find_type_size(strg):
         return "Unknown", 0
 #ends find_type_size
 
-# Returns ISO date string (YYY-MM-DDThh:mm:ss) given a raw value and date field type.
+# Returns ISO date string (YYYY-MM-DDThh:mm:ss) given a number of secs since 1JAN1970 or "Unknown" if invalid
+def iso_date(secs):
+    try:
+        return (datetime.datetime.fromtimestamp(secs).strftime('%Y-%m-%dT%H:%M:%S'))
+    except:
+        return ("Unknown")
+#ends iso_date
+
+# Date conversion functions. Each returns an ISO date string given a raw value of its date type.
 # "val" will usually be an integer value. Except for BCD type datetimes which require a string
 # and DOSDATE which requires 2 shorts combined in 1 int.
-def calc_date(val, field):
-    datetimestr = ""
-    if ("OSX32" in type_dict[field].upper()):
-        # difference between 1jan1970 and 1jan2001 = 978307200 secs
-        #print "OSX32 date string is: " + datetime.datetime.fromtimestamp(val + 978307200).strftime('%Y-%m-%dT%H:%M:%S')
-        try: 
-            datetimestr = datetime.datetime.fromtimestamp(val + 978307200).strftime('%Y-%m-%dT%H:%M:%S')
-        except:
-            datetimestr = "Unknown"
-        return (datetimestr)
-    elif ( ("UNIX32" in type_dict[field].upper()) or ("UNIX10DIGDEC" in type_dict[field].upper()) ):
-        #print "UNIX date string is: " + datetime.datetime.fromtimestamp(val).strftime('%Y-%m-%dT%H:%M:%S')
-        try: 
-            datetimestr = datetime.datetime.fromtimestamp(val).strftime('%Y-%m-%dT%H:%M:%S')
-        except:
-            datetimestr = "Unknown"
-        return (datetimestr)        
-    elif ("GPS32" in type_dict[field].upper()):
-        # difference between 1jan1970 and 6jan1980 = 315964800 secs
-        #print "GPS32 date string is: " + datetime.datetime.fromtimestamp(val + 315964800).strftime('%Y-%m-%dT%H:%M:%S')
-        try: 
-            datetimestr = datetime.datetime.fromtimestamp(val + 315964800).strftime('%Y-%m-%dT%H:%M:%S')
-        except:
-            datetimestr = "Unknown"
-        return (datetimestr)
-    elif ("AOL32" in type_dict[field].upper()):
-        # difference between 1jan1970 and 1jan1980 = 315532800 secs
-        #print "AOL32 date string is: " + datetime.datetime.fromtimestamp(val + 315532800).strftime('%Y-%m-%dT%H:%M:%S')
-        try: 
-            datetimestr = datetime.datetime.fromtimestamp(val + 315532800).strftime('%Y-%m-%dT%H:%M:%S')
-        except:
-            datetimestr = "Unknown"
-        return (datetimestr)
-    elif ("HFS32" in type_dict[field].upper()):
-        # difference between 1jan1904 and 1jan1970 = 2082844800 secs
-        #print "HFS32 date string is: " + datetime.datetime.fromtimestamp(val - 2082844800).strftime('%Y-%m-%dT%H:%M:%S')
-        try: 
-            datetimestr = datetime.datetime.fromtimestamp(val - 2082844800).strftime('%Y-%m-%dT%H:%M:%S')
-        except:
-            datetimestr = "Unknown"
-        return (datetimestr)
-    elif ( ("UNIX48MS" in type_dict[field].upper()) or ("UNIX13DIGDEC" in type_dict[field].upper()) ):
-        #print "UNIX48MS/UNIX13DIGDEC date string is: " + datetime.datetime.fromtimestamp(val/1000.0).strftime('%Y-%m-%dT%H:%M:%S')
-        try: 
-            datetimestr = datetime.datetime.fromtimestamp(val/1000.0).strftime('%Y-%m-%dT%H:%M:%S')
-        except:
-            datetimestr = "Unknown"
-        return (datetimestr)
-    elif ("BCD12" in type_dict[field].upper()):
-        #print "Raw BCD12 string is: " + val
-        # Assumes BCD12 is BE eg 071231125423 = 31DEC2007T12:54:23 = yymmddhhmnss
-        try:
-            yy = int(val[0:2])
-            mm = int(val[2:4])
-            dd = int(val[4:6])
-            hh = int(val[6:8])
-            mn = int(val[8:10])
-            ss = int(val[10:])
-            year = 2000 + yy
-            #print "BCD12 date is: " + datetime.datetime(year, mm, dd, hh, mn, ss).strftime('%Y-%m-%dT%H:%M:%S')
-            datetimestr = datetime.datetime(year, mm, dd, hh, mn, ss).strftime('%Y-%m-%dT%H:%M:%S')
-        except:
-            datetimestr = "Unknown"
-        return (datetimestr)
-    elif ("BCD14" in type_dict[field].upper()):
-        #print "Raw BCD14 string is: " + val
-        # Assumes BCD14 is BE eg 20071231125423 = 31DEC2007T12:54:23 = yyyymmddhhmnss
-        try:
-            yy = int(val[0:4])
-            mm = int(val[4:6])
-            dd = int(val[6:8])
-            hh = int(val[8:10])
-            mn = int(val[10:12])
-            ss = int(val[12:])
-            #print "BCD14 date is: " + datetime.datetime(yy, mm, dd, hh, mn, ss).strftime('%Y-%m-%dT%H:%M:%S')
-            datetimestr = datetime.datetime(yy, mm, dd, hh, mn, ss).strftime('%Y-%m-%dT%H:%M:%S')
-        except:
-            datetimestr = "Unknown"
-        return (datetimestr)
-    elif ("DOSDATE" in type_dict[field].upper()):
-        # For ease of processing, relies on extract_DOSdate returning an int in LE form 
-        # (regardless of raw hex string being BE/LE)
-        # The "default" LE int data struct has 2 words (in order) DATE, TIME
-        # The "word swapped" LE int data struct has 2 words (in order) TIME, DATE
-        # Where DATE = 16 bit word => (msb) 7bit Year since 1980, 4bit month, 5bit day (lsb)
-        # Where TIME = 16 bit word => (msb) 5bit Hours, 6bit minutes, 5bit seconds x 2 (lsb)
-        #print "DD val = %0x" % val
-        if ("DOSDATE_DEFAULT" in type_dict[field].upper()): # "normal" DOSDATE
-            datehalf = val >> 16
-            timehalf = val & 0xFFFF
-        elif ("DOSDATE_WORDSWAPPED" in type_dict[field].upper()): # word swapped DOSDATE
-            timehalf = val >> 16
-            datehalf = val & 0xFFFF
-        else:
-            return ("Unknown")
-        #print "datehalf = %0x" % datehalf
-        #print "timehalf = %0x" % timehalf
-                
-        ss = ( (timehalf & 0b11111)*2); #LSB 5bits (0...4) x 2 equals secs
-        if (ss == 60):
-            ss = 59
-        mn = ( ((timehalf & 0b11111100000) >> 5)); #6bits (5...10) equals minutes
-        hh = ( ((timehalf & 0b1111100000000000) >> 11)); #5bits (11...15) equals hours
-        dd = ( (datehalf & 0b11111)); #5bits (0...4) equals day
-        mm = ( ((datehalf & 0b111100000) >> 5)); #4bits (5...8) equals month
-        yy = ( ((datehalf & 0b1111111000000000) >> 9)+1980); #7bits (9...16)+1980 equals year    
-        
-        try:
-            datetimestr = datetime.datetime(yy, mm, dd, hh, mn, ss).strftime('%Y-%m-%dT%H:%M:%S')
-        except:
-            datetimestr = "Unknown"
-        return (datetimestr)
-    else:
-        #print "Unknown Date Format!"
-        return ("Unknown Date Format")
-#ends calc_date
+def osx32_date(val):
+    # difference between 1jan1970 and 1jan2001 = 978307200 secs
+    return (iso_date(val + 978307200))
+
+def unix_date(val):
+    return (iso_date(val))
+
+def gps32_date(val):
+    # difference between 1jan1970 and 6jan1980 = 315964800 secs
+    return (iso_date(val + 315964800))
+
+def aol32_date(val):
+    # difference between 1jan1970 and 1jan1980 = 315532800 secs
+    return (iso_date(val + 315532800))
+
+def hfs32_date(val):
+    # difference between 1jan1904 and 1jan1970 = 2082844800 secs
+    return (iso_date(val - 2082844800))
+
+def unixms_date(val):
+    # UNIX48MS/UNIX13DIGDEC are ms since 1JAN1970
+    return (iso_date(val/1000.0))
 
-# Extract 6 byte ms since 1JAN1970. No python type for 6 byte int so we roll our own :(
+def bcd12_date(val):
+    # Assumes BCD12 is BE eg 071231125423 = 31DEC2007T12:54:23 = yymmddhhmnss
+    try:
+        yy = int(val[0:2])
+        mm = int(val[2:4])
+        dd = int(val[4:6])
+        hh = int(val[6:8])
+        mn = int(val[8:10])
+        ss = int(val[10:])
+        year = 2000 + yy
+        return (datetime.datetime(year, mm, dd, hh, mn, ss).strftime('%Y-%m-%dT%H:%M:%S'))
+    except:
+        return ("Unknown")
+
+def bcd14_date(val):
+    # Assumes BCD14 is BE eg 20071231125423 = 31DEC2007T12:54:23 = yyyymmddhhmnss
+    try:
+        yy = int(val[0:4])
+        mm = int(val[4:6])
+        dd = int(val[6:8])
+        hh = int(val[8:10])
+        mn = int(val[10:12])
+        ss = int(val[12:])
+        return (datetime.datetime(yy, mm, dd, hh, mn, ss).strftime('%Y-%m-%dT%H:%M:%S'))
+    except:
+        return ("Unknown")
+
+# For ease of processing, relies on extract_DOSdate returning an int in LE form 
+# (regardless of raw hex string being BE/LE)
+# The "default" LE int data struct has 2 words (in order) DATE, TIME
+# The "word swapped" LE int data struct has 2 words (in order) TIME, DATE
+# Where DATE = 16 bit word => (msb) 7bit Year since 1980, 4bit month, 5bit day (lsb)
+# Where TIME = 16 bit word => (msb) 5bit Hours, 6bit minutes, 5bit seconds x 2 (lsb)
+def dosdate(datehalf, timehalf):
+    ss = ( (timehalf & 0b11111)*2); #LSB 5bits (0...4) x 2 equals secs
+    if (ss == 60):
+        ss = 59
+    mn = ( ((timehalf & 0b11111100000) >> 5)); #6bits (5...10) equals minutes
+    hh = ( ((timehalf & 0b1111100000000000) >> 11)); #5bits (11...15) equals hours
+    dd = ( (datehalf & 0b11111)); #5bits (0...4) equals day
+    mm = ( ((datehalf & 0b111100000) >> 5)); #4bits (5...8) equals month
+    yy = ( ((datehalf & 0b1111111000000000) >> 9)+1980); #7bits (9...16)+1980 equals year    
+    try:
+        return (datetime.datetime(yy, mm, dd, hh, mn, ss).strftime('%Y-%m-%dT%H:%M:%S'))
+    except:
+        return ("Unknown")
+
+def dosdate_default_date(val):
+    return (dosdate(val >> 16, val & 0xFFFF)) # "normal" DOSDATE
+
+def dosdate_wordswapped_date(val):
+    return (dosdate(val & 0xFFFF, val >> 16)) # word swapped DOSDATE
+
+def unknown_dosdate(val):
+    return ("Unknown")
+
+def unknown_date(val):
+    return ("Unknown Date Format")
+
+# Returns the ISO date string for a raw value using the given date conversion function (eg unix_date).
+# Carved data often repeats the same timestamps (eg duplicate records in slack space) so results are remembered in
+# a least recently used cache of DATE_CACHE_SIZE entries keyed by (date conversion function, raw value).
+def format_date(datefunc, val):
+    key = (datefunc, val)
+    try:
+        datetimestr = date_cache.pop(key) # re-inserted below as the most recently used entry
+    except KeyError:
+        datetimestr = datefunc(val)
+        if (len(date_cache) >= DATE_CACHE_SIZE):
+            date_cache.popitem(last=False) # evict the least recently used entry
+    date_cache[key] = datetimestr
+    return (datetimestr)
+#ends format_date
+
+# Returns a list of ISO date strings for a list of raw values using the given date conversion function.
+# Each distinct value is only converted (or looked up) once.
+def format_dates(datefunc, vals):
+    dates = {}
+    for val in set(vals):
+        dates[val] = format_date(datefunc, val)
+    return ([dates[val] for val in vals])
+#ends format_dates
+
+# Returns the date conversion function for a date type declared in the template definition file.
+# Called once per field when the template is compiled (see "compile_plan") instead of for every extracted value.
+def find_date_func(strg):
+    if ("OSX32" in strg.upper()):
+        return (osx32_date)
+    elif ( ("UNIX32" in strg.upper()) or ("UNIX10DIGDEC" in strg.upper()) ):
+        return (unix_date)
+    elif ("GPS32" in strg.upper()):
+        return (gps32_date)
+    elif ("AOL32" in strg.upper()):
+        return (aol32_date)
+    elif ("HFS32" in strg.upper()):
+        return (hfs32_date)
+    elif ( ("UNIX48MS" in strg.upper()) or ("UNIX13DIGDEC" in strg.upper()) ):
+        return (unixms_date)
+    elif ("BCD12" in strg.upper()):
+        return (bcd12_date)
+    elif ("BCD14" in strg.upper()):
+        return (bcd14_date)
+    elif ("DOSDATE" in strg.upper()):
+        if ("DOSDATE_DEFAULT" in strg.upper()):
+            return (dosdate_default_date)
+        elif ("DOSDATE_WORDSWAPPED" in strg.upper()):
+            return (dosdate_wordswapped_date)
+        return (unknown_dosdate)
+    return (unknown_date)
+#ends find_date_func
+
+# Decoders for the special date types. Each one decodes a raw byte string read from the input file.
+# Like struct.unpack, they raise struct.error if the data is short (eg at the end of the file).
+
+# Decode 6 byte ms since 1JAN1970. No python type for 6 byte int so it is unpacked as a 4 byte and a 2 byte int.
 # Returns the number of ms since 1JAN1970
-def extract_unix48ms(f, isLE):
-    stringval = ""
-    for j in range(6):
-        val = struct.unpack("B", f.read(1))[0]
-        stringval += ("%02x" % val)
-        
-    stringval = "%012x" % int(stringval, 16)
-    # We should now have a hex string we can calculate a value from 
+def decode_unix48ms(data, isLE):
     # BE eg "013C1E44FC18" = dec 1357717503000
     # LE eg "18FC441E3C01"
     if (isLE):
-        adjustedstring = ""
-        # LE requires some monkeying around ... reverse string (in groups of 2 chars) and then process
-        for j in range(12, 0, -2):
-            adjustedstring += stringval[j-2:j]
-        value = int(adjustedstring, 16)
+        low, high = struct.unpack("<IH", data)
     else:
-        # BE is easier
-        value = int(stringval, 16)
-    return(value)
-#ends extract_unix48ms
+        high, low = struct.unpack(">HI", data)
+    return((high << 32) + low)
+#ends decode_unix48ms
 
-# Extract 10 digit decimal secs since 1JAN1970. Assumes BE for now eg 0x1170245478 = 1170245478 decimal secs
+# Decode 10 digit decimal secs since 1JAN1970. Assumes BE for now eg 0x1170245478 = 1170245478 decimal secs
 # Returns the number of secs since 1JAN1970
-def extract_unix10digdec(f):
-    unix_decimal_10_string = ""
-    for j in range(5):
-        val = struct.unpack("B", f.read(1))[0]
-        unix_decimal_10_string += ("%02x" % val)
-    
-    try:    
-        unix_decimal_10_int = int(unix_decimal_10_string) # now convert string "1170245478" to decimal int
-    except:
-        print "Bad int cast in extract_unix10digdec"
-        unix_decimal_10_int = -1
-    return(unix_decimal_10_int)
-#ends extract_unix10digdec
+def decode_unix10digdec(data):
+    value = 0
+    for val in struct.unpack("5B", data):
+        digits = BCD_DIGITS[val]
+        if (digits < 0):
+            print "Bad int cast in extract_unix10digdec"
+            return(-1)
+        value = value*100 + digits # now convert "1170245478" to decimal int 2 digits at a time
+    return(value)
+#ends decode_unix10digdec
 
-# Extract 13 digit decimal ms since 1JAN1970. Assumes BE for now eg 0x01170245478000 = 01170245478000 ms
+# Decode 13 digit decimal ms since 1JAN1970. Assumes BE for now eg 0x01170245478000 = 01170245478000 ms
 # Returns the number of ms since 1JAN1970
-def extract_unix13digdec(f):
-    unix_decimal_13_string = ""
-    for j in range(7):
-        val = struct.unpack("B", f.read(1))[0]
-        unix_decimal_13_string += ("%02x" % val)
-    
-    try:    
-        unix_decimal_13_int = int(unix_decimal_13_string) # now convert string "01170245478000" to decimal int
-    except:
-        print "Bad int cast in extract_unix13digdec"
-        unix_decimal_13_int = -1
-    return(unix_decimal_13_int)
-#ends extract_unix13digdec
+def decode_unix13digdec(data):
+    value = 0
+    for val in struct.unpack("7B", data):
+        digits = BCD_DIGITS[val]
+        if (digits < 0):
+            print "Bad int cast in extract_unix13digdec"
+            return(-1)
+        value = value*100 + digits # now convert "01170245478000" to decimal int 2 digits at a time
+    return(value)
+#ends decode_unix13digdec
 
-# Extract 6 byte raw BCD 12 digit date. Assumes BE for now eg 071231125423 = 31DEC2007T12:54:23
+# Decode 6 byte raw BCD 12 digit date. Assumes BE for now eg 071231125423 = 31DEC2007T12:54:23
 # Returns raw date string eg 071231125423
-def extract_BCD12(f):
-    BCD_date_string = ""
-    for j in range(6):
-        val = struct.unpack("B", f.read(1))[0]
-        BCD_date_string += ("%02x" % val)
+def decode_BCD12(data):
+    return ("".join([BCD_HEX[val] for val in struct.unpack("6B", data)]))
+#ends decode_BCD12
 
-    return (BCD_date_string)
-#ends extract_BCD12
-
-# Extract 7 byte raw BCD 14 digit date. Assumes BE for now eg 20071231125423 = 31DEC2007T12:54:23
+# Decode 7 byte raw BCD 14 digit date. Assumes BE for now eg 20071231125423 = 31DEC2007T12:54:23
 # Returns raw date string eg 20071231125423
-def extract_BCD14(f):
-    BCD_date_string = ""
-    for j in range(7):
-        val = struct.unpack("B", f.read(1))[0]
-        BCD_date_string += ("%02x" % val)
-
-    return (BCD_date_string)
-#ends extract_BCD14
+def decode_BCD14(data):
+    return ("".join([BCD_HEX[val] for val in struct.unpack("7B", data)]))
+#ends decode_BCD14
 
-# Extracts DOSDATE. Returns a LE int representing the 2 shorts (Date and Time).
-def extract_DOSdate(f, isLE):
+# Decodes DOSDATE. Returns a LE int representing the 2 shorts (Date and Time).
+def decode_DOSdate(data, isLE):
     result = 0
-    result1 = 0
-    result2 = 0
     if (isLE):
         # eg date is 2007-05-04T12:09:42
         # For LE "normal" DOSDATE raw value 0x36 A4 61 35
@@ -313,8 +368,7 @@ def extract_DOSdate(f, isLE):
         # eg For LE "word swapped" DOSDATE raw value 0x61 35 36 A4
         # 36A4 = Date and 6135 = Time
         try:
-            result1, result2 = struct.unpack(">HH", f.read(4))
-            result = (result1 << 16) + result2
+            result = struct.unpack(">I", data)[0]
         except:
             print "Error extracting LE DOSdate"
         # result retains original word order ie Date, Time for "normal" and
@@ -325,89 +379,149 @@ def extract_DOSdate(f, isLE):
         # 36A4 = Date and 6135 = Time
         # For BE "word swapped" DOSDATE raw value 0xA4 36 35 61
         # 36A4 = Date and 6135 = Time
-        # So need to swap words around and also swap byte order
+        # So need to swap words around and also swap byte order (ie read as a LE int)
         # to get result in form of Date, Time for "normal" or
         # Time, Date form for "word swapped"
         try:
-            result1, result2 = struct.unpack("<HH", f.read(4)) 
-            result = (result2 << 16) + result1
+            result = struct.unpack("<I", data)[0]
         except:
             print "Error extracting BE DOSdate"
     #consequently "result" returned should look like 0x36 A4 61 35
     # ie date then time for BE "normal" and
     # 0x61 35 36 A4 for BE "word swapped"
     return(result)
-#ends extract_DOSdate
+#ends decode_DOSdate
+
+# Checks the special date decoders against known (golden) values and times them. Used by the -g option.
+# The golden values were produced by the previous (byte at a time) extract functions.
+# Returns True if all the decoded values matched
+def check_date_decoders(iterations):
+    golden = [("UNIX48MS", decode_unix48ms, "\x01\x3c\x1e\x44\xfc\x18", (False,), 1357717503000),
+              ("UNIX48MS", decode_unix48ms, "\x18\xfc\x44\x1e\x3c\x01", (True,), 1357717503000),
+              ("UNIX48MS", decode_unix48ms, "\xff\xff\xff\xff\xff\xff", (True,), 281474976710655),
+              ("UNIX48MS", decode_unix48ms, "\x00\x00\x00\x00\x00\x01", (False,), 1),
+              ("UNIX10DIGDEC", decode_unix10digdec, "\x11\x70\x24\x54\x78", (), 1170245478),
+              ("UNIX10DIGDEC", decode_unix10digdec, "\x00\x00\x00\x00\x00", (), 0),
+              ("UNIX10DIGDEC", decode_unix10digdec, "\x11\x7a\x24\x54\x78", (), -1),
+              ("UNIX10DIGDEC", decode_unix10digdec, "\x99\x99\x99\x99\x9f", (), -1),
+              ("UNIX13DIGDEC", decode_unix13digdec, "\x01\x17\x02\x45\x47\x80\x00", (), 1170245478000),
+              ("UNIX13DIGDEC", decode_unix13digdec, "\x01\x17\x02\x45\x47\x80\xa0", (), -1),
+              ("BCD12", decode_BCD12, "\x07\x12\x31\x12\x54\x23", (), "071231125423"),
+              ("BCD12", decode_BCD12, "\xab\x12\x31\x12\x54\x23", (), "ab1231125423"),
+              ("BCD14", decode_BCD14, "\x20\x07\x12\x31\x12\x54\x23", (), "20071231125423"),
+              ("DOSDATE", decode_DOSdate, "\x36\xa4\x61\x35", (True,), 916742453),
+              ("DOSDATE", decode_DOSdate, "\x35\x61\xa4\x36", (False,), 916742453),
+              ("DOSDATE", decode_DOSdate, "\x61\x35\x36\xa4", (True,), 1630877348),
+              ("DOSDATE", decode_DOSdate, "\xa4\x36\x35\x61", (False,), 1630877348)]
+    # (date function, decoded value, expected interpreted value) for the time zone independent date types
+    golden_dates = [(bcd12_date, "071231125423", "2007-12-31T12:54:23"),
+                    (bcd12_date, "ab1231125423", "Unknown"),
+                    (bcd14_date, "20071231125423", "2007-12-31T12:54:23"),
+                    (dosdate_default_date, 916742453, "2007-05-04T12:09:42"),
+                    (dosdate_wordswapped_date, 1630877348, "2007-05-04T12:09:42"),
+                    (unknown_dosdate, 916742453, "Unknown")]
+    passed = True
+    print "Checking special date decoders against golden values ...\n"
+    for label, decoder, data, args, expected in golden:
+        value = decoder(data, *args)
+        if (value == expected):
+            print "OK     " + label + " " + binascii.hexlify(data) + " = " + str(value)
+        else:
+            print "FAILED " + label + " " + binascii.hexlify(data) + " = " + str(value) + " (expected " + str(expected) + ")"
+            passed = False
+    for datefunc, value, expected in golden_dates:
+        datefield = datefunc(value)
+        if (datefield == expected):
+            print "OK     " + datefunc.__name__ + " " + str(value) + " = " + datefield
+        else:
+            print "FAILED " + datefunc.__name__ + " " + str(value) + " = " + datefield + " (expected " + expected + ")"
+            passed = False
+
+    print "\nTiming " + str(iterations) + " decodes of each special date type ...\n"
+    for label, decoder, data, args, expected in golden:
+        if (expected == -1):
+            continue # skip the bad values (they print an error every time)
+        starttime = time.time()
+        for i in xrange(iterations):
+            decoder(data, *args)
+        elapsed = time.time() - starttime
+        if (elapsed > 0):
+            print label + " " + binascii.hexlify(data) + " %.0f decodes/s" % (iterations / elapsed)
+    return (passed)
+#ends check_date_decoders
 
 # Extract strings with known sizes (ie numeric strings only. Not null terminated or deferred)
-def extract_defined_string(field, f, filename):
-    value = ""
-    size = int(num_types_dict[field])
+# "decodestr" is "UTF-16LE" or "UTF-16BE" for Unicode strings ("" for ASCII strings which use the "unpacker" struct.Struct)
+def extract_defined_string(field, f, filename, size, unpacker, decodestr):
     fieldoffset = f.tell()
-    if (type_dict[field].upper() == "S"):
-        pattern = num_types_dict[field] + type_dict[field] # eg pattern is "140s" for "140 | s" template
+    data = f.read(size)
+    return(interpret_defined_string(field, data, fieldoffset, filename, unpacker, decodestr))
+#ends extract_defined_string
+
+# Returns the string value of a defined size string field from its raw "data" (read from "fieldoffset")
+def interpret_defined_string(field, data, fieldoffset, filename, unpacker, decodestr):
+    value = ""
+    if (decodestr == ""):
         try:
-            value = struct.unpack(pattern, f.read(size))[0]
+            value = unpacker.unpack(data)[0] # unpacker is None if the template's pattern (eg "140s") is invalid
             # ensure string is printable
             if (all(c in string.printable for c in value)):
-                print filename + ":" + str(fieldoffset) + ", defined str field = " + field + ", value = " + str(value)
+                if (verbose > 0):
+                    print filename + ":" + str(fieldoffset) + ", defined str field = " + field + ", value = " + str(value)
             else:
                 value = ""
-                print filename + ":" + str(fieldoffset) + " " + field + " is unprintable"
+                if (verbose > 0):
+                    print filename + ":" + str(fieldoffset) + " " + field + " is unprintable"
         except:
             value = ""
             print filename + ":" + str(fieldoffset) + " " + field + " - Error extracting string"
-    elif ( (type_dict[field].upper() == "UTF16BE") or (type_dict[field].upper() == "UTF16LE") ):
-        data = f.read(size)
-        decodestr = ""
-        if (type_dict[field].upper() == "UTF16LE"):
-            decodestr = "UTF-16LE"
-        else:
-            decodestr = "UTF-16BE"
+    else:
         try:
             value = data.decode(decodestr)
             if (all(c in string.printable for c in value)):
-                print filename + ":" + str(fieldoffset) + ", defined " + decodestr + " str field = " + field + ", value = " + str(value)
+                if (verbose > 0):
+                    print filename + ":" + str(fieldoffset) + ", defined " + decodestr + " str field = " + field + ", value = " + str(value)
             else:
                 value = ""
-                print filename + ":" + str(fieldoffset) + " " + field + " is unprintable"
+                if (verbose > 0):
+                    print filename + ":" + str(fieldoffset) + " " + field + " is unprintable"
         except:
             print filename + ":" + str(fieldoffset) + " " + field + " - Error extracting " + decodestr + " str field"
             value = ""
     return(value)
-#ends extract_defined_string
+#ends interpret_defined_string
 
 # Extract strings with deferred sizes only. Not null terminated or numerical
-def extract_deferred_string(field, f, size, filename):
+# "decodestr" is "UTF-16LE" or "UTF-16BE" for Unicode strings ("" for ASCII strings)
+def extract_deferred_string(field, f, size, filename, decodestr):
     value = ""
     fieldoffset = f.tell()
-    if (type_dict[field].upper() == "S"):
+    if (decodestr == ""):
         pattern = str(size) + "s" # eg pattern is "140s" for "msgsize | s" template where msgsize = 140
         try:
             value = struct.unpack(pattern, f.read(size))[0]
             # ensure string is printable
             if (all(c in string.printable for c in value)):
-                print filename + ":" + str(fieldoffset) + ", deferred str field = " + field + ", value = " + str(value)
+                if (verbose > 0):
+                    print filename + ":" + str(fieldoffset) + ", deferred str field = " + field + ", value = " + str(value)
             else:
                 value = ""
-                print filename + ":" + str(fieldoffset) + " " + field + " is unprintable"
+                if (verbose > 0):
+                    print filename + ":" + str(fieldoffset) + " " + field + " is unprintable"
         except:
             value = ""
             print filename + ":" + str(fieldoffset) + " " + field + " - Error extracting deferred string"
-    elif ( (type_dict[field].upper() == "UTF16BE") or (type_dict[field].upper() == "UTF16LE") ):
+    else:
         data = f.read(size)
-        decodestr = ""
-        if (type_dict[field].upper() == "UTF16LE"):
-            decodestr = "UTF-16LE"
-        else:
-            decodestr = "UTF-16BE"
         try:
             value = data.decode(decodestr)
             if (all(c in string.printable for c in value)):
-                print filename + ":" + str(fieldoffset) + ", deferred " + decodestr + " str field = " + field + ", value = " + str(value)
+                if (verbose > 0):
+                    print filename + ":" + str(fieldoffset) + ", deferred " + decodestr + " str field = " + field + ", value = " + str(value)
             else:
                 value = ""
-                print filename + ":" + str(fieldoffset) + " " + field + " is unprintable"
+                if (verbose > 0):
+                    print filename + ":" + str(fieldoffset) + " " + field + " is unprintable"
         except:
             print filename + ":" + str(fieldoffset) + " " + field + " - Error extracting deferred "+ decodestr + " str field"
             value = ""
@@ -415,186 +529,623 @@ def extract_deferred_string(field, f, size, filename):
 #ends extract_deferred_string
 
 # Extract strings with null terminations only. Not deferred or numerical
-def extract_nullterm_string(field, f, filename):
+# "decodestr" is "UTF-16LE" or "UTF-16BE" for Unicode strings ("" for ASCII strings)
+def extract_nullterm_string(field, f, filename, decodestr, filesize):
     # Handle null terminated ascii strings with unknown sizes, ignores unprintable chars
     value = ""
     tmp = ""
     fieldoffset = f.tell()
-    fileinfo = os.stat(filename)
-    #print "Input file " + filename + " is %d bytes" % fileinfo.st_size + "\n"
-    if (type_dict[field].upper() == "S"): # ascii string
-        while ((tmp != "\x00") and (f.tell() < fileinfo.st_size)):
+    if (decodestr == ""): # ascii string
+        while ((tmp != "\x00") and (f.tell() < filesize)):
             tmp = f.read(1)
             if ((tmp != "\x00") and (tmp in string.printable)):
                 value += tmp
-        print filename + ":" + str(fieldoffset) + ", nullterm str field = " + field + ", value = " + str(value)
-    elif ( (type_dict[field].upper() == "UTF16BE") or (type_dict[field].upper() == "UTF16LE") ):
+        if (verbose > 0):
+            print filename + ":" + str(fieldoffset) + ", nullterm str field = " + field + ", value = " + str(value)
+    else:
         stringdata = ""
-        decodestr = ""
-        if (type_dict[field].upper() == "UTF16LE"):
-            decodestr = "UTF-16LE"
-        else:
-            decodestr = "UTF-16BE"
-            
-        while ((tmp != "\x00\x00") and (f.tell() < fileinfo.st_size)):
+        while ((tmp != "\x00\x00") and (f.tell() < filesize)):
             tmp = f.read(2)
             if ((tmp != "\x00\x00")):
                 stringdata += tmp
         try:
             value = stringdata.decode(decodestr)
             if (all(c in string.printable for c in value)):
-                print filename + ":" + str(fieldoffset) + ", nullterm " + decodestr + " str field = " + field + ", value = " + str(value)
+                if (verbose > 0):
+                    print filename + ":" + str(fieldoffset) + ", nullterm " + decodestr + " str field = " + field + ", value = " + str(value)
             else:
                 value = ""
-                print filename + ":" + str(fieldoffset) + " " + field + " is unprintable"
+                if (verbose > 0):
+                    print filename + ":" + str(fieldoffset) + " " + field + " is unprintable"
         except:
             print filename + ":" + str(fieldoffset) + " " + field + " - Error extracting nullterm " + decodestr + " str field"
             value = ""
     return(value)
 #ends extract_nullterm_string    
     
-# Function to parse each record and extract/print data according to the template file
+# Field decoders used by the compiled plan (see "compile_plan").
+# Each one extracts/prints the field at "fieldoffset" according to its pre-computed "params" and returns
+# False if there was a major error (ie the rest of the record should not be parsed) otherwise True.
+def decode_badtype(f, field, params, fieldoffset, filesize, extracted_vals):
+    print "Bad Type declared for " + field + " ... Skipping"
+    return True
+
+def decode_skip(f, field, params, fieldoffset, filesize, extracted_vals):
+    # Dont care about these X bytes ...
+    if (params["sizeref"] != None):
+        # handle deferred X sizes (allows for dynamic skipping vs fixed length skipping)
+        skipsize = int(extracted_vals[params["sizeref"]]) # retrieve size from previously extracted values dict
+    else:
+        skipsize = params["size"]
+    if ((fieldoffset + skipsize) < filesize):
+        if (verbose > 0):
+            print "Skipping " + str(skipsize) + " bytes ..."
+        newseek = fieldoffset+ skipsize
+        f.seek(newseek)
+        return True
+    print "Cannot skip " + field + " - specified offset (" + str(fieldoffset+skipsize) + ") too large!"
+    return False # Bailout of function cos something is wrong
+
+def decode_nullterm_string(f, field, params, fieldoffset, filesize, extracted_vals):
+    # Handle null terminated strings with unknown (ie 0) sizes, ignores unprintable chars
+    unknownstring = extract_nullterm_string(field, f, filename, params["decodestr"], filesize)
+    write_field(field, fieldoffset, unknownstring, "")
+    return True
+
+def decode_deferred_string(f, field, params, fieldoffset, filesize, extracted_vals):
+    # Handle strings with deferred size eg "msgsize" is defined in another field
+    if (params["sizeref"] in extracted_vals):
+        size = int(extracted_vals[params["sizeref"]]) # retrieve size from previously extracted values dict
+        value = extract_deferred_string(field, f, size, filename, params["decodestr"])
+        write_field(field, fieldoffset, value, "")
+    else:
+        print params["sizeref"] + " is unknown and cannot be used to extract the " + field + " field ... skipping"
+    return True
+
+def decode_defined_string(f, field, params, fieldoffset, filesize, extracted_vals):
+    # Handle strings with numeric sizes declared
+    value = extract_defined_string(field, f, filename, params["size"], params["unpacker"], params["decodestr"])
+    write_field(field, fieldoffset, value, "")
+    return True
+
+def decode_special_date(f, field, params, fieldoffset, filesize, extracted_vals):
+    # Handle dates which need their own decode function (UNIX48MS, UNIX10DIGDEC, UNIX13DIGDEC, BCD12, BCD14, DOSDATE)
+    value = params["decode"](f.read(params["size"]), *params["decodeargs"])
+    output_special_date(field, params, fieldoffset, value)
+    return True
+
+# Prints/writes an extracted special date field
+def output_special_date(field, params, fieldoffset, value):
+    datefield = format_date(params["datefunc"], value)
+    if (verbose > 0):
+        print filename + ":" + str(fieldoffset) + ", " + params["label"] + " field = " + field + ", value = " + str(value) + ", interpreted value = " + datefield
+    write_field(field, fieldoffset, value, datefield)
+
+def decode_number(f, field, params, fieldoffset, filesize, extracted_vals):
+    # handle everything else with single fields that can be "unpacked" 
+    # ie other dates and numbers which don't require specialized interpretation
+    try:
+        data = f.read(params["size"])
+        value = params["unpacker"].unpack(data)[0] # unpacker is None if the pattern is not a valid struct format
+        extracted_vals[field] = value # store numerical values in case we need it later eg deferred string sizes
+        #print "extracted field = " + field + "... value = " + str(value)
+    except:
+        print "Error extracting data! Offset = " + str(fieldoffset) + ", Field = " + field
+        print params["pattern"]
+        return False # bailout of function. We're getting errors for the simplest case. 
+
+    datefield = None
+    if (params["datefunc"] != None):
+        datefield = format_date(params["datefunc"], value)
+    output_number(field, fieldoffset, value, datefield)
+    return True
+
+# Prints/writes an extracted number field. "datefield" is the interpreted date for 32 bit int dates (otherwise None)
+def output_number(field, fieldoffset, value, datefield):
+    if (datefield != None):
+        # output 32 bit int dates
+        if (verbose > 0):
+            print filename + ":" + str(fieldoffset) + ", field = " + field + ", value = " + str(value) + ", interpreted date value = " + datefield
+        write_field(field, fieldoffset, value, datefield)
+    else:
+        # output other non-string / non-date values (ints, floats)
+        if (verbose > 0):
+            print filename + ":" + str(fieldoffset) + ", field = " + field + ", value = " + str(value)
+        write_field(field, fieldoffset, value, "")
+
+# Writes an extracted field to the TSV output file (datefield is "" for non-date fields)
+# and keeps its value for the record's row in the SQLite output database
+def write_field(field, fieldoffset, value, datefield):
+    if (tsvoutput):
+        of.write(filename + "\t" + str(fieldoffset) + "\t" + field + "\t" + 
+                 str(value) + "\t" + datefield + "\n")
+    record_values[field] = value
+    if (datefield != ""):
+        record_values[field + "_date"] = datefield
+#ends field decoders
+
+# Returns a struct.Struct for the given pattern or None if the pattern is not a valid struct format
+# (so the error is reported when the field is extracted, same as struct.unpack)
+def compile_struct(pattern):
+    try:
+        return (struct.Struct(pattern))
+    except:
+        return (None)
+
+# Compiles the template definition (field_names, num_types_dict, type_dict) into an execution plan.
+# Returns a list of (decoder function, field name, params dict) for each field. The type/size strings are only
+# interpreted here (once) so that parse_record does not have to re-interpret them for every field of every record.
+def compile_plan():
+    plan = []
+    stringtypes = {"S" : "", "UTF16LE" : "UTF-16LE", "UTF16BE" : "UTF-16BE"} # template string type => decodestr
+    specialdates = [("UNIX48MS", decode_unix48ms, True), ("UNIX10DIGDEC", decode_unix10digdec, False),
+                    ("UNIX13DIGDEC", decode_unix13digdec, False), ("BCD12", decode_BCD12, False),
+                    ("BCD14", decode_BCD14, False), ("DOSDATE", decode_DOSdate, True)] # (label, decode function, takes isLE)
+    datetypes = ["OSX32", "UNIX32", "GPS32", "AOL32", "HFS32"] # 32 bit int dates
+    for field in field_names:
+        vartype = type_dict[field]
+        size = num_types_dict[field]
+        patn, tsize = find_type_size(vartype)
+        params = {}
+        # Check field type size, 0 means an unknown type (no field is ever extracted with a 0 sized type)
+        if (tsize == 0):
+            plan.append((decode_badtype, field, params))
+        elif (vartype.upper() == "X"):
+            params["sizeref"] = None
+            params["size"] = 0
+            if (not size.isdigit()):
+                params["sizeref"] = size
+            else:
+                params["size"] = int(size)
+            plan.append((decode_skip, field, params))
+        elif (vartype.upper() in stringtypes):
+            params["decodestr"] = stringtypes[vartype.upper()]
+            if (size == "0"):
+                plan.append((decode_nullterm_string, field, params))
+            elif (not size.isdigit()):
+                params["sizeref"] = size
+                plan.append((decode_deferred_string, field, params))
+            else:
+                params["size"] = int(size)
+                params["unpacker"] = compile_struct(size + vartype) # eg pattern is "140s" for "140 | s" template
+                plan.append((decode_defined_string, field, params))
+        else:
+            for label, decode, takesLE in specialdates:
+                if (label in vartype.upper()):
+                    params["label"] = label
+                    params["decode"] = decode
+                    params["size"] = int(tsize)
+                    params["decodeargs"] = ()
+                    if (takesLE):
+                        params["decodeargs"] = (vartype.startswith("<"),)
+                    params["datefunc"] = find_date_func(vartype)
+                    plan.append((decode_special_date, field, params))
+                    break
+            else:
+                params["pattern"] = patn
+                params["size"] = int(tsize)
+                params["unpacker"] = compile_struct(patn)
+                params["datefunc"] = None
+                if any(datetype in vartype.upper() for datetype in datetypes):
+                    params["datefunc"] = find_date_func(vartype)
+                plan.append((decode_number, field, params))
+    return (plan)
+#ends compile_plan
+
+# Function to parse each record and extract/print data according to the compiled template plan (see "compile_plan")
+# Adds the number of fields extracted to "fieldcount" and the record's row to "dbrows" (if writing a SQLite output database)
 # returns True if record fields parsed OK, False if there were major errors parsing
 def parse_record(f, hit):
+    global fieldcount
     extracted_vals = {} # local dict of numerical extracted values keyed by field name (used for storing/retrieving deferred sized strings)
-    fileinfo = os.stat(filename) # used for determining filesize
+    record_values.clear()
+    status = True # ie all fields for record parsed without major error
     
-    for field in field_names:
+    for decoder, field, params in record_plan:
         #check field isn't past end of file
         fieldoffset = f.tell()
-        if (fieldoffset > fileinfo.st_size):
-            print "Calculated Field offset for " + field + " is greater than " + str(fileinfo.st_size) + " ... stopping"
-            return False
+        if (fieldoffset > filesize):
+            print "Calculated Field offset for " + field + " is greater than " + str(filesize) + " ... stopping"
+            status = False
+            break
+        fieldcount += 1
+        if (not decoder(f, field, params, fieldoffset, filesize, extracted_vals)):
+            status = False
+            break
+    if (db != None):
+        dbrows.append(db_row(hit)) # partially parsed records are kept (same as the TSV output)
+    return status
+#ends parse_record fn
 
-        patn, tsize = find_type_size(type_dict[field])
-        #print "pattern = " + patn + ", tsize = " + str(tsize)
-        # Check field type size, if 0 check it hasn't been deferred eg "msgsize"
-        if (tsize == 0):
-            if not (field in extracted_vals.keys()):
-                print "Bad Type declared for " + field + " ... Skipping"
-                continue # skip to next field
-                
-        if (type_dict[field].upper() == "X"): # Dont care about these X bytes ...
-            skipsize = 0
-            if (not num_types_dict[field].isdigit()):
-                # handle deferred X sizes (allows for dynamic skipping vs fixed length skipping)
-                skipsize = int(extracted_vals[num_types_dict[field]]) # retrieve size from previously extracted values dict
-            else:
-                skipsize = int(num_types_dict[field])
-            if ((fieldoffset + skipsize) < fileinfo.st_size):
-                print "Skipping " + str(skipsize) + " bytes ..."
-                newseek = fieldoffset+ skipsize
-                f.seek(newseek)
-            else:
-                print "Cannot skip " + field + " - specified offset (" + str(fieldoffset+skipsize) + ") too large!"
-                return False # Bailout of function cos something is wrong
-        elif ( (num_types_dict[field] == "0") and ((type_dict[field].upper() == "S") or (type_dict[field].upper() == "UTF16BE") or
-                (type_dict[field].upper() == "UTF16LE")) ):
-            # Handle null terminated strings with unknown (ie 0) sizes, ignores unprintable chars
-            unknownstring = extract_nullterm_string(field, f, filename)
-            if (tsvoutput):
-                of.write(filename + "\t" + str(fieldoffset) + "\t" + field + "\t" + 
-                         unknownstring + "\t\n")
-        elif ( (not num_types_dict[field].isdigit()) and ((type_dict[field].upper() == "S") or (type_dict[field].upper() == "UTF16BE") or
-                (type_dict[field].upper() == "UTF16LE")) ):
-            # Handle strings with deferred size eg "msgsize" is defined in another field
-            if (num_types_dict[field] in extracted_vals):
-                size = int(extracted_vals[num_types_dict[field]]) # retrieve size from previously extracted values dict
-                value = extract_deferred_string(field, f, size, filename)
-                if (tsvoutput):
-                    of.write(filename + "\t" + str(fieldoffset) + "\t" + field + "\t" + str(value) + "\t\n")
-            else:
-                print num_types_dict[field] + " is unknown and cannot be used to extract the " + field + " field ... skipping"
-        elif ( (num_types_dict[field].isdigit()) and ((type_dict[field].upper() == "S") or (type_dict[field].upper() == "UTF16BE") or
-                (type_dict[field].upper() == "UTF16LE")) ):
-            # Handle strings with numeric sizes declared
-            value = extract_defined_string(field, f, filename)
-            if (tsvoutput):
-                of.write(filename + "\t" + str(fieldoffset) + "\t" + field + "\t" + str(value) + "\t\n")
-        elif ("UNIX48MS" in type_dict[field].upper()):
-            # Handle 6 byte ms since 1JAN1970.
-            value = extract_unix48ms(f, type_dict[field].startswith("<"))
-            datefield = calc_date(value, field)
-            print filename + ":" + str(fieldoffset) + ", UNIX48MS field = " + field + ", value = " + str(value) + ", interpreted value = " + datefield
-            if (tsvoutput):
-                of.write(filename + "\t" + str(fieldoffset) + "\t" + field + "\t" + 
-                         str(value) + "\t" + datefield + "\n")
-        elif ("UNIX10DIGDEC" in type_dict[field].upper()):
-            # Handle 10 digit decimal secs since 1JAN1970. eg 0x1170245478
-            value = extract_unix10digdec(f)
-            datefield = calc_date(value, field)
-            print filename + ":" + str(fieldoffset) + ", UNIX10DIGDEC field = " + field + ", value = " + str(value) + ", interpreted value = " + datefield
-            if (tsvoutput):
-                of.write(filename + "\t" + str(fieldoffset) + "\t" + field + "\t" + 
-                         str(value) + "\t" + datefield + "\n")
-        elif ("UNIX13DIGDEC" in type_dict[field].upper()):
-            # Handle 13 digit decimal ms since 1JAN1970. eg 0x1170245478000
-            value = extract_unix13digdec(f)
-            datefield = calc_date(value, field)
-            print filename + ":" + str(fieldoffset) + ", UNIX13DIGDEC field = " + field + ", value = " + str(value) + ", interpreted value = " + datefield
-            if (tsvoutput):
-                of.write(filename + "\t" + str(fieldoffset) + "\t" + field + "\t" + 
-                         str(value) + "\t" + datefield + "\n")
-        elif ("BCD12" in type_dict[field].upper()):
-            # Handle 6 byte 12 digit BCD date eg 071231125423 = 31DEC2007T12:54:23
-            value = extract_BCD12(f)
-            datefield = calc_date(value, field)
-            print filename + ":" + str(fieldoffset) + ", BCD12 field = " + field + ", value = " + str(value) + ", interpreted value = " + datefield
-            if (tsvoutput):
-                of.write(filename + "\t" + str(fieldoffset) + "\t" + field + "\t" + 
-                         str(value) + "\t" + datefield + "\n")
-        elif ("BCD14" in type_dict[field].upper()):
-            # Handle 7 byte 14 digit BCD date eg 020071231125423 = 31DEC2007T12:54:23
-            value = extract_BCD14(f)
-            datefield = calc_date(value, field)
-            print filename + ":" + str(fieldoffset) + ", BCD14 field = " + field + ", value = " + str(value) + ", interpreted value = " + datefield
-            if (tsvoutput):
-                of.write(filename + "\t" + str(fieldoffset) + "\t" + field + "\t" + 
-                         str(value) + "\t" + datefield + "\n")
-        elif ("DOSDATE" in type_dict[field].upper()):
-            value = extract_DOSdate(f, type_dict[field].startswith("<"))
-            datefield = calc_date(value, field)
-            print filename + ":" + str(fieldoffset) + ", DOSDATE field = " + field + ", value = " + str(value) + ", interpreted value = " + datefield
-            if (tsvoutput):
-                of.write(filename + "\t" + str(fieldoffset) + "\t" + field + "\t" + 
-                         str(value) + "\t" + datefield + "\n")
+# Returns a list of (column name, record_values key) for the SQLite output table. One column per template field
+# that has a value (ie not X or bad types) plus a "<field>_date" column for the interpreted value of date fields.
+def record_columns(plan):
+    columns = []
+    for decoder, field, params in plan:
+        if ((decoder == decode_badtype) or (decoder == decode_skip) or (field in [key for name, key in columns])):
+            continue
+        columns.append((field, field))
+        if ((decoder == decode_special_date) or ((decoder == decode_number) and (params["datefunc"] != None))):
+            columns.append((field + "_date", field + "_date"))
+    return (columns)
+#ends record_columns
+
+# Returns an extracted value in a form that can be stored by sqlite3 (non ASCII byte strings are stored as BLOBs,
+# integers which do not fit in a SQLite INTEGER (eg large unsigned Q values) are stored as text)
+def dbvalue(value):
+    if (isinstance(value, str)):
+        try:
+            return (value.decode("ascii"))
+        except:
+            return (buffer(value))
+    elif (isinstance(value, (int, long)) and ((value < -9223372036854775808) or (value > 9223372036854775807))):
+        return (str(value))
+    return (value)
+#ends dbvalue
+
+# Returns the SQLite output row for the record at "hit" from the values in record_values (None for any missing fields)
+# The values are converted by "dbvalue" when they are inserted (so rows can be pickled back from "parseanchors" workers)
+def db_row(hit):
+    return (tuple([filename, hit] + [record_values.get(key) for name, key in db_columns]))
+#ends db_row
+
+# Inserts the pending rows into the SQLite output database (once there are at least "minrows" of them)
+# Each batch is inserted with one executemany and committed as one transaction
+def flush_dbrows(minrows):
+    if ((db != None) and (len(dbrows) > 0) and (len(dbrows) >= minrows)):
+        db.executemany(db_insert, (map(dbvalue, row) for row in dbrows))
+        db.commit()
+        del dbrows[:]
+#ends flush_dbrows
+
+# Returns the record size (in bytes) if every field of the compiled plan has a fixed size and can be decoded
+# from an already read block of records (ie numbers, dates, defined size strings, fixed X skips).
+# Returns 0 if the template has null terminated/deferred sized fields (ie record size can vary)
+def fixed_record_size(plan):
+    stride = 0
+    for decoder, field, params in plan:
+        if (decoder == decode_badtype):
+            continue
+        elif ((decoder == decode_skip) and (params["sizeref"] == None)):
+            stride += params["size"]
+        elif ((decoder == decode_defined_string) and ((params["decodestr"] != "") or (params["unpacker"] != None))):
+            stride += params["size"]
+        elif ((decoder == decode_number) and (params["unpacker"] != None) and (params["unpacker"].size == params["size"])):
+            stride += params["size"]
+        elif (decoder == decode_special_date):
+            stride += params["size"]
         else:
-            # handle everything else with single fields that can be "unpacked" 
-            # ie other dates and numbers which don't require specialized interpretation
-            size = int(tsize)
-            try:
-                value = struct.unpack(patn, f.read(size))[0]
-                extracted_vals[field] = value # store numerical values in case we need it later eg deferred string sizes
-                #print "extracted field = " + field + "... value = " + str(value)
-            except:
-                print "Error extracting data! Offset = " + str(fieldoffset) + ", Field = " + field
-                print patn
-                return False # bailout of function. We're getting errors for the simplest case. 
-                
-            # output 32 bit int dates
-            if ("OSX32" in type_dict[field].upper() or "UNIX32" in type_dict[field].upper() or
-                "GPS32" in type_dict[field].upper() or "AOL32" in type_dict[field].upper() or
-                "HFS32" in type_dict[field].upper()):
-                datefield = calc_date(value, field)
-                
-                print filename + ":" + str(fieldoffset) + ", field = " + field + ", value = " + str(value) + ", interpreted date value = " + datefield
+            return 0
+    return stride
+#ends fixed_record_size
+
+# Bulk decodes the fixed size records (of "stride" bytes) starting at "startoffset" until "endoffset".
+# Reads BULK_SIZE blocks of whole records and decodes each field for all the records in a block at once
+# (including the date conversions) before printing/writing them in the same order as parse_record would.
+# Only records which lie wholly before the end of the file are decoded here.
+# Returns the offset of the first record not decoded (ie the remaining record(s) are left for parse_record)
+# Adds the number of fields decoded to "fieldcount"
+def bulk_parse_records(f, startoffset, endoffset, filesize, stride):
+    global fieldcount
+    if ((endoffset <= startoffset) or (startoffset + stride >= filesize)):
+        return (startoffset)
+    # Number of records starting before endoffset and ending before the end of the file
+    numrecs = min((endoffset - startoffset + stride - 1) // stride, (filesize - stride - startoffset + stride - 1) // stride)
+    # Offset of each field within a record
+    layout = []
+    pos = 0
+    for decoder, field, params in record_plan:
+        layout.append((decoder, field, params, pos))
+        if (decoder != decode_badtype):
+            pos += params["size"]
+    blockrecs = max(1, BULK_SIZE // stride)
+    recnum = 0
+    f.seek(startoffset)
+    while (recnum < numrecs):
+        count = min(blockrecs, numrecs - recnum)
+        block = f.read(count * stride)
+        blockoffset = startoffset + recnum * stride
+        columns = []
+        for decoder, field, params, pos in layout:
+            vals = None
+            dates = None
+            if (decoder == decode_number):
+                unpack_from = params["unpacker"].unpack_from
+                vals = [unpack_from(block, pos + i*stride)[0] for i in range(count)]
+                if (params["datefunc"] != None):
+                    dates = format_dates(params["datefunc"], vals)
+            elif (decoder == decode_defined_string):
+                size = params["size"]
+                vals = [block[pos + i*stride : pos + i*stride + size] for i in range(count)]
+            columns.append((decoder, field, params, pos, vals, dates))
+        for i in range(count):
+            recoffset = blockoffset + i*stride
+            record_values.clear()
+            for decoder, field, params, pos, vals, dates in columns:
+                fieldoffset = recoffset + pos
+                if (decoder == decode_number):
+                    if (dates != None):
+                        output_number(field, fieldoffset, vals[i], dates[i])
+                    else:
+                        output_number(field, fieldoffset, vals[i], None)
+                elif (decoder == decode_defined_string):
+                    value = interpret_defined_string(field, vals[i], fieldoffset, filename, params["unpacker"], params["decodestr"])
+                    write_field(field, fieldoffset, value, "")
+                elif (decoder == decode_special_date):
+                    # decoded here (not per block) so any bad value messages stay in order
+                    data = block[i*stride + pos : i*stride + pos + params["size"]]
+                    output_special_date(field, params, fieldoffset, params["decode"](data, *params["decodeargs"]))
+                elif (decoder == decode_skip):
+                    if (verbose > 0):
+                        print "Skipping " + str(params["size"]) + " bytes ..."
+                else:
+                    print "Bad Type declared for " + field + " ... Skipping"
+            if (db != None):
+                dbrows.append(db_row(recoffset))
+        recnum += count
+        flush_dbrows(DB_BATCH_SIZE)
+    fieldcount += numrecs * len(record_plan)
+    return (startoffset + numrecs * stride)
+#ends bulk_parse_records
+
+# Searches the input file between startoffset and endoffset for a (binary) signature and yields the file offset of each hit.
+# Reads CHUNK_SIZE chunks (plus the signature size - 1 bytes to catch hits crossing chunk boundaries)
+def isearchsignature(fd, signature, startoffset, endoffset):
+    overlap = len(signature) - 1
+    endoffset = min(endoffset, image_stat(fd).st_size)
+    begin_chunk = startoffset
+    while (begin_chunk < endoffset):
+        chunksize = min(CHUNK_SIZE, endoffset - begin_chunk)
+        fd.seek(begin_chunk)
+        rawchunk = fd.read(chunksize + overlap)
+        idx = rawchunk.find(signature)
+        while ((idx != -1) and (idx < chunksize)):
+            yield (begin_chunk + idx)
+            idx = rawchunk.find(signature, idx + 1)
+        begin_chunk += chunksize
+#ends isearchsignature
+
+# Parses the record starting at a signature hit. Returns True if the record fields parsed OK, False otherwise.
+# Any error is confined to this record so the remaining hits can still be parsed.
+def parse_anchor(fd, hit):
+    fd.seek(hit)
+    try:
+        return (parse_record(fd, hit))
+    except:
+        print "Error parsing record at offset " + str(hit)
+        exctype, value = sys.exc_info()[:2]
+        print "Exception type = ",exctype,", value = ",value
+        return False
+#ends parse_anchor
+
+# Worker function for "iparallelparseanchors". Parses the records at a batch of signature hits with its own
+# file handle and returns a list of (hit, status, printed output, TSV output, number of fields, SQLite rows) for each hit (in the same order).
+def parseanchors(hits):
+    global of, fieldcount
+    results = []
+    stdout = sys.stdout
+    fd = open_image(filename)
+    try:
+        for hit in hits:
+            sys.stdout = cStringIO.StringIO()
+            of = cStringIO.StringIO()
+            fieldcount = 0
+            del dbrows[:]
+            status = parse_anchor(fd, hit)
+            results.append((hit, status, sys.stdout.getvalue(), of.getvalue(), fieldcount, list(dbrows)))
+    finally:
+        sys.stdout = stdout
+        fd.close()
+    return (results)
+#ends parseanchors
+
+# Yields lists of up to batchsize hits
+def batchhits(hits, batchsize):
+    batch = []
+    for hit in hits:
+        batch.append(hit)
+        if (len(batch) == batchsize):
+            yield (batch)
+            batch = []
+    if (len(batch) > 0):
+        yield (batch)
+#ends batchhits
+
+# Parses the records at each signature hit with a pool of worker processes and yields (hit, status) in hit order.
+# Each record's printed/TSV output is written here (in hit order) so it is the same as parsing them one at a time.
+# Adds the number of fields extracted by the workers to "fieldcount" and their SQLite rows to "dbrows".
+# Needs os.fork (ie not Windows) otherwise falls back to parsing the records one at a time.
+def iparallelparseanchors(fd, hits, numworkers):
+    global fieldcount
+    if (not hasattr(os, "fork")):
+        print "Parallel parsing is not supported on this platform ... parsing records one at a time"
+        for hit in hits:
+            yield (hit, parse_anchor(fd, hit))
+        return
+    sys.stdout.flush()
+    if (tsvoutput):
+        of.flush()
+    pool = multiprocessing.Pool(numworkers)
+    try:
+        for results in pool.imap(parseanchors, batchhits(hits, ANCHOR_BATCH), 1): # results are in hit order
+            for hit, status, printed, tsvlines, numfields, rows in results:
+                sys.stdout.write(printed)
                 if (tsvoutput):
-                    of.write(filename + "\t" + str(fieldoffset) + "\t" + field + "\t" + 
-                             str(value) + "\t" + datefield + "\n")
+                    of.write(tsvlines)
+                fieldcount += numfields
+                dbrows.extend(rows)
+                yield (hit, status)
+    finally:
+        pool.close()
+        pool.join()
+#ends iparallelparseanchors
+
+# Returns the sorted list of input files for a directory (all of its files) or a glob pattern (eg "/cases/*.bin").
+# Only the first segment of a split raw image is listed (its other segments are read with it by "open_image").
+# Any of the "exclude" files (eg the template/output files) are left out.
+def input_files(pattern, exclude):
+    if (os.path.isdir(pattern)):
+        names = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    else:
+        names = glob.glob(pattern)
+    excluded = set([os.path.realpath(name) for name in exclude if (name != None)])
+    names = sorted([name for name in names if (os.path.isfile(name) and (os.path.realpath(name) not in excluded))])
+    segments = set()
+    for name in names:
+        segments.update(split_segments(name)[1:])
+    return ([name for name in names if (name not in segments)])
+#ends input_files
+
+# Creates (or replaces) the "records" table of a SQLite output database
+def create_records_table(conn):
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("DROP TABLE IF EXISTS records")
+    conn.execute("CREATE TABLE records(filename TEXT, offset INTEGER" + "".join([', "' + name.replace('"', '""') + '"' for name, key in db_columns]) + ")")
+#ends create_records_table
+
+# Extracts the records from the (open) input file from startoffset until endoffset.
+# Parses a record at each signature hit (with "numworkers" worker processes if > 1) if a signature was given,
+# otherwise parses back to back records (bulk decoding them if -b was given). Returns the number of records parsed.
+def extract_records(f, endoffset, numworkers):
+    if (signature != None):
+        numhits = 0
+        numerrors = 0
+        hits = isearchsignature(f, signature, startoffset, endoffset)
+        if (numworkers > 1):
+            results = iparallelparseanchors(f, hits, numworkers)
+        else:
+            results = ((hit, parse_anchor(f, hit)) for hit in hits)
+        for hit, status in results:
+            numhits += 1
+            if (not status):
+                numerrors += 1
+            flush_dbrows(DB_BATCH_SIZE)
+        print "\nParsed " + str(numhits) + " records at signature hits (" + str(numerrors) + " with errors)"
+        return (numhits)
+    curroffset = startoffset
+    status = True
+    numrecords = 0
+    if (options.bulk):
+        stride = fixed_record_size(record_plan)
+        if (stride > 0):
+            print "Bulk decoding " + str(stride) + " byte records ...\n"
+            curroffset = bulk_parse_records(f, curroffset, endoffset, filesize, stride)
+            numrecords = (curroffset - startoffset) // stride
+        else:
+            print "Template does not have a fixed record size ... cannot bulk decode\n"
+    f.seek(curroffset)
+    while ((curroffset < endoffset) and status):
+        status = parse_record(f, curroffset)
+        numrecords += 1
+        curroffset = f.tell()
+        flush_dbrows(DB_BATCH_SIZE)
+    return (numrecords)
+#ends extract_records
+
+# Extracts the records from one file of a batch of input files (see "iextractfiles").
+# task is (input filename, temporary output prefix). If the prefix is not None (ie in a worker process), the printed,
+# TSV and SQLite output is written to prefix.log/.tsv/.db files (for the main process to merge) instead of the shared outputs.
+# An error only stops this file. Returns (input filename, records, fields, secs, error message or None).
+def extract_file(task):
+    global filename, filesize, of, db
+    inputfile, tmpprefix = task
+    filename = inputfile
+    startfields = fieldcount
+    numrecords = 0
+    error = None
+    starttime = time.time()
+    if (tmpprefix != None):
+        stdout = sys.stdout
+        sys.stdout = open(tmpprefix + ".log", "w", OUTPUT_BUFFER_SIZE)
+        if (tsvoutput):
+            of = open(tmpprefix + ".tsv", "w", OUTPUT_BUFFER_SIZE)
+        if (db != None):
+            db = sqlite3.connect(tmpprefix + ".db") # the main process's connection is not used by workers
+            create_records_table(db)
+    try:
+        f = open_image(inputfile)
+        try:
+            filesize = image_stat(f).st_size
+            print "Input file " + inputfile + " is %d bytes" % filesize + "\n"
+            if (options.endoffset == -1): # default case ie end offset "z" was not specified
+                endoffset = filesize
             else:
-                # output other non-string / non-date values (ints, floats)
-                print filename + ":" + str(fieldoffset) + ", field = " + field + ", value = " + str(value)
-                if (tsvoutput):
-                    of.write(filename + "\t" + str(fieldoffset) + "\t" + field + "\t" + 
-                             str(value) + "\t\n")
-    return True # ie all fields for record parsed without major error
-#ends parse_record fn
+                endoffset = options.endoffset
+            numrecords = extract_records(f, endoffset, 0)
+        finally:
+            f.close()
+            flush_dbrows(1) # partially parsed files are kept (same as the TSV output)
+    except:
+        del dbrows[:]
+        exctype, value = sys.exc_info()[:2]
+        error = exctype.__name__ + ": " + str(value)
+        print "Error extracting records from " + inputfile
+        print "Exception type = ",exctype,", value = ",value
+    if (tmpprefix != None):
+        sys.stdout.close()
+        sys.stdout = stdout
+        if (tsvoutput):
+            of.close()
+        if (db != None):
+            db.close()
+    return ((inputfile, numrecords, fieldcount - startfields, time.time() - starttime, error))
+#ends extract_file
+
+# Appends the contents of the file "name" to the (open) file object "dest" and deletes the file
+def append_file(name, dest):
+    src = open(name, "rb")
+    try:
+        shutil.copyfileobj(src, dest, OUTPUT_BUFFER_SIZE)
+    finally:
+        src.close()
+    os.remove(name)
+#ends append_file
+
+# Extracts the records from each input file and yields (input filename, records, fields, secs, error message or None)
+# in input file order. With more than one worker, the files are extracted by a pool of worker processes (one file
+# per task) and each file's printed/TSV/SQLite output is appended to the shared outputs (in input file order)
+# as soon as it (and the files before it) are done. Adds the number of fields extracted by the workers to "fieldcount".
+# Needs os.fork (ie not Windows) otherwise falls back to extracting the files one at a time.
+def iextractfiles(inputfiles, numworkers):
+    global fieldcount
+    if ((numworkers > 1) and (not hasattr(os, "fork"))):
+        print "Parallel extraction is not supported on this platform ... extracting files one at a time\n"
+        numworkers = 0
+    if (numworkers <= 1):
+        for inputfile in inputfiles:
+            yield (extract_file((inputfile, None)))
+        return
+    sys.stdout.flush()
+    if (tsvoutput):
+        of.flush()
+    tmpdir = tempfile.mkdtemp(prefix="dextract")
+    tasks = [(inputfile, os.path.join(tmpdir, str(filenum))) for filenum, inputfile in enumerate(inputfiles)]
+    pool = multiprocessing.Pool(numworkers)
+    try:
+        for filenum, result in enumerate(pool.imap(extract_file, tasks, 1)): # results are in input file order
+            tmpprefix = tasks[filenum][1]
+            append_file(tmpprefix + ".log", sys.stdout)
+            if (tsvoutput):
+                append_file(tmpprefix + ".tsv", of)
+            if (db != None):
+                db.execute("ATTACH DATABASE ? AS part", (tmpprefix + ".db",))
+                db.execute("INSERT INTO records SELECT * FROM part.records")
+                db.commit()
+                db.execute("DETACH DATABASE part")
+                os.remove(tmpprefix + ".db")
+            fieldcount += result[2]
+            yield (result)
+    finally:
+        pool.close()
+        pool.join()
+        shutil.rmtree(tmpdir, True)
+#ends iextractfiles
 
 # ==============================================================================
 # Main
 print "Running " + version_string + "\n"
 
-usage = "\n" + "Usage#1: %prog -d defnfile -f inputfile\n" + "Usage#2: %prog -d defnfile -f inputfile -a 350 -z 428 -o outputfile"
+usage = "\n" + "Usage#1: %prog -d defnfile -f inputfile\n" + "Usage#2: %prog -d defnfile -f inputfile -a 350 -z 428 -o outputfile\n" + "Usage#3: %prog -d defnfile -f inputfile -o outputfile -s 4D454F57 -p 8\n" + "Usage#4: %prog -d defnfile -f \"inputdir/*.bin\" -o outputfile -p 8 -v 0"
 
 parser = OptionParser(usage=usage)
 parser.add_option("-d", dest="defn",
@@ -602,7 +1153,7 @@ parser.add_option("-d", dest="defn",
                   help="Template Definition File")
 parser.add_option("-f", dest="filename", 
                   action="store", type="string",
-                  help="Input File To Be Searched")
+                  help="Input File To Be Searched (or a directory/glob pattern of input files)")
 parser.add_option("-o", dest="tsvfile",
                   action="store", type="string",
                   help="(Optional) Tab Seperated Output Filename")
@@ -612,29 +1163,82 @@ parser.add_option("-a", dest="startoffset", default=0,
 parser.add_option("-z", dest="endoffset",
                   action="store", type="int", default=-1,
                   help="(Optional) End File Offset (decimal). Default is the end of file.")
+parser.add_option("-b", dest="bulk",
+                  action="store_true", default=False,
+                  help="(Optional) Bulk decode fixed size records (only if the template has no null terminated/deferred sized fields)")
+parser.add_option("-s", dest="signature",
+                  action="store", type="string",
+                  help="(Optional) Hex signature (eg 4D454F57). Parses a record at each hit instead of back to back records.")
+parser.add_option("-p", dest="workers",
+                  action="store", type="int", default=0,
+                  help="(Optional) Parse the signature hits (-s) or extract the input files (directory/glob -f) with this many worker processes (eg 8).")
+parser.add_option("-q", dest="dbfile",
+                  action="store", type="string",
+                  help="(Optional) SQLite output database filename. Writes one row per record (one column per template field) to the \"records\" table.")
+parser.add_option("-g", dest="checkdecoders",
+                  action="store_true", default=False,
+                  help="(Optional) Check the special date decoders against golden values, time them and exit (no other arguments needed)")
+parser.add_option("-v", dest="verbose",
+                  action="store", type="int", default=1,
+                  help="(Optional) Verbosity level. 0 = only print errors and a summary, 1 = print every extracted field. Default is 1.")
 (options, args) = parser.parse_args()
 
 # Check if no arguments given by user, exit
 if len(sys.argv) == 1:
     parser.print_help()
     exit(-1)
+if (options.checkdecoders):
+    if (check_date_decoders(100000)):
+        print "\nAll special date decoder checks passed"
+        exit(0)
+    print "\nSpecial date decoder checks FAILED"
+    exit(-1)
 if ( (options.filename == None) or (options.defn == None) ):
     parser.print_help()
     print "\nDefinition/Input filename incorrectly specified!"
     exit(-1)
 
+signature = None
+if (options.signature != None):
+    try:
+        signature = binascii.unhexlify(options.signature.replace(" ", ""))
+    except:
+        signature = ""
+    if (signature == ""):
+        print "\nSignature must be a (non-empty) hex string eg 4D454F57"
+        exit(-1)
+
 filename = options.filename
 defnfile = options.defn
 tsvoutput = options.tsvfile
 startoffset = options.startoffset
+verbose = options.verbose
+# A directory or glob pattern (eg "/cases/*.bin") extracts the records from each of its files
+multifile = (os.path.isdir(filename) or glob.has_magic(filename))
 
-fileinfo = os.stat(filename)
-print "Input file " + filename + " is %d bytes" % fileinfo.st_size + "\n"
-if (options.endoffset == -1): # default case ie end offset "z" was not specified
-    endoffset = fileinfo.st_size
+if (multifile):
+    inputfiles = input_files(filename, [defnfile, tsvoutput, options.dbfile])
+    if (len(inputfiles) == 0):
+        print ("No Input Files Found")
+        exit(-1)
+    print str(len(inputfiles)) + " input files found for " + filename + "\n"
 else:
-    endoffset = options.endoffset
-    
+    # open source data file
+    try:
+        f = open_image(filename)
+    except:
+        print ("Input File Not Found")
+        exit(-1)
+
+    fileinfo = image_stat(f)
+    filesize = fileinfo.st_size
+    print "Input file " + filename + " is %d bytes" % fileinfo.st_size + "\n"
+    if (options.endoffset == -1): # default case ie end offset "z" was not specified
+        endoffset = fileinfo.st_size
+    else:
+        endoffset = options.endoffset
+    f.seek(0)
+
 #open template definition file
 try:
     tmpf = open(defnfile, "r")
@@ -644,18 +1248,10 @@ except:
 
 tmpf.seek(0)
 
-# open source data file
-try:
-    f = open(filename, "rb")
-except:
-    print ("Input File Not Found")
-    exit(-1)
-f.seek(0)
-
 # open output file if reqd
 if (tsvoutput != None):
     try:
-        of = open(tsvoutput, "w")
+        of = open(tsvoutput, "w", OUTPUT_BUFFER_SIZE)
     except:
         print ("Trouble Opening Output File")
         exit(-1)
@@ -684,19 +1280,60 @@ if (len(field_names) == 0) :
     print "No fields specified in template definition file. Exiting"
     exit(-1)
 
-# From startoffset until endoffset, extract the record data
-curroffset = startoffset
-status = True
-f.seek(curroffset)
-while ((curroffset < endoffset) and status):
-    status = parse_record(f, curroffset)
-    curroffset = f.tell()
-    
-f.close()
+# Interpret the template types/sizes once (instead of for every field of every record)
+record_plan = compile_plan()
+
+# open SQLite output database if reqd. Any existing "records" table is replaced (same as the TSV output file)
+if (options.dbfile != None):
+    db_columns = record_columns(record_plan)
+    try:
+        db = sqlite3.connect(options.dbfile)
+        create_records_table(db)
+    except:
+        print ("Trouble Opening Output Database")
+        exctype, value = sys.exc_info()[:2]
+        print ("Exception type = ",exctype,", value = ",value)
+        exit(-1)
+    db_insert = "INSERT INTO records VALUES (" + ", ".join(["?"] * (len(db_columns) + 2)) + ")"
+
+starttime = time.time()
+if (multifile):
+    # Extract each input file (an error only stops that file) and report its throughput
+    numrecords = 0
+    failedfiles = []
+    for inputfile, filerecords, filefields, filesecs, error in iextractfiles(inputfiles, options.workers):
+        numrecords += filerecords
+        if (error != None):
+            failedfiles.append((inputfile, error))
+            print "\n" + inputfile + " FAILED after " + str(filefields) + " fields ... " + error + "\n"
+        elif (filesecs > 0):
+            print "\n" + inputfile + ": " + str(filerecords) + " records (" + str(filefields) + " fields) in %.2f secs, %.0f records/s\n" % (filesecs, filerecords / filesecs)
+        else:
+            print "\n" + inputfile + ": " + str(filerecords) + " records (" + str(filefields) + " fields) in %.2f secs\n" % filesecs
+else:
+    numrecords = extract_records(f, endoffset, options.workers)
+    f.close()
 
 if (tsvoutput):
     of.close()
 
+if (db != None):
+    flush_dbrows(1)
+    print "\nIndexing " + options.dbfile + " records by offset ..."
+    db.execute("CREATE INDEX records_offset ON records(offset)")
+    db.commit()
+    db.close()
+
+elapsed = time.time() - starttime
+if (multifile):
+    print "\nExtracted " + str(numrecords) + " records (" + str(fieldcount) + " fields) from " + str(len(inputfiles)) + " files (" + str(len(failedfiles)) + " failed) in %.2f secs" % elapsed
+    for inputfile, error in failedfiles:
+        print "FAILED " + inputfile + " ... " + error
+else:
+    print "\nExtracted " + str(numrecords) + " records (" + str(fieldcount) + " fields) in %.2f secs" % elapsed
+if (elapsed > 0):
+    print "%.0f records/s, %.0f fields/s" % (numrecords / elapsed, fieldcount / elapsed)
+
 print "\nExiting ..."
 exit(0)
 
@@ -0,0 +1,112 @@
+# Python module for reading the segments of a split raw image (eg image.001, image.002, ...) as one file.
+# Shared by the carving/search scripts in this repository (eg "dextract.py", "chunkymonkey.py", "imgcache-parse.py" and
+# the "WindowsPhone8" scripts) so they all handle split raw images the same way.
+# Author: cheeky4n6monkey@gmail.com (Adrian Leong)
+#
+# Copyright (C) 2026 Adrian Leong (cheeky4n6monkey@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You can view the GNU General Public License at <http://www.gnu.org/licenses/>
+#
+# Scripts in other directories import it with:
+#   sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "utilities"))
+#   from splitimage import open_image, image_stat, SplitImage
+#
+# History
+# v2026-10-17 Initial version (split raw image helpers moved here from each script)
+
+import os
+
+# Returns the segment filenames of a split raw image (eg image.001, image.002, ...) given its first segment.
+# Returns [filename] if filename is not the first segment of a split raw image.
+def split_segments(filename):
+    base, ext = os.path.splitext(filename)
+    if ((len(ext) < 4) or (not ext[1:].isdigit()) or (int(ext[1:]) != 1)):
+        return([filename])
+    segments = []
+    segnum = 1
+    while os.path.isfile(base + "." + str(segnum).zfill(len(ext) - 1)):
+        segments.append(base + "." + str(segnum).zfill(len(ext) - 1))
+        segnum += 1
+    return(segments)
+
+# Read only file object which treats the segments of a split raw image as one file (see "open_image").
+# Offsets are relative to the start of the first segment. Reads crossing a segment boundary are joined
+# so search hits/records which straddle two segments are still found.
+class SplitImage(object):
+    def __init__(self, filenames):
+        self.name = filenames[0] # used to re-open the image (eg by worker processes)
+        self.segments = [] # list of (start offset, size, file object) for each segment
+        self.size = 0
+        self.pos = 0
+        for segname in filenames:
+            seg = open(segname, "rb")
+            self.segments.append((self.size, os.fstat(seg.fileno()).st_size, seg))
+            self.size += self.segments[-1][1]
+
+    def seek(self, offset, whence=0):
+        if (whence == 1):
+            offset += self.pos
+        elif (whence == 2):
+            offset += self.size
+        if (offset < 0):
+            raise IOError(22, "Invalid argument")
+        self.pos = offset
+
+    def tell(self):
+        return(self.pos)
+
+    def read(self, size=-1):
+        if ((size < 0) or (self.pos + size > self.size)):
+            size = max(0, self.size - self.pos)
+        data = []
+        for start, segsize, seg in self.segments:
+            if (size <= 0):
+                break
+            if (self.pos < start + segsize):
+                seg.seek(self.pos - start)
+                raw = seg.read(min(size, start + segsize - self.pos))
+                if (len(raw) == 0):
+                    break # segment is shorter than when it was opened
+                data.append(raw)
+                self.pos += len(raw)
+                size -= len(raw)
+        return(b"".join(data))
+
+    # Returns the os.fstat of the first segment with the size of the whole image and the latest segment modified time
+    def fstat(self):
+        stats = list(os.fstat(self.segments[0][2].fileno())[:10])
+        stats[6] = self.size
+        stats[8] = max([int(os.fstat(seg.fileno()).st_mtime) for start, segsize, seg in self.segments])
+        return(os.stat_result(stats))
+
+    # There is no single file descriptor for the whole image (so it cannot be memory mapped)
+    def fileno(self):
+        raise IOError("Cannot use the file descriptor of a split raw image (" + str(len(self.segments)) + " segments)")
+
+    def close(self):
+        for start, segsize, seg in self.segments:
+            seg.close()
+
+# Opens the input file for binary reads. Given the first segment of a split raw image (eg image.001),
+# returns a "SplitImage" which reads all of its segments (image.001, image.002, ...) as one file.
+def open_image(filename):
+    segments = split_segments(filename)
+    if (len(segments) > 1):
+        return(SplitImage(segments))
+    return(open(filename, "rb"))
+
+# Returns the os.fstat of an input file opened with "open_image" (incl. the total size of a split raw image)
+def image_stat(fd):
+    if isinstance(fd, SplitImage):
+        return(fd.fstat())
+    return(os.fstat(fd.fileno()))